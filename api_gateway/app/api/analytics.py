@@ -1,4 +1,8 @@
+from typing import Literal
+
 from fastapi import APIRouter, Query
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 
 from ..deps import AnalyticsServiceDep
 from ..schemas import AnalyticsRequest, AnalyticsResult
@@ -17,6 +21,13 @@ async def analytics_request(
     from_ts: str | None = Query(None, description="Начало периода (ISO)"),
     to_ts: str | None = Query(None, description="Конец периода (ISO)"),
     limit: int = Query(100, ge=1, le=1000, description="Лимит строк"),
-) -> AnalyticsResult:
+    stream: Literal["json", "ndjson"] | None = Query(
+        None, description="Потоковая ретрансляция без кеша: json — тело как есть, ndjson — по строке на row"
+    ),
+) -> AnalyticsResult | StreamingResponse:
     payload = AnalyticsRequest(metric=metric, from_ts=from_ts, to_ts=to_ts, limit=limit)
+    if stream is not None:
+        body, media_type, close = await service.stream_analytics(payload, ndjson=stream == "ndjson")
+        # Ответ upstream закрывает сам StreamingResponse, а не финализация генератора тела.
+        return StreamingResponse(body, media_type=media_type, background=BackgroundTask(close))
     return await service.request_analytics(payload)
@@ -1,12 +1,44 @@
-from fastapi import APIRouter, HTTPException
+from datetime import datetime
+from typing import Any
 
+from fastapi import APIRouter, Body, Header, HTTPException, Query, Response
+from pydantic import ValidationError
+
+from ..cache import CachedBody
+from ..config import settings
 from ..deps import OrderServiceDep, PaymentServiceDep
-from ..errors import OrderNotFound
-from ..schemas import OrderCreate, OrderOut, PaymentOut, PaymentRequest
+from ..errors import OrderNotFound, PaymentNotFound
+from ..schemas import (
+    OrderBatchItemOut,
+    OrderBatchOut,
+    OrderCreate,
+    OrderDetail,
+    OrderOut,
+    OrderPage,
+    PaymentDetail,
+    PaymentOut,
+    PaymentRequest,
+)
 
 router = APIRouter(tags=["orders"])
 
 
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Для If-None-Match сравнение слабое: W/"x" совпадает с "x".
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def _conditional_response(view: CachedBody, if_none_match: str | None) -> Response:
+    headers = {"ETag": view.etag, "Cache-Control": "no-cache"}
+    if _etag_matches(if_none_match, view.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=view.body, media_type="application/json", headers=headers)
+
+
 @router.post("/orders", response_model=OrderOut, summary="Создать заказ")
 async def create_order(
     payload: OrderCreate,
@@ -16,6 +48,58 @@ async def create_order(
     return OrderOut(id=order.id, status=order.status)
 
 
+@router.get("/orders", response_model=OrderPage, summary="Список заказов (keyset-пагинация)")
+async def list_orders(
+    service: OrderServiceDep,
+    status: str | None = Query(None, description="Фильтр по статусу"),
+    since: datetime | None = Query(None, description="Заказы, созданные не раньше (ISO)"),
+    after_id: int | None = Query(None, description="next_after_id предыдущей страницы"),
+    limit: int = Query(50, ge=1, le=500, description="Размер страницы"),
+) -> OrderPage:
+    try:
+        return await service.list_orders(status=status, since=since, after_id=after_id, limit=limit)
+    except OrderNotFound as exc:
+        raise HTTPException(status_code=404, detail=f"Курсор after_id не найден: {exc}")
+
+
+@router.post("/orders:batch", response_model=OrderBatchOut, summary="Создать заказы пачкой")
+async def create_orders_batch(
+    service: OrderServiceDep,
+    # list[Any], а не list[dict]: позиция-не-объект тоже получает свою ошибку, а не 422 на весь батч.
+    payload: list[Any] = Body(..., description="Список OrderCreate"),
+) -> OrderBatchOut:
+    if len(payload) > settings.orders_batch_max_size:
+        raise HTTPException(
+            status_code=413,
+            detail=f"В батче не больше {settings.orders_batch_max_size} заказов",
+        )
+
+    # Каждую позицию валидируем отдельно, чтобы одна ошибка не отклоняла весь батч.
+    items: list[OrderBatchItemOut] = []
+    valid: list[tuple[OrderBatchItemOut, OrderCreate]] = []
+    for index, raw in enumerate(payload):
+        try:
+            order = OrderCreate.model_validate(raw)
+        except ValidationError as exc:
+            items.append(
+                OrderBatchItemOut(
+                    index=index,
+                    status="invalid",
+                    errors=exc.errors(include_url=False, include_context=False),
+                )
+            )
+            continue
+        item = OrderBatchItemOut(index=index, status="created")
+        items.append(item)
+        valid.append((item, order))
+
+    orders = await service.create_orders([order for _, order in valid])
+    for (item, _), order in zip(valid, orders):
+        item.id = order.id
+
+    return OrderBatchOut(created=len(valid), failed=len(items) - len(valid), items=items)
+
+
 @router.post(
     "/orders/{order_id}/pay",
     response_model=PaymentOut,
@@ -31,3 +115,37 @@ async def pay_order(
     except OrderNotFound as exc:
         raise HTTPException(status_code=404, detail=str(exc))
     return PaymentOut(id=payment.id, status=payment.status)
+
+
+@router.get(
+    "/orders/{order_id}",
+    response_model=OrderDetail,
+    summary="Получить заказ (ETag, If-None-Match → 304)",
+)
+async def get_order(
+    order_id: int,
+    service: OrderServiceDep,
+    if_none_match: str | None = Header(None),
+) -> Response:
+    try:
+        view = await service.get_order(order_id)
+    except OrderNotFound as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
+    return _conditional_response(view, if_none_match)
+
+
+@router.get(
+    "/payments/{payment_id}",
+    response_model=PaymentDetail,
+    summary="Получить платеж (ETag, If-None-Match → 304)",
+)
+async def get_payment(
+    payment_id: int,
+    service: PaymentServiceDep,
+    if_none_match: str | None = Header(None),
+) -> Response:
+    try:
+        view = await service.get_payment(payment_id)
+    except PaymentNotFound as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
+    return _conditional_response(view, if_none_match)
@@ -0,0 +1,99 @@
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Generic, Hashable, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+@dataclass
+class CacheEntry(Generic[V]):
+    value: V
+    expires_at: float
+
+
+class TTLCache(Generic[K, V]):
+    """In-process LRU, ограниченный по размеру, со сроком жизни у каждой записи."""
+
+    def __init__(self, max_size: int, clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.clock = clock
+        self._entries: OrderedDict[K, CacheEntry[V]] = OrderedDict()
+
+    def get_entry(self, key: K) -> CacheEntry[V] | None:
+        """Запись вместе со сроком жизни, даже если он уже истек."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def get(self, key: K) -> V | None:
+        entry = self.get_entry(key)
+        if entry is None or entry.expires_at <= self.clock():
+            return None
+        return entry.value
+
+    def set(self, key: K, value: V, ttl: float) -> None:
+        self._entries[key] = CacheEntry(value=value, expires_at=self.clock() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: K) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+@dataclass(frozen=True)
+class CachedBody:
+    body: bytes
+    etag: str
+
+    @classmethod
+    def of(cls, body: bytes) -> "CachedBody":
+        return cls(body=body, etag=f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"')
+
+
+class EntityCache:
+    """Готовые JSON-ответы GET-ручек по (тип, id) вместе с ETag.
+
+    Записи сбрасываются на путях записи. Кеш живет в процессе, поэтому изменения,
+    сделанные другими репликами, видны не позже чем через ttl.
+    """
+
+    def __init__(self, max_size: int = 10_000, ttl: float = 5.0, clock: Callable[[], float] = time.monotonic):
+        self._entries: TTLCache[tuple[str, int], CachedBody] = TTLCache(max_size, clock)
+        self.ttl = ttl
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, kind: str, entity_id: int) -> CachedBody | None:
+        cached = self._entries.get((kind, entity_id))
+        if cached is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return cached
+
+    def generation(self) -> int:
+        """Метка, которую берут перед чтением из БД и передают в put."""
+        return self._generation
+
+    def put(self, kind: str, entity_id: int, body: bytes, generation: int) -> CachedBody:
+        cached = CachedBody.of(body)
+        # Если за время чтения что-то инвалидировали, прочитанное могло устареть — не кешируем.
+        if generation == self._generation:
+            self._entries.set((kind, entity_id), cached, self.ttl)
+        return cached
+
+    def invalidate(self, kind: str, entity_id: int) -> None:
+        self._generation += 1
+        self._entries.invalidate((kind, entity_id))
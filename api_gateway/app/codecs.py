@@ -0,0 +1,98 @@
+"""Кодеки тела Kafka-сообщений шлюза.
+
+Копия orders_service/infrastructure/codecs.py (там же MessageDecoder): сервисы собираются
+в отдельные образы только из своего каталога, поэтому общего пакета у них нет и быть не должно —
+иначе выкатка одного тянула бы другой. Форматы на проводе меняются в обеих копиях разом;
+совместимость закреплена тестом orders_service/tests/test_codecs.py.
+"""
+import json
+import logging
+from importlib.util import find_spec
+from typing import Any, Protocol
+
+log = logging.getLogger("api_gateway.codecs")
+
+# Заголовок Kafka-сообщения с форматом тела. Потребители считают сообщения без него JSON:
+# так пишут версии до появления кодеков.
+CONTENT_TYPE_HEADER = "content-type"
+JSON_CONTENT_TYPE = "application/json"
+MSGPACK_CONTENT_TYPE = "application/msgpack"
+
+
+class Codec(Protocol):
+    name: str
+    content_type: str
+
+    def encode(self, value: Any) -> bytes:
+        ...
+
+    def decode(self, data: bytes) -> Any:
+        ...
+
+
+class JsonCodec:
+    name = "json"
+    content_type = JSON_CONTENT_TYPE
+
+    def encode(self, value: Any) -> bytes:
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def decode(self, data: bytes) -> Any:
+        return json.loads(data)
+
+
+class OrjsonCodec:
+    """Тот же JSON на проводе, поэтому совместим с JsonCodec в обе стороны."""
+
+    name = "orjson"
+    content_type = JSON_CONTENT_TYPE
+
+    def __init__(self):
+        import orjson
+
+        self._orjson = orjson
+
+    def encode(self, value: Any) -> bytes:
+        return self._orjson.dumps(value)
+
+    def decode(self, data: bytes) -> Any:
+        return self._orjson.loads(data)
+
+
+class MsgpackCodec:
+    """Компактнее JSON, но читается только версиями с кодеками: включайте после обновления потребителей."""
+
+    name = "msgpack"
+    content_type = MSGPACK_CONTENT_TYPE
+
+    def __init__(self):
+        import msgpack
+
+        self._msgpack = msgpack
+
+    def encode(self, value: Any) -> bytes:
+        return self._msgpack.packb(value, use_bin_type=True)
+
+    def decode(self, data: bytes) -> Any:
+        return self._msgpack.unpackb(data, raw=False)
+
+
+_CODECS = {"json": (JsonCodec, None), "orjson": (OrjsonCodec, "orjson"), "msgpack": (MsgpackCodec, "msgpack")}
+
+
+def available_codecs() -> list[str]:
+    return [name for name, (_, module) in _CODECS.items() if module is None or find_spec(module) is not None]
+
+
+def get_codec(name: str) -> Codec:
+    """Кодек по имени; если его пакет не установлен, откатываемся на stdlib JSON."""
+    if name not in _CODECS:
+        raise ValueError(f"Неизвестный кодек: {name}")
+    if name not in available_codecs():
+        log.warning("Кодек %s недоступен (не установлен пакет), используется json", name)
+        return JsonCodec()
+    return _CODECS[name][0]()
+
+
+def content_type_headers(codec: Codec) -> list[tuple[str, bytes]]:
+    return [(CONTENT_TYPE_HEADER, codec.content_type.encode("latin-1"))]
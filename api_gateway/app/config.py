@@ -13,11 +13,70 @@ class Settings(BaseModel):
     kafka_topic_payments: str = env.str("KAFKA_TOPIC_PAYMENTS", "payments")
     kafka_topic_logs: str = env.str("KAFKA_TOPIC_LOGS", "logs")
     kafka_topic_analytics: str = env.str("KAFKA_TOPIC_ANALYTICS", "analytics-requests")
+    # sync — каждое событие ждет брокера; pipelined — ждем только бизнес-события.
+    kafka_publish_mode: str = env.str("KAFKA_PUBLISH_MODE", "sync")
+    kafka_linger_ms: int = env.int("KAFKA_LINGER_MS", 0)
+    kafka_max_batch_size: int = env.int("KAFKA_MAX_BATCH_SIZE", 16384)
+    kafka_max_in_flight: int = env.int("KAFKA_MAX_IN_FLIGHT", 1000)
+    # Кодек тела сообщений: json, orjson (тот же JSON, быстрее) или msgpack.
+    kafka_codec: str = env.str("KAFKA_CODEC", "json")
+    # Лог-события копятся в буфере и уходят в топик логов пачками (LogBatch) из фона.
+    # Это другой формат сообщений в топике логов: включайте после обновления его потребителей.
+    log_channel_enabled: bool = env.bool("LOG_CHANNEL_ENABLED", False)
+    log_channel_capacity: int = env.int("LOG_CHANNEL_CAPACITY", 10000)
+    log_channel_batch_size: int = env.int("LOG_CHANNEL_BATCH_SIZE", 500)
+    log_channel_flush_interval: float = env.float("LOG_CHANNEL_FLUSH_INTERVAL", 1.0)
+    # Доля сохраняемых лог-событий по типу ("AnalyticsHttpRequested=0.1"); по умолчанию 1.
+    log_sample_rates: dict[str, float] = env.dict("LOG_SAMPLE_RATES", {}, subcast_values=float)
+    # Transactional outbox: события пишутся в БД вместе с заказом и уходят в Kafka фоном.
+    outbox_enabled: bool = env.bool("OUTBOX_ENABLED", False)
+    outbox_batch_size: int = env.int("OUTBOX_BATCH_SIZE", 100)
+    outbox_poll_interval: float = env.float("OUTBOX_POLL_INTERVAL", 0.2)
+    # Через сколько секунд захват пачки зависшим relay перехватывают другие реплики.
+    outbox_claim_timeout: float = env.float("OUTBOX_CLAIM_TIMEOUT", 30.0)
+    # Кеш GET /orders/{id} и /payments/{id}; TTL ограничивает устаревание между репликами.
+    read_cache_enabled: bool = env.bool("READ_CACHE_ENABLED", True)
+    read_cache_size: int = env.int("READ_CACHE_SIZE", 10000)
+    read_cache_ttl: float = env.float("READ_CACHE_TTL", 5.0)
+    # Idempotency-Key для POST /orders и /orders/{id}/pay: сколько хранить ответ и сколько держать в памяти.
+    # Одновременные повторы склеиваются только внутри процесса; между воркерами защищает лишь сохраненный ответ.
+    idempotency_enabled: bool = env.bool("IDEMPOTENCY_ENABLED", True)
+    idempotency_ttl: float = env.float("IDEMPOTENCY_TTL", 24 * 3600)
+    idempotency_cache_size: int = env.int("IDEMPOTENCY_CACHE_SIZE", 10000)
+    # /metrics в формате Prometheus: латентность маршрутов, время SQL, Kafka, analytics-service.
+    metrics_enabled: bool = env.bool("METRICS_ENABLED", True)
+    # Заголовок Server-Timing с разбивкой запроса по фазам; выключен — фазы не собираются.
+    server_timing_enabled: bool = env.bool("SERVER_TIMING_ENABLED", False)
+    # Запросы дольше порога пишутся в лог с разбивкой; 0 — не писать.
+    server_timing_log_threshold_ms: float = env.float("SERVER_TIMING_LOG_THRESHOLD_MS", 0.0)
+    # Максимум заказов в одном POST /orders:batch.
+    orders_batch_max_size: int = env.int("ORDERS_BATCH_MAX_SIZE", 500)
     order_service_name: str = env.str("ORDER_SERVICE_NAME", "order-service")
     payment_service_name: str = env.str("PAYMENT_SERVICE_NAME", "payment-service")
     analytics_service_name: str = env.str("ANALYTICS_SERVICE_NAME", "analytics-service")
     analytics_service_url: str = env.str("ANALYTICS_SERVICE_URL", "http://analytics-service:8000")
+    analytics_timeout: float = env.float("ANALYTICS_TIMEOUT", 5.0)
+    analytics_connect_timeout: float = env.float("ANALYTICS_CONNECT_TIMEOUT", 2.0)
+    analytics_max_connections: int = env.int("ANALYTICS_MAX_CONNECTIONS", 100)
+    analytics_max_keepalive_connections: int = env.int("ANALYTICS_MAX_KEEPALIVE_CONNECTIONS", 20)
+    analytics_keepalive_expiry: float = env.float("ANALYTICS_KEEPALIVE_EXPIRY", 30.0)
+    # HTTP/2 включается, только если установлен пакет h2 (httpx[http2]).
+    analytics_http2: bool = env.bool("ANALYTICS_HTTP2", True)
+    # Кеш ответов аналитики: TTL по умолчанию и по метрикам ("sales=10,traffic=60").
+    analytics_cache_enabled: bool = env.bool("ANALYTICS_CACHE_ENABLED", True)
+    analytics_cache_size: int = env.int("ANALYTICS_CACHE_SIZE", 1024)
+    analytics_cache_ttl: float = env.float("ANALYTICS_CACHE_TTL", 30.0)
+    analytics_cache_ttls: dict[str, float] = env.dict("ANALYTICS_CACHE_TTLS", {}, subcast_values=float)
+    # Сколько после истечения TTL отдаем устаревший ответ, обновляя его в фоне.
+    analytics_cache_stale_ttl: float = env.float("ANALYTICS_CACHE_STALE_TTL", 60.0)
     database_url: str = env.str("DATABASE_URL", "sqlite+aiosqlite:///./data/gateway.db")
+    # Профиль SQLite: default — настройки драйвера; production — WAL, synchronous=NORMAL, mmap и т.д.
+    sqlite_profile: str = env.str("SQLITE_PROFILE", "default")
+    sqlite_mmap_size: int = env.int("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)
+    sqlite_cache_size_kb: int = env.int("SQLITE_CACHE_SIZE_KB", 64 * 1024)
+    sqlite_busy_timeout_ms: int = env.int("SQLITE_BUSY_TIMEOUT_MS", 5000)
+    db_pool_size: int = env.int("DB_POOL_SIZE", 5)
+    db_max_overflow: int = env.int("DB_MAX_OVERFLOW", 10)
 
 
 settings = Settings()
@@ -1,12 +1,17 @@
 from typing import Annotated, AsyncGenerator
 
+import httpx
 from fastapi import Depends, Request
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
+from .cache import EntityCache
+from .config import settings
 from .kafka_client import KafkaPublisher
+from .metrics import GatewayMetrics
 from .repositories.orders import OrderRepository
+from .repositories.outbox import OutboxRepository
 from .repositories.payments import PaymentRepository
-from .services.analytics import AnalyticsService
+from .services.analytics import AnalyticsCache, AnalyticsService
 from .services.orders import OrderService, PaymentService
 
 
@@ -22,27 +27,65 @@ def get_kafka_publisher(request: Request) -> KafkaPublisher:
     return request.app.state.kafka_publisher
 
 
+def get_analytics_client(request: Request) -> httpx.AsyncClient:
+    """Общий пул HTTP-соединений к analytics-service, созданный в lifespan."""
+    return request.app.state.analytics_client
+
+
+def get_analytics_cache(request: Request) -> AnalyticsCache | None:
+    return request.app.state.analytics_cache
+
+
+def get_read_cache(request: Request) -> EntityCache | None:
+    return request.app.state.read_cache
+
+
+def get_metrics(request: Request) -> GatewayMetrics | None:
+    return getattr(request.app.state, "metrics", None)
+
+
 # Типовые алиасы для Annotated-deps
 SessionDep = Annotated[AsyncSession, Depends(get_session)]
 KafkaPublisherDep = Annotated[KafkaPublisher, Depends(get_kafka_publisher)]
+AnalyticsClientDep = Annotated[httpx.AsyncClient, Depends(get_analytics_client)]
+AnalyticsCacheDep = Annotated[AnalyticsCache | None, Depends(get_analytics_cache)]
+ReadCacheDep = Annotated[EntityCache | None, Depends(get_read_cache)]
+MetricsDep = Annotated[GatewayMetrics | None, Depends(get_metrics)]
+
+
+def _outbox(session: AsyncSession) -> OutboxRepository | None:
+    return OutboxRepository(session) if settings.outbox_enabled else None
 
 
 def get_order_service(
     session: SessionDep,
     publisher: KafkaPublisherDep,
+    cache: ReadCacheDep,
 ) -> OrderService:
-    return OrderService(orders_repo=OrderRepository(session), publisher=publisher)
+    return OrderService(
+        orders_repo=OrderRepository(session, outbox=_outbox(session), cache=cache),
+        publisher=publisher,
+    )
 
 
 def get_payment_service(
     session: SessionDep,
     publisher: KafkaPublisherDep,
+    cache: ReadCacheDep,
 ) -> PaymentService:
-    return PaymentService(payments_repo=PaymentRepository(session), publisher=publisher)
+    return PaymentService(
+        payments_repo=PaymentRepository(session, outbox=_outbox(session), cache=cache),
+        publisher=publisher,
+    )
 
 
-def get_analytics_service(publisher: KafkaPublisherDep) -> AnalyticsService:
-    return AnalyticsService(publisher=publisher)
+def get_analytics_service(
+    publisher: KafkaPublisherDep,
+    client: AnalyticsClientDep,
+    cache: AnalyticsCacheDep,
+    metrics: MetricsDep,
+) -> AnalyticsService:
+    return AnalyticsService(publisher=publisher, client=client, cache=cache, metrics=metrics)
 
 
 OrderServiceDep = Annotated[OrderService, Depends(get_order_service)]
@@ -0,0 +1,48 @@
+from dataclasses import dataclass
+from typing import Optional
+
+from .config import settings
+from .models import Order, Payment
+
+
+@dataclass
+class OutgoingEvent:
+    """Бизнес-событие, готовое к публикации в Kafka (напрямую или через outbox)."""
+
+    topic: str
+    event_type: str
+    payload: dict
+    key: Optional[str] = None
+    source: Optional[str] = None
+
+
+def order_created(order: Order) -> OutgoingEvent:
+    return OutgoingEvent(
+        topic=settings.kafka_topic_orders,
+        event_type="OrderCreated",
+        payload={
+            "order_id": order.id,
+            "item": order.item,
+            "amount": order.amount,
+            "currency": order.currency,
+            "service": settings.order_service_name,
+        },
+        key=str(order.id),
+        source=settings.order_service_name,
+    )
+
+
+def payment_requested(payment: Payment) -> OutgoingEvent:
+    return OutgoingEvent(
+        topic=settings.kafka_topic_payments,
+        event_type="PaymentRequested",
+        payload={
+            "payment_id": payment.id,
+            "order_id": payment.order_id,
+            "amount": payment.amount,
+            "method": payment.method,
+            "service": settings.payment_service_name,
+        },
+        key=str(payment.order_id),
+        source=settings.payment_service_name,
+    )
@@ -0,0 +1,197 @@
+import asyncio
+import hashlib
+import logging
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta, UTC
+
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from .cache import TTLCache
+from .models import IdempotencyKey
+
+log = logging.getLogger("api_gateway.idempotency")
+
+IDEMPOTENT_PATHS = re.compile(r"^/orders(:batch|/\d+/pay)?$")
+MAX_KEY_LENGTH = 255
+
+
+@dataclass(frozen=True)
+class StoredResponse:
+    fingerprint: str
+    status_code: int
+    body: bytes
+
+
+class IdempotencyStore:
+    """Ответы по Idempotency-Key: таблица в БД, перед ней LRU в памяти процесса.
+
+    Ключ живет ttl секунд. Просроченные строки игнорируются при чтении и время от
+    времени удаляются пачкой (раз в purge_every сохранений).
+    """
+
+    def __init__(
+        self,
+        session_maker: async_sessionmaker[AsyncSession],
+        ttl: float = 24 * 3600,
+        cache_size: int = 10_000,
+        purge_every: int = 1000,
+    ):
+        self._session_maker = session_maker
+        self._ttl = ttl
+        self._cache: TTLCache[str, StoredResponse] = TTLCache(cache_size)
+        self._purge_every = purge_every
+        self._saved = 0
+        # Запросы, которые сейчас выполняются: повторы с тем же ключом ждут их завершения.
+        self.inflight: dict[str, asyncio.Future] = {}
+
+    def _cutoff(self) -> datetime:
+        return datetime.now(UTC) - timedelta(seconds=self._ttl)
+
+    async def get(self, key: str) -> StoredResponse | None:
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+        async with self._session_maker() as session:
+            row = await session.get(IdempotencyKey, key)
+        if row is None:
+            return None
+        remaining = (row.created_at.replace(tzinfo=UTC) - self._cutoff()).total_seconds()
+        if remaining <= 0:
+            return None
+        stored = StoredResponse(fingerprint=row.fingerprint, status_code=row.status_code, body=row.body)
+        self._cache.set(key, stored, remaining)
+        return stored
+
+    async def save(self, key: str, stored: StoredResponse) -> None:
+        values = {
+            "fingerprint": stored.fingerprint,
+            "status_code": stored.status_code,
+            "body": stored.body,
+            "created_at": datetime.now(UTC),
+        }
+        async with self._session_maker() as session:
+            try:
+                session.add(IdempotencyKey(key=key, **values))
+                await session.commit()
+            except IntegrityError:
+                # Ключ уже есть: перезаписываем только просроченный, свежий оставляем первому писателю.
+                await session.rollback()
+                await session.execute(
+                    update(IdempotencyKey)
+                    .where(IdempotencyKey.key == key, IdempotencyKey.created_at < self._cutoff())
+                    .values(**values)
+                )
+                await session.commit()
+        self._cache.set(key, stored, self._ttl)
+
+        self._saved += 1
+        if self._saved % self._purge_every == 0:
+            await self.purge_expired()
+
+    async def purge_expired(self) -> int:
+        async with self._session_maker() as session:
+            result = await session.execute(delete(IdempotencyKey).where(IdempotencyKey.created_at < self._cutoff()))
+            await session.commit()
+        return result.rowcount
+
+
+class IdempotencyMiddleware:
+    """ASGI-middleware для POST /orders, /orders:batch и /orders/{id}/pay с заголовком Idempotency-Key.
+
+    Повтор с тем же ключом и телом получает сохраненный ответ без вызова сервисов,
+    с другим телом — 422. Одновременные запросы с одним ключом выполняются один раз, но только
+    в пределах процесса: повторы, попавшие на разные воркеры или реплики, выполнятся оба.
+    Сохраняются только успешные (2xx) ответы, ошибки можно повторить. Ответ к этому моменту
+    уже отправлен, поэтому сбой сохранения только логируется.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or scope["method"] != "POST" or not IDEMPOTENT_PATHS.match(scope["path"]):
+            return await self.app(scope, receive, send)
+        store: IdempotencyStore | None = getattr(scope["app"].state, "idempotency_store", None)
+        key = dict(scope["headers"]).get(b"idempotency-key")
+        if store is None or key is None:
+            return await self.app(scope, receive, send)
+
+        key = key.decode("latin-1")
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return await _send_json(send, 400, '{"detail":"Некорректный Idempotency-Key"}'.encode())
+
+        body = await _read_body(receive)
+        fingerprint = hashlib.blake2b(scope["path"].encode() + b"\n" + body, digest_size=16).hexdigest()
+
+        while True:
+            stored = await store.get(key)
+            if stored is not None:
+                return await _replay(stored, fingerprint, send)
+            inflight = store.inflight.get(key)
+            if inflight is None:
+                break
+            await inflight
+
+        done = asyncio.get_running_loop().create_future()
+        store.inflight[key] = done
+        try:
+            status, response_body = await self._run(scope, body, receive, send)
+            if 200 <= status < 300:
+                try:
+                    await store.save(key, StoredResponse(fingerprint, status, response_body))
+                except Exception:
+                    log.exception("Не удалось сохранить ответ для Idempotency-Key %s", key)
+        finally:
+            store.inflight.pop(key, None)
+            done.set_result(None)
+
+    async def _run(self, scope, body: bytes, receive, send) -> tuple[int, bytes]:
+        status = 500
+        chunks: list[bytes] = []
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        async def capture_send(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        await self.app(scope, replay_receive, capture_send)
+        return status, b"".join(chunks)
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            return b"".join(chunks)
+
+
+async def _replay(stored: StoredResponse, fingerprint: str, send) -> None:
+    if stored.fingerprint != fingerprint:
+        return await _send_json(send, 422, '{"detail":"Idempotency-Key уже использован с другим запросом"}'.encode())
+    await _send_json(send, stored.status_code, stored.body, extra_headers=[(b"idempotent-replayed", b"true")])
+
+
+async def _send_json(send, status: int, body: bytes, extra_headers: list[tuple[bytes, bytes]] | None = None) -> None:
+    headers = [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+        *(extra_headers or []),
+    ]
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
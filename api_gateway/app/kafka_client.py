@@ -1,28 +1,96 @@
-import json
-from typing import Optional
+import asyncio
+import logging
+import time
+from functools import partial
+from typing import Optional, Sequence
 from uuid import uuid4
 
 from aiokafka import AIOKafkaProducer
 
+from .codecs import Codec, JsonCodec, content_type_headers, get_codec
 from .config import settings
+from .events import OutgoingEvent
+from .log_channel import LogChannel
+from .metrics import GatewayMetrics
+from .timing import phase
 
+log = logging.getLogger("api_gateway.kafka")
 
-def _json_payload(event_type: str, payload: dict, source: str) -> bytes:
-    return json.dumps(
-        {
-            "event_type": event_type,
-            "source": source,
-            "payload": payload,
-        },
-        ensure_ascii=True,
-    ).encode("utf-8")
+
+def _envelope(event_type: str, payload: dict, source: str) -> dict:
+    return {
+        "event_type": event_type,
+        "source": source,
+        "payload": payload,
+    }
 
 
 class KafkaPublisher:
-    """Обертка вокруг AIOKafkaProducer без глобальных синглтонов."""
+    """Обертка вокруг AIOKafkaProducer без глобальных синглтонов.
+
+    В режиме pipelined отправка только ставит сообщение в очередь продюсера:
+    бизнес-события дожидаются подтверждения брокера, лог-события — нет.
+    Тело кодируется codec, его формат уходит в заголовке content-type.
+    """
 
-    def __init__(self, producer: AIOKafkaProducer):
+    def __init__(
+        self,
+        producer: AIOKafkaProducer,
+        pipelined: bool = False,
+        max_in_flight: int = 1000,
+        codec: Codec | None = None,
+    ):
         self._producer = producer
+        self._pipelined = pipelined
+        self._codec = codec or JsonCodec()
+        self._headers = content_type_headers(self._codec)
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._pending: set[asyncio.Future] = set()
+        self.dropped_logs = 0
+        # Если задан, лог-события буферизуются и уходят в Kafka пачками из фона.
+        self.log_channel: LogChannel | None = None
+        self.metrics: GatewayMetrics | None = None
+
+    async def send_event(
+        self,
+        topic: str,
+        event_type: str,
+        payload: dict,
+        key: Optional[str] = None,
+        source: Optional[str] = None,
+        correlation_id: Optional[str] = None,
+    ) -> tuple[str, asyncio.Future]:
+        """Ставим сообщение в очередь продюсера и сразу возвращаем future доставки."""
+        correlation_id = correlation_id or str(uuid4())
+        message_payload = {**payload, "correlation_id": correlation_id}
+        await self._in_flight.acquire()
+        started = time.perf_counter()
+        try:
+            delivery = await self._producer.send(
+                topic,
+                self._codec.encode(_envelope(event_type, message_payload, source or settings.app_name)),
+                key=key.encode("utf-8") if key else None,
+                headers=self._headers,
+            )
+        except BaseException:
+            self._in_flight.release()
+            self._observe(topic, started, failed=True)
+            raise
+        self._pending.add(delivery)
+        delivery.add_done_callback(partial(self._on_delivered, topic, started))
+        return correlation_id, delivery
+
+    def _on_delivered(self, topic: str, started: float, delivery: asyncio.Future) -> None:
+        self._pending.discard(delivery)
+        self._in_flight.release()
+        failed = delivery.cancelled() or delivery.exception() is not None
+        self._observe(topic, started, failed=failed)
+        if not delivery.cancelled() and delivery.exception() is not None:
+            log.warning("Сообщение не доставлено в Kafka: %s", delivery.exception())
+
+    def _observe(self, topic: str, started: float, failed: bool = False) -> None:
+        if self.metrics is not None:
+            self.metrics.observe_kafka(topic, time.perf_counter() - started, failed=failed)
 
     async def publish_event(
         self,
@@ -31,25 +99,128 @@ class KafkaPublisher:
         payload: dict,
         key: Optional[str] = None,
         source: Optional[str] = None,
+        correlation_id: Optional[str] = None,
+    ) -> str:
+        with phase("kafka"):
+            return await self._publish_event(topic, event_type, payload, key, source, correlation_id)
+
+    async def _publish_event(
+        self,
+        topic: str,
+        event_type: str,
+        payload: dict,
+        key: Optional[str],
+        source: Optional[str],
+        correlation_id: Optional[str],
     ) -> str:
-        correlation_id = str(uuid4())
+        if self._pipelined:
+            correlation_id, delivery = await self.send_event(
+                topic, event_type, payload, key=key, source=source, correlation_id=correlation_id
+            )
+            await delivery
+            return correlation_id
+
+        correlation_id = correlation_id or str(uuid4())
         message_payload = {**payload, "correlation_id": correlation_id}
-        await self._producer.send_and_wait(
-            topic,
-            _json_payload(event_type, message_payload, source or settings.app_name),
-            key=key.encode("utf-8") if key else None,
-        )
+        started = time.perf_counter()
+        try:
+            await self._producer.send_and_wait(
+                topic,
+                self._codec.encode(_envelope(event_type, message_payload, source or settings.app_name)),
+                key=key.encode("utf-8") if key else None,
+                headers=self._headers,
+            )
+        except BaseException:
+            self._observe(topic, started, failed=True)
+            raise
+        self._observe(topic, started)
         return correlation_id
 
+    async def publish_batch(
+        self,
+        events: Sequence[OutgoingEvent],
+        correlation_ids: Sequence[Optional[str]] | None = None,
+    ) -> list[str]:
+        """Ставим все события в очередь продюсера и ждем подтверждения разом, в любом режиме.
+
+        Продюсер сам группирует их в батчи по партициям; ошибка доставки любого события
+        пробрасывается после того, как дождались остальных.
+        """
+        with phase("kafka"):
+            return await self._publish_batch(events, correlation_ids or [None] * len(events))
+
+    async def _publish_batch(
+        self,
+        events: Sequence[OutgoingEvent],
+        correlation_ids: Sequence[Optional[str]],
+    ) -> list[str]:
+        sent = [
+            await self.send_event(
+                event.topic,
+                event.event_type,
+                event.payload,
+                key=event.key,
+                source=event.source,
+                correlation_id=correlation_id,
+            )
+            for event, correlation_id in zip(events, correlation_ids)
+        ]
+        results = await asyncio.gather(*(delivery for _, delivery in sent), return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return [correlation_id for correlation_id, _ in sent]
+
     async def log_event(self, event_type: str, payload: dict) -> str:
-        return await self.publish_event(
-            settings.kafka_topic_logs,
-            event_type=event_type,
-            payload=payload,
-            source=settings.app_name,
-        )
+        with phase("log"):
+            return await self._log_event(event_type, payload)
+
+    async def _log_event(self, event_type: str, payload: dict) -> str:
+        if self.log_channel is not None:
+            self.log_channel.emit(event_type, payload)
+            return ""
+
+        if not self._pipelined:
+            # Мимо publish_event, чтобы время не попало в фазу kafka второй раз.
+            return await self._publish_event(
+                settings.kafka_topic_logs, event_type, payload, None, settings.app_name, None
+            )
+
+        # Лог-событие не должно задерживать ответ: при заполненном окне отбрасываем его.
+        if self._in_flight.locked():
+            self.dropped_logs += 1
+            return ""
+        try:
+            correlation_id, _ = await self.send_event(
+                settings.kafka_topic_logs,
+                event_type=event_type,
+                payload=payload,
+                source=settings.app_name,
+            )
+        except Exception as exc:
+            self.dropped_logs += 1
+            log.warning("Не удалось поставить лог-событие %s в очередь: %s", event_type, exc)
+            return ""
+        return correlation_id
+
+    async def publish_log_batch(self, batch: dict) -> None:
+        await self.publish_event(settings.kafka_topic_logs, "LogBatch", batch, source=settings.app_name)
+
+    def stats(self) -> dict[str, int]:
+        stats = {"kafka_pending": len(self._pending), "kafka_dropped_logs": self.dropped_logs}
+        if self.log_channel is not None:
+            stats.update({f"log_channel_{name}": value for name, value in self.log_channel.stats().items()})
+        return stats
+
+    async def flush(self) -> None:
+        """Дожидаемся доставки всех сообщений, отправленных в режиме pipelined."""
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
 
     async def close(self) -> None:
+        if self.log_channel is not None:
+            await self.log_channel.stop()
+        await self.flush()
         await self._producer.stop()
 
 
@@ -57,6 +228,23 @@ async def create_kafka_publisher() -> KafkaPublisher:
     producer = AIOKafkaProducer(
         bootstrap_servers=settings.kafka_bootstrap_servers,
         client_id=settings.app_name,
+        linger_ms=settings.kafka_linger_ms,
+        max_batch_size=settings.kafka_max_batch_size,
     )
     await producer.start()
-    return KafkaPublisher(producer)
+    publisher = KafkaPublisher(
+        producer,
+        pipelined=settings.kafka_publish_mode == "pipelined",
+        max_in_flight=settings.kafka_max_in_flight,
+        codec=get_codec(settings.kafka_codec),
+    )
+    if settings.log_channel_enabled:
+        publisher.log_channel = LogChannel(
+            publisher.publish_log_batch,
+            capacity=settings.log_channel_capacity,
+            batch_size=settings.log_channel_batch_size,
+            flush_interval=settings.log_channel_flush_interval,
+            sample_rates=settings.log_sample_rates,
+        )
+        publisher.log_channel.start()
+    return publisher
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import random
+import time
+from collections import Counter, deque
+from typing import Awaitable, Callable
+
+log = logging.getLogger("api_gateway.log_channel")
+
+LogBatchSink = Callable[[dict], Awaitable[None]]
+
+
+class LogChannel:
+    """Буфер лог-событий между запросами и топиком логов.
+
+    emit только кладет событие в ограниченный буфер (с учетом доли сэмплирования
+    для его типа) и никогда не ждет Kafka. Фоновая задача отправляет накопленное одним
+    агрегированным сообщением, когда набралось batch_size событий или прошло
+    flush_interval секунд. Переполненный буфер отбрасывает новые события и считает их.
+    """
+
+    def __init__(
+        self,
+        sink: LogBatchSink,
+        capacity: int = 10_000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        sample_rates: dict[str, float] | None = None,
+        default_sample_rate: float = 1.0,
+        rng: Callable[[], float] = random.random,
+    ):
+        self._sink = sink
+        self._capacity = capacity
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._sample_rates = sample_rates or {}
+        self._default_sample_rate = default_sample_rate
+        self._rng = rng
+        self._buffer: deque[dict] = deque()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task: asyncio.Task | None = None
+        # Счетчики с последней отправки уходят в пачку, суммарные — в stats().
+        self._dropped_since_flush = 0
+        self._sampled_out_since_flush = 0
+        self.dropped = 0
+        self.sampled_out = 0
+        self.sent = 0
+        self.failed = 0
+
+    def emit(self, event_type: str, payload: dict) -> bool:
+        """Кладем событие в буфер; False — оно отброшено сэмплированием или переполнением."""
+        rate = self._sample_rates.get(event_type, self._default_sample_rate)
+        if rate < 1.0 and self._rng() >= rate:
+            self.sampled_out += 1
+            self._sampled_out_since_flush += 1
+            return False
+        if len(self._buffer) >= self._capacity:
+            self.dropped += 1
+            self._dropped_since_flush += 1
+            return False
+        self._buffer.append({"event_type": event_type, "ts": time.time(), "payload": payload})
+        if len(self._buffer) >= self._batch_size:
+            self._wakeup.set()
+        return True
+
+    def start(self) -> None:
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Останавливаем фоновую отправку и досылаем остаток буфера."""
+        self._stopping = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        while self._buffer:
+            await self.flush()
+
+    async def flush(self) -> int:
+        """Отправляем до batch_size событий одним сообщением. Возвращаем их число."""
+        if not self._buffer and not self._dropped_since_flush:
+            return 0
+        events = [self._buffer.popleft() for _ in range(min(self._batch_size, len(self._buffer)))]
+        batch = {
+            "count": len(events),
+            "by_type": dict(Counter(event["event_type"] for event in events)),
+            "dropped": self._dropped_since_flush,
+            "sampled_out": self._sampled_out_since_flush,
+            "events": events,
+        }
+        self._dropped_since_flush = 0
+        self._sampled_out_since_flush = 0
+        try:
+            await self._sink(batch)
+        except Exception as exc:
+            # Логи не переотправляем: повтор только удлинил бы очередь при недоступном топике.
+            self.failed += len(events)
+            log.warning("Не удалось отправить пачку логов (%s событий): %s", len(events), exc)
+        else:
+            self.sent += len(events)
+        return len(events)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "buffered": len(self._buffer),
+            "dropped": self.dropped,
+            "sampled_out": self.sampled_out,
+            "sent": self.sent,
+            "failed": self.failed,
+        }
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._stopping:
+                return
+            while await self.flush() >= self._batch_size:
+                pass
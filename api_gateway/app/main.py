@@ -3,27 +3,91 @@ from typing import AsyncGenerator
 
 from fastapi import FastAPI
 
-from .api import analytics, orders
+from .api import analytics, metrics, orders
+from .cache import EntityCache
 from .config import settings
 from .db import create_engine_and_sessionmaker, run_migrations
+from .idempotency import IdempotencyMiddleware, IdempotencyStore
 from .kafka_client import create_kafka_publisher
+from .metrics import GatewayMetrics, MetricsMiddleware, instrument_engine
+from .outbox import OutboxRelay
+from .services.analytics import AnalyticsCache, create_analytics_client
+from .timing import ServerTimingMiddleware
+from .timing import instrument_engine as instrument_engine_timing
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     """Создаем ресурсы на старте и закрываем их на останове."""
+    gateway_metrics = GatewayMetrics() if settings.metrics_enabled else None
+    app.state.metrics = gateway_metrics
     engine, session_maker = create_engine_and_sessionmaker()
+    if gateway_metrics is not None:
+        instrument_engine(engine, gateway_metrics)
+    if settings.server_timing_enabled:
+        instrument_engine_timing(engine)
     app.state.engine = engine
     app.state.session_maker = session_maker
     await run_migrations(engine)
 
     kafka_publisher = await create_kafka_publisher()
     app.state.kafka_publisher = kafka_publisher
+    if gateway_metrics is not None:
+        kafka_publisher.metrics = gateway_metrics
+        gateway_metrics.add_source(kafka_publisher.stats)
     await kafka_publisher.log_event("GatewayStarted", {"service": settings.app_name})
 
+    outbox_relay = None
+    if settings.outbox_enabled:
+        outbox_relay = OutboxRelay(
+            session_maker,
+            kafka_publisher,
+            batch_size=settings.outbox_batch_size,
+            poll_interval=settings.outbox_poll_interval,
+            claim_timeout=settings.outbox_claim_timeout,
+        )
+        outbox_relay.start()
+    app.state.outbox_relay = outbox_relay
+    app.state.analytics_client = create_analytics_client()
+    app.state.analytics_cache = (
+        AnalyticsCache(
+            max_size=settings.analytics_cache_size,
+            default_ttl=settings.analytics_cache_ttl,
+            ttls=settings.analytics_cache_ttls,
+            stale_ttl=settings.analytics_cache_stale_ttl,
+        )
+        if settings.analytics_cache_enabled
+        else None
+    )
+
+    app.state.idempotency_store = (
+        IdempotencyStore(
+            session_maker,
+            ttl=settings.idempotency_ttl,
+            cache_size=settings.idempotency_cache_size,
+        )
+        if settings.idempotency_enabled
+        else None
+    )
+    app.state.read_cache = (
+        EntityCache(max_size=settings.read_cache_size, ttl=settings.read_cache_ttl)
+        if settings.read_cache_enabled
+        else None
+    )
+
+    if gateway_metrics is not None:
+        if app.state.analytics_cache is not None:
+            gateway_metrics.add_source(app.state.analytics_cache.stats)
+        if app.state.read_cache is not None:
+            read_cache = app.state.read_cache
+            gateway_metrics.add_source(lambda: {"read_cache_hits": read_cache.hits, "read_cache_misses": read_cache.misses})
+
     try:
         yield
     finally:
+        await app.state.analytics_client.aclose()
+        if outbox_relay is not None:
+            await outbox_relay.stop()
         await kafka_publisher.log_event("GatewayStopping", {"service": settings.app_name})
         await kafka_publisher.close()
         await engine.dispose()
@@ -31,8 +95,14 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
 
 def create_app() -> FastAPI:
     app = FastAPI(title=settings.app_name, lifespan=lifespan)
+    app.add_middleware(IdempotencyMiddleware)
+    # Добавлен последним — значит, внешний: в латентность входит и обработка Idempotency-Key.
+    app.add_middleware(MetricsMiddleware)
+    if settings.server_timing_enabled:
+        app.add_middleware(ServerTimingMiddleware, log_threshold_ms=settings.server_timing_log_threshold_ms)
     app.include_router(orders.router)
     app.include_router(analytics.router)
+    app.include_router(metrics.router)
     return app
 
 
@@ -0,0 +1,306 @@
+"""Метрики шлюза в текстовом формате Prometheus.
+
+Примитивы (_format_labels ... MetricsRegistry) — копия orders_service/infrastructure/metrics.py:
+сервисы собираются в отдельные образы и общего пакета не имеют. Правьте обе копии разом,
+тест orders_service/tests/test_metrics.py проверяет, что они совпадают.
+"""
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Iterable, Sequence
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Границы в секундах: от долей миллисекунды (SQLite, кеш) до таймаута analytics-service.
+DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _HistogramSeries:
+    """Счетчики одного набора меток. Корзины выделены заранее, observe — bisect и два сложения."""
+
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: tuple[float, ...]):
+        self.bounds = bounds
+        # Последняя ячейка — значения больше верхней границы (+Inf).
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Histogram:
+    """Гистограмма в стиле Prometheus; накопительные суммы считаются только при выгрузке.
+
+    Блокировок нет: все вызовы идут из потока event loop (события движка SQLAlchemy
+    выполняются в greenlet того же потока), так что += не пересекаются.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.bounds = tuple(sorted(buckets))
+        self._series: dict[tuple[str, ...], _HistogramSeries] = {}
+
+    def labels(self, *values: str) -> _HistogramSeries:
+        series = self._series.get(values)
+        if series is None:
+            series = self._series[values] = _HistogramSeries(self.bounds)
+        return series
+
+    def observe(self, value: float, *labels: str) -> None:
+        self.labels(*labels).observe(value)
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return sum(series.counts) if series else 0
+
+    def total(self, *labels: str) -> float:
+        series = self._series.get(labels)
+        return series.sum if series else 0.0
+
+    def samples(self) -> Iterable[str]:
+        for values, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.bounds, float("inf")), series.counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}"
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {_format_value(series.sum)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def values(self) -> dict[tuple[str, ...], float]:
+        return dict(self._values)
+
+    def samples(self) -> Iterable[str]:
+        for values, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    """Текущее значение; если задан collect, оно читается в момент выгрузки."""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        collect: Callable[[], dict[tuple[str, ...], float]] | None = None,
+    ):
+        super().__init__(name, help, labelnames)
+        self._collect = collect
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+    def samples(self) -> Iterable[str]:
+        if self._collect is not None:
+            self._values = dict(self._collect())
+        return super().samples()
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: dict[str, Histogram | Counter] = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Текстовый формат Prometheus 0.0.4."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+class RequestStats:
+    """Накопители одного HTTP-запроса, доступные через contextvar."""
+
+    __slots__ = ("db_time", "db_statements")
+
+    def __init__(self):
+        self.db_time = 0.0
+        self.db_statements = 0
+
+
+# Объект изменяемый: greenlet SQLAlchemy получает копию контекста, но тот же RequestStats.
+current_request: ContextVar[RequestStats | None] = ContextVar("gateway_request_stats", default=None)
+
+
+class GatewayMetrics:
+    """Набор метрик шлюза; живет в app.state.metrics и отдается на /metrics."""
+
+    def __init__(self):
+        self.registry = MetricsRegistry()
+        register = self.registry.register
+        self.requests = register(
+            Counter("gateway_http_requests_total", "HTTP-запросы по маршруту и статусу", ("method", "route", "status"))
+        )
+        self.request_duration = register(
+            Histogram("gateway_http_request_duration_seconds", "Время обработки HTTP-запроса", ("method", "route"))
+        )
+        self.in_flight = register(Gauge("gateway_http_requests_in_flight", "HTTP-запросы в обработке"))
+        self.in_flight.set(0)
+        self.request_db_time = register(
+            Histogram("gateway_http_request_db_seconds", "Суммарное время SQL за один HTTP-запрос", ("method", "route"))
+        )
+        self.db_statement_duration = register(
+            Histogram("gateway_db_statement_duration_seconds", "Время выполнения одного SQL-выражения")
+        )
+        self.kafka_publish_duration = register(
+            Histogram("gateway_kafka_publish_duration_seconds", "Время до подтверждения брокером", ("topic",))
+        )
+        self.kafka_publish_errors = register(
+            Counter("gateway_kafka_publish_errors_total", "Ошибки публикации в Kafka", ("topic",))
+        )
+        self.analytics_duration = register(
+            Histogram("gateway_analytics_upstream_duration_seconds", "Запросы к analytics-service", ("outcome",))
+        )
+        self._sources: list[Callable[[], dict[str, float]]] = []
+        register(
+            Gauge(
+                "gateway_component_stat",
+                "Счетчики компонентов: кешей, канала логов и т.д.",
+                ("name",),
+                collect=lambda: {(name,): value for source in self._sources for name, value in source().items()},
+            )
+        )
+
+    def add_source(self, source: Callable[[], dict[str, float]]) -> None:
+        """Подключаем stats() компонента; значения читаются при каждой выгрузке."""
+        self._sources.append(source)
+
+    def render(self) -> str:
+        return self.registry.render()
+
+    def observe_statement(self, elapsed: float) -> None:
+        self.db_statement_duration.observe(elapsed)
+        stats = current_request.get()
+        if stats is not None:
+            stats.db_time += elapsed
+            stats.db_statements += 1
+
+    def observe_kafka(self, topic: str, elapsed: float, failed: bool = False) -> None:
+        self.kafka_publish_duration.observe(elapsed, topic)
+        if failed:
+            self.kafka_publish_errors.inc(topic)
+
+
+def instrument_engine(engine: AsyncEngine, metrics: GatewayMetrics) -> None:
+    """Засекаем каждое SQL-выражение через события движка."""
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany) -> None:
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany) -> None:
+        metrics.observe_statement(time.perf_counter() - conn.info["metrics_started"].pop())
+
+    @event.listens_for(engine.sync_engine, "handle_error")
+    def _error(exception_context) -> None:
+        started = exception_context.connection.info.get("metrics_started") if exception_context.connection else None
+        if started:
+            metrics.observe_statement(time.perf_counter() - started.pop())
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: латентность и статус по шаблону маршрута, запросы в работе, время в БД.
+
+    Метка route берется из шаблона (/orders/{order_id}), а не из пути, чтобы число рядов
+    не росло с числом заказов. Запросы мимо маршрутов попадают в route="unmatched".
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        metrics: GatewayMetrics | None = getattr(scope["app"].state, "metrics", None) if "app" in scope else None
+        if scope["type"] != "http" or metrics is None:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        metrics.in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.in_flight.dec()
+            current_request.reset(token)
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            metrics.requests.inc(method, route_path, str(status))
+            metrics.request_duration.observe(elapsed, method, route_path)
+            if stats.db_statements:
+                metrics.request_db_time.observe(stats.db_time, method, route_path)
@@ -1,6 +1,6 @@
 from datetime import datetime, UTC
 
-from sqlalchemy import Column, DateTime, Float, ForeignKey, Integer, String
+from sqlalchemy import JSON, Column, DateTime, Float, ForeignKey, Index, Integer, LargeBinary, String
 from sqlalchemy.orm import declarative_base, relationship
 
 Base = declarative_base()
@@ -14,19 +14,55 @@ class Order(Base):
     amount = Column(Float, nullable=False)
     currency = Column(String(3), nullable=False)
     status = Column(String, nullable=False, default="created")
-    created_at = Column(DateTime, default=datetime.now(UTC))
+    created_at = Column(DateTime, default=lambda: datetime.now(UTC))
 
     payments = relationship("Payment", back_populates="order")
 
+    # Keyset-пагинация по (created_at, id): с фильтром по статусу и без него.
+    __table_args__ = (
+        Index("ix_orders_status_created_at_id", "status", "created_at", "id"),
+        Index("ix_orders_created_at_id", "created_at", "id"),
+    )
+
 
 class Payment(Base):
     __tablename__ = "payments"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    order_id = Column(Integer, ForeignKey("orders.id"), nullable=False)
+    order_id = Column(Integer, ForeignKey("orders.id"), nullable=False, index=True)
     amount = Column(Float, nullable=False)
     method = Column(String, nullable=False)
     status = Column(String, nullable=False, default="requested")
-    created_at = Column(DateTime, default=datetime.now(UTC))
+    created_at = Column(DateTime, default=lambda: datetime.now(UTC))
 
     order = relationship("Order", back_populates="payments")
+
+
+class OutboxMessage(Base):
+    """Событие, записанное в одной транзакции с бизнес-данными и ожидающее отправки в Kafka."""
+
+    __tablename__ = "outbox"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    topic = Column(String, nullable=False)
+    event_type = Column(String, nullable=False)
+    key = Column(String, nullable=True, index=True)
+    source = Column(String, nullable=True)
+    correlation_id = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=lambda: datetime.now(UTC))
+    # Какой relay забрал строку на отправку и когда; просроченный захват может перехватить другой.
+    claimed_by = Column(String, nullable=True)
+    claimed_at = Column(DateTime, nullable=True)
+
+
+class IdempotencyKey(Base):
+    """Сохраненный ответ на запрос с заголовком Idempotency-Key."""
+
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String(255), primary_key=True)
+    fingerprint = Column(String(32), nullable=False)
+    status_code = Column(Integer, nullable=False)
+    body = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=lambda: datetime.now(UTC), nullable=False, index=True)
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import UTC, datetime, timedelta
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from .kafka_client import KafkaPublisher
+from .repositories.outbox import OutboxRepository
+
+log = logging.getLogger("api_gateway.outbox")
+
+
+class OutboxRelay:
+    """Фоновая задача, которая переносит события из outbox в Kafka пачками.
+
+    Доставка at-least-once: если пачка отправлена, но не удалена из outbox,
+    после рестарта она уйдет в Kafka повторно.
+
+    Реплик может быть несколько: перед отправкой relay захватывает строки (claimed_by/claimed_at),
+    и чужой захват уважается, пока не старше claim_timeout. Поэтому claim_timeout должен быть
+    заметно больше времени отправки одной пачки, иначе пачку зависшего relay отправят дважды.
+    """
+
+    def __init__(
+        self,
+        session_maker: async_sessionmaker[AsyncSession],
+        publisher: KafkaPublisher,
+        batch_size: int = 100,
+        poll_interval: float = 0.2,
+        claim_timeout: float = 30.0,
+        relay_id: str | None = None,
+    ):
+        self._session_maker = session_maker
+        self._publisher = publisher
+        self._batch_size = batch_size
+        self._poll_interval = poll_interval
+        self._claim_timeout = timedelta(seconds=claim_timeout)
+        self.relay_id = relay_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stopping = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Останавливаем цикл и пытаемся дослать то, что осталось в outbox."""
+        self._stopping.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        try:
+            while await self.relay_once():
+                pass
+        except Exception:
+            log.exception("Не удалось дослать outbox при остановке")
+
+    async def relay_once(self) -> int:
+        """Захватываем пачку, отправляем и удаляем ее из outbox. Возвращаем размер пачки."""
+        async with self._session_maker() as session:
+            repo = OutboxRepository(session)
+            now = datetime.now(UTC)
+            # Захват коммитим отдельно и сразу: другие relay должны увидеть его до начала отправки.
+            if not await repo.claim_batch(self.relay_id, self._batch_size, now, now - self._claim_timeout):
+                await session.rollback()
+                return 0
+            await session.commit()
+            messages = await repo.fetch_claimed(self.relay_id, self._batch_size)
+
+            # Ставим всю пачку в очередь продюсера по порядку и ждем подтверждений разом.
+            deliveries = []
+            for message in messages:
+                _, delivery = await self._publisher.send_event(
+                    message.topic,
+                    message.event_type,
+                    message.payload,
+                    key=message.key,
+                    source=message.source,
+                    correlation_id=message.correlation_id,
+                )
+                deliveries.append(delivery)
+            await asyncio.gather(*deliveries)
+
+            await repo.delete([message.id for message in messages])
+            await session.commit()
+            return len(messages)
+
+    async def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                relayed = await self.relay_once()
+            except Exception:
+                log.exception("Ошибка отправки outbox, повторим позже")
+                relayed = 0
+            if relayed < self._batch_size:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=self._poll_interval)
+                except asyncio.TimeoutError:
+                    pass
@@ -1,24 +1,76 @@
-from sqlalchemy import select, update
+from datetime import UTC, datetime
+from typing import Sequence
+from uuid import uuid4
+
+from sqlalchemy import insert, select, tuple_, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from .. import events
+from ..cache import EntityCache
 from ..errors import OrderNotFound
 from ..models import Order
+from .outbox import OutboxRepository
 
 
 class OrderRepository:
-    def __init__(self, session: AsyncSession):
+    def __init__(
+        self,
+        session: AsyncSession,
+        outbox: OutboxRepository | None = None,
+        cache: EntityCache | None = None,
+    ):
         self.session = session
+        self.outbox = outbox
+        self.cache = cache
 
-    async def create(self, *, item: str, amount: float, currency: str) -> Order:
-        order = Order(item=item, amount=amount, currency=currency, status="created")
-        self.session.add(order)
+    def _invalidate(self, order_id: int) -> None:
+        if self.cache is not None:
+            self.cache.invalidate("order", order_id)
 
-        await self.session.commit()
-        await self.session.refresh(order)
-        self.session.expunge(order)
+    async def create(
+        self,
+        *,
+        item: str,
+        amount: float,
+        currency: str,
+        correlation_id: str | None = None,
+    ) -> Order:
+        """Создаем заказ одним INSERT ... RETURNING, без перечитывания после коммита.
 
+        При включенном outbox событие OrderCreated пишется в той же транзакции.
+        """
+        (order,) = await self.create_many(
+            [{"item": item, "amount": amount, "currency": currency}],
+            correlation_ids=[correlation_id] if correlation_id else None,
+        )
         return order
 
+    async def create_many(
+        self,
+        items: Sequence[dict],
+        correlation_ids: Sequence[str] | None = None,
+    ) -> list[Order]:
+        """Вставляем заказы одним INSERT ... RETURNING; порядок результата совпадает с items."""
+        if not items:
+            return []
+        stmt = insert(Order).returning(Order, sort_by_parameter_order=True)
+        result = await self.session.execute(stmt, [{**item, "status": "created"} for item in items])
+        orders = list(result.scalars())
+
+        if self.outbox is not None:
+            correlation_ids = correlation_ids or [str(uuid4()) for _ in orders]
+            for order, correlation_id in zip(orders, correlation_ids):
+                self.outbox.add(events.order_created(order), correlation_id=correlation_id)
+
+        # RETURNING уже загрузил все колонки: отвязываем объекты до коммита, чтобы не перечитывать их.
+        for order in orders:
+            self.session.expunge(order)
+        await self.session.commit()
+        for order in orders:
+            self._invalidate(order.id)
+
+        return orders
+
     async def get(self, order_id: int) -> Order:
         order = await self.session.get(Order, order_id)
         if not order:
@@ -26,6 +78,42 @@ class OrderRepository:
         self.session.expunge(order)
         return order
 
+    async def list_page(
+        self,
+        *,
+        status: str | None = None,
+        since: datetime | None = None,
+        after_id: int | None = None,
+        limit: int = 50,
+    ) -> list[Order]:
+        """Страница заказов по возрастанию (created_at, id), keyset вместо OFFSET.
+
+        Курсор — id последнего заказа предыдущей страницы; его created_at берем подзапросом,
+        так что глубина страницы не влияет на стоимость запроса. Неизвестный курсор — OrderNotFound.
+        """
+        stmt = select(Order)
+        if status is not None:
+            stmt = stmt.where(Order.status == status)
+        if since is not None:
+            # created_at хранится наивным в UTC: aware-значение с другим смещением сравнивалось бы как есть.
+            if since.tzinfo is not None:
+                since = since.astimezone(UTC).replace(tzinfo=None)
+            stmt = stmt.where(Order.created_at >= since)
+        if after_id is not None:
+            cursor_created_at = select(Order.created_at).where(Order.id == after_id).scalar_subquery()
+            stmt = stmt.where(tuple_(Order.created_at, Order.id) > tuple_(cursor_created_at, after_id))
+        stmt = stmt.order_by(Order.created_at, Order.id).limit(limit)
+
+        result = await self.session.execute(stmt)
+        orders = list(result.scalars())
+        # Для неизвестного курсора подзапрос дает NULL и пустую страницу; отличаем ее от конца списка.
+        if not orders and after_id is not None:
+            if await self.session.scalar(select(Order.id).where(Order.id == after_id)) is None:
+                raise OrderNotFound(f"Заказ {after_id} не найден")
+        for order in orders:
+            self.session.expunge(order)
+        return orders
+
     async def mark_payment_requested(self, order_id: int) -> None:
         stmt = (
             update(Order)
@@ -36,6 +124,7 @@ class OrderRepository:
         if result.rowcount == 0:
             raise OrderNotFound(f"Заказ {order_id} не найден")
         await self.session.commit()
+        self._invalidate(order_id)
 
     async def ensure_exists(self, order_id: int) -> Order:
         return await self.get(order_id)
@@ -0,0 +1,72 @@
+from datetime import datetime
+from typing import Sequence
+
+from sqlalchemy import delete, exists, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from ..events import OutgoingEvent
+from ..models import OutboxMessage
+
+
+class OutboxRepository:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    def add(self, event: OutgoingEvent, correlation_id: str) -> OutboxMessage:
+        """Кладем событие в текущую транзакцию; коммит делает вызывающий репозиторий."""
+        message = OutboxMessage(
+            topic=event.topic,
+            event_type=event.event_type,
+            key=event.key,
+            source=event.source,
+            correlation_id=correlation_id,
+            payload=event.payload,
+        )
+        self.session.add(message)
+        return message
+
+    async def claim_batch(self, relay_id: str, limit: int, now: datetime, stale_before: datetime) -> int:
+        """Захватываем до limit строк для relay_id одним UPDATE; возвращаем число захваченных.
+
+        Берем свободные, просроченные и свои строки. Строку пропускаем, если более раннее событие
+        того же ключа держит другой relay: иначе реплики переставили бы события одного заказа.
+        """
+        claimable = or_(
+            OutboxMessage.claimed_at.is_(None),
+            OutboxMessage.claimed_at < stale_before,
+            OutboxMessage.claimed_by == relay_id,
+        )
+        earlier = aliased(OutboxMessage)
+        held_by_other = (
+            exists()
+            .where(earlier.key == OutboxMessage.key)
+            .where(earlier.id < OutboxMessage.id)
+            .where(earlier.claimed_by != relay_id)
+            .where(earlier.claimed_at >= stale_before)
+        )
+        candidates = (
+            select(OutboxMessage.id).where(claimable, ~held_by_other).order_by(OutboxMessage.id).limit(limit)
+        )
+        # Условие захвата повторяем в самом UPDATE: строку, которую успел взять другой relay, не перезапишем.
+        stmt = (
+            update(OutboxMessage)
+            .where(OutboxMessage.id.in_(candidates), claimable)
+            .values(claimed_by=relay_id, claimed_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        result = await self.session.execute(stmt)
+        return result.rowcount
+
+    async def fetch_claimed(self, relay_id: str, limit: int) -> Sequence[OutboxMessage]:
+        stmt = (
+            select(OutboxMessage)
+            .where(OutboxMessage.claimed_by == relay_id)
+            .order_by(OutboxMessage.id)
+            .limit(limit)
+        )
+        result = await self.session.execute(stmt)
+        return result.scalars().all()
+
+    async def delete(self, message_ids: Sequence[int]) -> None:
+        await self.session.execute(delete(OutboxMessage).where(OutboxMessage.id.in_(message_ids)))
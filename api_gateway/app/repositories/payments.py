@@ -1,42 +1,71 @@
-from sqlalchemy import update
+from uuid import uuid4
+
+from sqlalchemy import insert, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from .. import events
+from ..cache import EntityCache
 from ..errors import OrderNotFound, PaymentNotFound
 from ..models import Order, Payment
+from .outbox import OutboxRepository
 
 
 class PaymentRepository:
-    def __init__(self, session: AsyncSession):
+    def __init__(
+        self,
+        session: AsyncSession,
+        outbox: OutboxRepository | None = None,
+        cache: EntityCache | None = None,
+    ):
         self.session = session
+        self.outbox = outbox
+        self.cache = cache
 
     async def get(self, payment_id: int) -> Payment:
         payment = await self.session.get(Payment, payment_id)
         if not payment:
             raise PaymentNotFound(f"Платеж {payment_id} не найден")
-        await self.session.refresh(payment)
         self.session.expunge(payment)
         return payment
 
-    async def request_payment(self, *, order_id: int, amount: float, method: str) -> Payment:
-        """Создаем платеж и отмечаем заказ как payment_requested в одной транзакции."""
+    async def request_payment(
+        self,
+        *,
+        order_id: int,
+        amount: float,
+        method: str,
+        correlation_id: str | None = None,
+    ) -> Payment:
+        """Создаем платеж и отмечаем заказ как payment_requested в одной транзакции.
+
+        Проверка существования заказа и смена статуса — один UPDATE ... RETURNING,
+        платеж вставляется INSERT ... RETURNING, так что перечитывать ничего не нужно.
+        При включенном outbox в ту же транзакцию попадает и событие PaymentRequested.
+        """
         async with self.session.begin():
-            order = await self.session.get(Order, order_id)
-            if not order:
+            updated = await self.session.execute(
+                update(Order)
+                .where(Order.id == order_id)
+                .values(status="payment_requested")
+                .returning(Order.id)
+                .execution_options(synchronize_session=False)
+            )
+            if updated.scalar_one_or_none() is None:
                 raise OrderNotFound(f"Заказ {order_id} не найден")
 
-            payment = Payment(
-                order_id=order_id,
-                amount=amount,
-                method=method,
-                status="requested",
-            )
-            self.session.add(payment)
-            await self.session.flush()
+            payment = (
+                await self.session.execute(
+                    insert(Payment)
+                    .values(order_id=order_id, amount=amount, method=method, status="requested")
+                    .returning(Payment)
+                )
+            ).scalar_one()
 
-            await self.session.execute(
-                update(Order).where(Order.id == order_id).values(status="payment_requested")
-            )
+            if self.outbox is not None:
+                self.outbox.add(events.payment_requested(payment), correlation_id=correlation_id or str(uuid4()))
+            self.session.expunge(payment)
 
-        await self.session.refresh(payment)
-        self.session.expunge(payment)
-        return payment
\ No newline at end of file
+        if self.cache is not None:
+            self.cache.invalidate("order", order_id)
+            self.cache.invalidate("payment", payment.id)
+        return payment
@@ -1,5 +1,7 @@
-from pydantic import BaseModel, Field
-from typing import Optional
+from datetime import datetime
+
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Any, Optional
 
 
 class OrderCreate(BaseModel):
@@ -13,6 +15,35 @@ class OrderOut(BaseModel):
     status: str = "created"
 
 
+class OrderDetail(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    item: str
+    amount: float
+    currency: str
+    status: str
+    created_at: Optional[datetime] = None
+
+
+class OrderPage(BaseModel):
+    items: list[OrderDetail]
+    next_after_id: Optional[int] = Field(None, description="Передайте как after_id, чтобы получить следующую страницу")
+
+
+class OrderBatchItemOut(BaseModel):
+    index: int = Field(..., description="Позиция в исходном списке")
+    id: Optional[int] = None
+    status: str = Field(..., description="created или invalid")
+    errors: Optional[list[dict[str, Any]]] = Field(None, description="Ошибки валидации позиции")
+
+
+class OrderBatchOut(BaseModel):
+    created: int
+    failed: int
+    items: list[OrderBatchItemOut]
+
+
 class PaymentRequest(BaseModel):
     amount: float = Field(..., gt=0, description="Сумма оплаты")
     method: str = Field(..., description="Способ оплаты")
@@ -23,6 +54,17 @@ class PaymentOut(BaseModel):
     status: str
 
 
+class PaymentDetail(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    order_id: int
+    amount: float
+    method: str
+    status: str
+    created_at: Optional[datetime] = None
+
+
 class AnalyticsRequest(BaseModel):
     metric: str
     from_ts: Optional[str] = Field(None, description="ISO метка начала периода")
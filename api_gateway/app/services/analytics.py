@@ -1,30 +1,237 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from importlib.util import find_spec
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
 import httpx
 
+from ..cache import TTLCache
 from ..config import settings
 from ..kafka_client import KafkaPublisher
+from ..metrics import GatewayMetrics
 from ..schemas import AnalyticsRequest, AnalyticsResult
+from ..streaming import iter_ndjson_rows
+from ..timing import phase
+
+log = logging.getLogger("api_gateway.analytics")
+
+CacheKey = tuple[str, Optional[str], Optional[str], int]
+
+
+def create_analytics_client(transport: httpx.AsyncBaseTransport | None = None) -> httpx.AsyncClient:
+    """Один долгоживущий клиент на приложение: соединения и TLS-сессии переиспользуются.
+
+    Таймауты задаются только здесь: timeout= в отдельном вызове заменил бы их целиком, вместе с connect.
+    """
+    return httpx.AsyncClient(
+        base_url=settings.analytics_service_url,
+        transport=transport,
+        timeout=httpx.Timeout(settings.analytics_timeout, connect=settings.analytics_connect_timeout),
+        limits=httpx.Limits(
+            max_connections=settings.analytics_max_connections,
+            max_keepalive_connections=settings.analytics_max_keepalive_connections,
+            keepalive_expiry=settings.analytics_keepalive_expiry,
+        ),
+        http2=settings.analytics_http2 and find_spec("h2") is not None,
+    )
+
+
+def _normalize_ts(value: Optional[str]) -> Optional[str]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value).isoformat()
+    except ValueError:
+        return value
+
+
+class AnalyticsCache:
+    """Кеш ответов analytics-service.
+
+    TTL задается по метрике, размер ограничен LRU. Одновременные промахи по одному
+    ключу делят один запрос к upstream (singleflight). Истекшая запись еще stale_ttl
+    секунд отдается как есть, а обновляется в фоне (stale-while-revalidate).
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        default_ttl: float = 30.0,
+        ttls: dict[str, float] | None = None,
+        stale_ttl: float = 60.0,
+    ):
+        self._entries: TTLCache[CacheKey, dict] = TTLCache(max_size)
+        self._default_ttl = default_ttl
+        self._ttls = ttls or {}
+        self._stale_ttl = stale_ttl
+        self._inflight: dict[CacheKey, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stale = 0
+
+    @staticmethod
+    def key(payload: AnalyticsRequest) -> CacheKey:
+        return (payload.metric, _normalize_ts(payload.from_ts), _normalize_ts(payload.to_ts), payload.limit)
+
+    def ttl_for(self, metric: str) -> float:
+        return self._ttls.get(metric, self._default_ttl)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "cache_hits": self.hits,
+            "cache_misses": self.misses,
+            "cache_coalesced": self.coalesced,
+            "cache_stale": self.stale,
+        }
+
+    async def get_or_fetch(
+        self,
+        payload: AnalyticsRequest,
+        fetch: Callable[[], Awaitable[dict]],
+    ) -> tuple[dict, str]:
+        """Возвращаем данные и исход: hit, stale, coalesced или miss."""
+        key = self.key(payload)
+        entry = self._entries.get_entry(key)
+        now = self._entries.clock()
+        if entry is not None and now < entry.expires_at:
+            self.hits += 1
+            return entry.value, "hit"
+        if entry is not None and now < entry.expires_at + self._stale_ttl:
+            self.stale += 1
+            if key not in self._inflight:
+                self._start_fetch(key, payload.metric, fetch)
+            return entry.value, "stale"
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight), "coalesced"
+
+        self.misses += 1
+        # shield: отмена одного запроса не должна обрывать общий поход в upstream.
+        return await asyncio.shield(self._start_fetch(key, payload.metric, fetch)), "miss"
+
+    def _start_fetch(self, key: CacheKey, metric: str, fetch: Callable[[], Awaitable[dict]]) -> asyncio.Task:
+        async def run() -> dict:
+            try:
+                data = await fetch()
+                self._entries.set(key, data, self.ttl_for(metric))
+                return data
+            finally:
+                self._inflight.pop(key, None)
+
+        task = asyncio.create_task(run())
+        task.add_done_callback(self._log_failure)
+        self._inflight[key] = task
+        return task
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            log.warning("Запрос к analytics-service не удался: %r", task.exception())
 
 
 class AnalyticsService:
-    def __init__(self, publisher: KafkaPublisher):
+    def __init__(
+        self,
+        publisher: KafkaPublisher,
+        client: httpx.AsyncClient,
+        cache: AnalyticsCache | None = None,
+        metrics: GatewayMetrics | None = None,
+    ):
         self.publisher = publisher
+        self.client = client
+        self.cache = cache
+        self.metrics = metrics
 
     async def request_analytics(self, payload: AnalyticsRequest) -> AnalyticsResult:
-        """Делаем HTTP-запрос в analytics-service и логируем событие в Kafka."""
-        params = {
+        """Делаем HTTP-запрос в analytics-service (через кеш, если он есть) и логируем событие в Kafka."""
+        log_payload = {"metric": payload.metric, "status": "ok"}
+        if self.cache is None:
+            data = await self._fetch(payload)
+        else:
+            data, outcome = await self.cache.get_or_fetch(payload, lambda: self._fetch(payload))
+            log_payload.update(cache=outcome, **self.cache.stats())
+
+        await self.publisher.log_event("AnalyticsHttpRequested", log_payload)
+
+        return AnalyticsResult(data=data)
+
+    async def stream_analytics(
+        self, payload: AnalyticsRequest, ndjson: bool = False
+    ) -> tuple[AsyncIterator[bytes], str, Callable[[], Awaitable[None]]]:
+        """Ретранслируем тело analytics-service по мере чтения, в обход кеша и без разбора в dict.
+
+        Статус upstream проверяется до первого байта ответа, поэтому ошибки выглядят так же,
+        как в обычном режиме. В режиме ndjson отдаем строки массива rows по одной на строку.
+        Третий элемент закрывает ответ upstream; вызывающий обязан его вызвать, даже если
+        тело так и не начали читать.
+        """
+        request = self.client.build_request("GET", "/analytics", params=self._params(payload))
+        started = time.perf_counter()
+        try:
+            with phase("analytics"):
+                response = await self.client.send(request, stream=True)
+        except Exception:
+            self._observe(started, "error")
+            raise
+        try:
+            response.raise_for_status()
+        except httpx.HTTPStatusError:
+            self._observe(started, "error")
+            await response.aclose()
+            raise
+        # Для потока меряем время до заголовков ответа: тело читается со скоростью клиента.
+        self._observe(started, "ok")
+
+        if ndjson:
+            body, media_type = iter_ndjson_rows(response.aiter_bytes()), "application/x-ndjson"
+        else:
+            body, media_type = self._wrap_data(response.aiter_bytes()), "application/json"
+
+        async def relay() -> AsyncIterator[bytes]:
+            async for chunk in body:
+                yield chunk
+            await self.publisher.log_event(
+                "AnalyticsHttpRequested",
+                {"metric": payload.metric, "status": "ok", "stream": "ndjson" if ndjson else "json"},
+            )
+
+        return relay(), media_type, response.aclose
+
+    @staticmethod
+    async def _wrap_data(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        # Та же форма, что у AnalyticsResult: {"data": <тело upstream>}.
+        yield b'{"data":'
+        async for chunk in chunks:
+            yield chunk
+        yield b"}"
+
+    @staticmethod
+    def _params(payload: AnalyticsRequest) -> dict:
+        return {
             "metric": payload.metric,
             "from_ts": payload.from_ts,
             "to_ts": payload.to_ts,
             "limit": payload.limit,
         }
-        async with httpx.AsyncClient(base_url=settings.analytics_service_url, timeout=5.0) as client:
-            response = await client.get("/analytics", params=params)
-            response.raise_for_status()
-            data = response.json()
 
-        await self.publisher.log_event(
-            "AnalyticsHttpRequested",
-            {"metric": payload.metric, "status": "ok"},
-        )
+    async def _fetch(self, payload: AnalyticsRequest) -> dict:
+        started = time.perf_counter()
+        try:
+            with phase("analytics"):
+                response = await self.client.get("/analytics", params=self._params(payload))
+                response.raise_for_status()
+                data = response.json()
+        except Exception:
+            self._observe(started, "error")
+            raise
+        self._observe(started, "ok")
+        return data
 
-        return AnalyticsResult(data=data)
+    def _observe(self, started: float, outcome: str) -> None:
+        if self.metrics is not None:
+            self.metrics.analytics_duration.observe(time.perf_counter() - started, outcome)
@@ -1,8 +1,35 @@
-from ..config import settings
+from datetime import datetime
+from typing import Sequence
+from uuid import uuid4
+
+from .. import events
+from ..cache import CachedBody, EntityCache
 from ..kafka_client import KafkaPublisher
 from ..repositories.orders import OrderRepository
 from ..repositories.payments import PaymentRepository
-from ..schemas import OrderCreate, PaymentRequest
+from ..schemas import OrderCreate, OrderDetail, OrderPage, PaymentDetail, PaymentRequest
+from ..timing import phase
+
+
+async def _publish(publisher: KafkaPublisher, event: events.OutgoingEvent) -> str:
+    return await publisher.publish_event(
+        topic=event.topic,
+        event_type=event.event_type,
+        payload=event.payload,
+        key=event.key,
+        source=event.source,
+    )
+
+
+async def _cached_view(cache: EntityCache | None, kind: str, entity_id: int, load) -> CachedBody:
+    """Готовое тело ответа с ETag: из кеша или из БД с последующим кешированием."""
+    if cache is None:
+        return CachedBody.of(await load())
+    cached = cache.get(kind, entity_id)
+    if cached is not None:
+        return cached
+    generation = cache.generation()
+    return cache.put(kind, entity_id, await load(), generation)
 
 
 class OrderService:
@@ -10,23 +37,60 @@ class OrderService:
         self.orders_repo = orders_repo
         self.publisher = publisher
 
+    async def get_order(self, order_id: int) -> CachedBody:
+        async def load() -> bytes:
+            order = await self.orders_repo.get(order_id)
+            with phase("serialize"):
+                return OrderDetail.model_validate(order).model_dump_json().encode("utf-8")
+
+        return await _cached_view(self.orders_repo.cache, "order", order_id, load)
+
+    async def list_orders(
+        self,
+        status: str | None = None,
+        since: datetime | None = None,
+        after_id: int | None = None,
+        limit: int = 50,
+    ) -> OrderPage:
+        # Берем на одну строку больше, чтобы понять, есть ли следующая страница.
+        orders = await self.orders_repo.list_page(status=status, since=since, after_id=after_id, limit=limit + 1)
+        has_more = len(orders) > limit
+        orders = orders[:limit]
+        return OrderPage(
+            items=[OrderDetail.model_validate(order) for order in orders],
+            next_after_id=orders[-1].id if has_more else None,
+        )
+
+    async def create_orders(self, payloads: Sequence[OrderCreate]):
+        """Пакетное создание: один INSERT, одна пачка OrderCreated и одно лог-событие на весь батч."""
+        correlation_ids = [str(uuid4()) for _ in payloads]
+        orders = await self.orders_repo.create_many(
+            [payload.model_dump() for payload in payloads],
+            correlation_ids=correlation_ids,
+        )
+        if not orders:
+            return orders
+        if self.orders_repo.outbox is None:
+            correlation_ids = await self.publisher.publish_batch(
+                [events.order_created(order) for order in orders],
+                correlation_ids=correlation_ids,
+            )
+        await self.publisher.log_event(
+            "OrderBatchCreatedLog",
+            {"order_ids": [order.id for order in orders], "correlation_ids": correlation_ids},
+        )
+        return orders
+
     async def create_order(self, payload: OrderCreate):
+        correlation_id = str(uuid4())
         order = await self.orders_repo.create(
-            item=payload.item, amount=payload.amount, currency=payload.currency
-        )
-        correlation_id = await self.publisher.publish_event(
-            topic=settings.kafka_topic_orders,
-            event_type="OrderCreated",
-            payload={
-                "order_id": order.id,
-                "item": order.item,
-                "amount": order.amount,
-                "currency": order.currency,
-                "service": settings.order_service_name,
-            },
-            key=str(order.id),
-            source=settings.order_service_name,
+            item=payload.item,
+            amount=payload.amount,
+            currency=payload.currency,
+            correlation_id=correlation_id,
         )
+        if self.orders_repo.outbox is None:
+            correlation_id = await _publish(self.publisher, events.order_created(order))
         await self.publisher.log_event(
             "OrderCreatedLog",
             {"order_id": order.id, "correlation_id": correlation_id},
@@ -39,24 +103,24 @@ class PaymentService:
         self.payments_repo = payments_repo
         self.publisher = publisher
 
+    async def get_payment(self, payment_id: int) -> CachedBody:
+        async def load() -> bytes:
+            payment = await self.payments_repo.get(payment_id)
+            with phase("serialize"):
+                return PaymentDetail.model_validate(payment).model_dump_json().encode("utf-8")
+
+        return await _cached_view(self.payments_repo.cache, "payment", payment_id, load)
+
     async def request_payment(self, order_id: int, payload: PaymentRequest):
+        correlation_id = str(uuid4())
         payment = await self.payments_repo.request_payment(
-            order_id=order_id, amount=payload.amount, method=payload.method
-        )
-
-        correlation_id = await self.publisher.publish_event(
-            topic=settings.kafka_topic_payments,
-            event_type="PaymentRequested",
-            payload={
-                "payment_id": payment.id,
-                "order_id": order_id,
-                "amount": payment.amount,
-                "method": payment.method,
-                "service": settings.payment_service_name,
-            },
-            key=str(order_id),
-            source=settings.payment_service_name,
+            order_id=order_id,
+            amount=payload.amount,
+            method=payload.method,
+            correlation_id=correlation_id,
         )
+        if self.payments_repo.outbox is None:
+            correlation_id = await _publish(self.publisher, events.payment_requested(payment))
         await self.publisher.log_event(
             "PaymentRequestedLog",
             {
@@ -0,0 +1,60 @@
+import codecs
+import json
+import re
+from typing import AsyncIterator
+
+_WHITESPACE_AND_COMMAS = re.compile(r"[\s,]*")
+_DELIMITERS = frozenset(" \t\r\n,]")
+
+
+async def iter_ndjson_rows(chunks: AsyncIterator[bytes], field: str = "rows") -> AsyncIterator[bytes]:
+    """Достаем элементы массива `field` из потока JSON и отдаем их по одному в формате NDJSON.
+
+    В памяти держится только префикс документа до массива и текущий элемент. Ключ ищется
+    по тексту, поэтому строка `"rows": [` внутри значений до массива собьет разбор.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    array_start = re.compile(r'(?<!\\)"' + re.escape(field) + r'"\s*:\s*\[')
+    buffer = ""
+    in_array = False
+
+    async def more() -> bool:
+        nonlocal buffer
+        async for chunk in chunks:
+            buffer += utf8.decode(chunk)
+            return True
+        buffer += utf8.decode(b"", final=True)
+        return False
+
+    eof = False
+    while not eof or buffer:
+        if not in_array:
+            match = array_start.search(buffer)
+            if match is None:
+                if eof:
+                    return
+                eof = not await more()
+                continue
+            buffer = buffer[match.end() :]
+            in_array = True
+
+        pos = _WHITESPACE_AND_COMMAS.match(buffer).end()
+        if pos < len(buffer) and buffer[pos] == "]":
+            return
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            end = None
+        # Число на границе чанка ("12" + ".5") разбирается раньше времени — ждем разделитель.
+        if end is None or (not eof and (end == len(buffer) or buffer[end] not in _DELIMITERS)):
+            if eof:
+                raise ValueError(f"Оборванный JSON в массиве {field!r}")
+            eof = not await more()
+            continue
+
+        row = buffer[pos:end]
+        if "\n" in row:
+            row = json.dumps(value, ensure_ascii=False)
+        yield (row + "\n").encode("utf-8")
+        buffer = buffer[end:]
@@ -0,0 +1,123 @@
+import logging
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Iterator
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+log = logging.getLogger("api_gateway.timing")
+
+_NO_PHASE = nullcontext()
+
+
+class ServerTiming:
+    """Фазы одного запроса: имя -> [суммарное время в секундах, число замеров]."""
+
+    __slots__ = ("phases",)
+
+    def __init__(self):
+        self.phases: dict[str, list[float]] = {}
+
+    def add(self, name: str, elapsed: float) -> None:
+        entry = self.phases.get(name)
+        if entry is None:
+            self.phases[name] = [elapsed, 1]
+        else:
+            entry[0] += elapsed
+            entry[1] += 1
+
+    @contextmanager
+    def measure(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def header(self, total: float) -> str:
+        """Значение Server-Timing; app — время, не попавшее ни в одну фазу."""
+        parts = [
+            f'{name};dur={elapsed * 1000:.2f};desc="{int(count)}x"' for name, (elapsed, count) in self.phases.items()
+        ]
+        # Фазы параллельных задач могут пересекаться, поэтому остаток ограничен снизу нулем.
+        rest = max(total - sum(elapsed for elapsed, _ in self.phases.values()), 0.0)
+        parts.append(f"app;dur={rest * 1000:.2f}")
+        parts.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(parts)
+
+
+# Объект изменяемый, поэтому фазы из greenlet SQLAlchemy и дочерних задач попадают в тот же запрос.
+_current: ContextVar[ServerTiming | None] = ContextVar("gateway_server_timing", default=None)
+
+
+def phase(name: str):
+    """Контекст-менеджер замера фазы; вне ServerTimingMiddleware — пустой nullcontext."""
+    timing = _current.get()
+    if timing is None:
+        return _NO_PHASE
+    return timing.measure(name)
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Каждое SQL-выражение текущего запроса попадает в фазу db."""
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany) -> None:
+        if _current.get() is not None:
+            conn.info.setdefault("timing_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany) -> None:
+        timing = _current.get()
+        started = conn.info.get("timing_started")
+        if timing is not None and started:
+            timing.add("db", time.perf_counter() - started.pop())
+
+    @event.listens_for(engine.sync_engine, "handle_error")
+    def _error(exception_context) -> None:
+        # Без этого отметка упавшего выражения осталась бы в conn.info и сдвинула замеры следующих.
+        started = exception_context.connection.info.get("timing_started") if exception_context.connection else None
+        timing = _current.get()
+        if started:
+            elapsed = time.perf_counter() - started.pop()
+            if timing is not None:
+                timing.add("db", elapsed)
+
+
+class ServerTimingMiddleware:
+    """Добавляет к ответу заголовок Server-Timing с фазами db, kafka, log, analytics, serialize.
+
+    Подключается только при SERVER_TIMING_ENABLED, иначе фазы не собираются вовсе.
+    Запросы дольше log_threshold_ms (если он больше нуля) пишутся в лог с разбивкой.
+    """
+
+    def __init__(self, app, log_threshold_ms: float = 0.0):
+        self.app = app
+        self.log_threshold = log_threshold_ms / 1000
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timing = ServerTiming()
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                value = timing.header(time.perf_counter() - started).encode("latin-1")
+                message = {**message, "headers": [*message.get("headers", []), (b"server-timing", value)]}
+            await send(message)
+
+        token = _current.set(timing)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            total = time.perf_counter() - started
+            if self.log_threshold and total >= self.log_threshold:
+                log.warning(
+                    "Медленный запрос %s %s: %s", scope["method"], scope["path"], timing.header(total)
+                )
@@ -0,0 +1,61 @@
+"""Стоимость кодирования/декодирования и размер Kafka-конверта для каждого доступного кодека.
+
+Запуск из каталога api_gateway: python -m benchmarks.codecs --number 100000
+"""
+import argparse
+import timeit
+
+from app.codecs import available_codecs, get_codec
+from app.kafka_client import _envelope
+
+SAMPLES = {
+    "OrderCreated": _envelope(
+        "OrderCreated",
+        {
+            "order_id": 123456,
+            "item": "Ноутбук 15 дюймов",
+            "amount": 1299.99,
+            "currency": "USD",
+            "service": "order-service",
+            "correlation_id": "6f1c7a52-7d3f-4a4e-9a41-2d1c2b3a4f5e",
+        },
+        "order-service",
+    ),
+    "AnalyticsLog": _envelope(
+        "AnalyticsHttpRequested",
+        {
+            "metric": "sales",
+            "status": "ok",
+            "cache": "hit",
+            "cache_hits": 1024,
+            "cache_misses": 17,
+            "cache_coalesced": 3,
+            "cache_stale": 0,
+            "correlation_id": "0d9b2a1e-4b5c-4d6e-8f70-8192a3b4c5d6",
+        },
+        "api-gateway",
+    ),
+}
+
+
+def run(number: int) -> None:
+    print(f"{'codec':>8} {'message':>13} {'bytes':>6} {'encode, us':>11} {'decode, us':>11}")
+    for name in available_codecs():
+        codec = get_codec(name)
+        for sample_name, sample in SAMPLES.items():
+            encoded = codec.encode(sample)
+            assert codec.decode(encoded) == sample
+            encode_us = timeit.timeit(lambda: codec.encode(sample), number=number) / number * 1e6
+            decode_us = timeit.timeit(lambda: codec.decode(encoded), number=number) / number * 1e6
+            print(f"{name:>8} {sample_name:>13} {len(encoded):>6} {encode_us:>11.2f} {decode_us:>11.2f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=100_000)
+    args = parser.parse_args()
+    run(args.number)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Время страницы GET /orders на большой таблице: первая и глубокая страница, keyset против OFFSET.
+
+Запуск из каталога api_gateway: python -m benchmarks.listing --rows 1000000
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, UTC
+from pathlib import Path
+
+from sqlalchemy import insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.models import Base, Order
+from app.repositories.orders import OrderRepository
+
+STATUSES = ["created", "payment_requested", "paid", "cancelled"]
+
+
+async def _seed(session_maker: async_sessionmaker[AsyncSession], rows: int, chunk: int = 50_000) -> None:
+    started = datetime(2024, 1, 1, tzinfo=UTC)
+    for offset in range(0, rows, chunk):
+        batch = [
+            {
+                "item": f"item-{n}",
+                "amount": 10.0,
+                "currency": "USD",
+                "status": STATUSES[n % len(STATUSES)],
+                "created_at": started + timedelta(seconds=n),
+            }
+            for n in range(offset, min(offset + chunk, rows))
+        ]
+        async with session_maker() as session:
+            await session.execute(insert(Order), batch)
+            await session.commit()
+
+
+async def _median_ms(call, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await call()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+async def run(rows: int, limit: int, repeat: int, with_indexes: bool) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{Path(tmp) / 'bench.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            if not with_indexes:
+                for index in Order.__table__.indexes:
+                    await conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+        session_maker = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+        await _seed(session_maker, rows)
+
+        deep_offset = rows // len(STATUSES) * 9 // 10
+        async with session_maker() as session:
+            repo = OrderRepository(session)
+            # Курсор глубокой страницы — заказ со статусом paid примерно на 90% выборки.
+            deep_after_id = (
+                await session.execute(
+                    select(Order.id).where(Order.status == "paid").order_by(Order.created_at, Order.id).offset(deep_offset).limit(1)
+                )
+            ).scalar_one()
+
+            async def keyset(after_id):
+                return await repo.list_page(status="paid", after_id=after_id, limit=limit)
+
+            async def offset_page(offset):
+                stmt = (
+                    select(Order)
+                    .where(Order.status == "paid")
+                    .order_by(Order.created_at, Order.id)
+                    .offset(offset)
+                    .limit(limit)
+                )
+                return (await session.execute(stmt)).scalars().all()
+
+            results = [
+                ("keyset, first", await _median_ms(lambda: keyset(None), repeat)),
+                ("keyset, deep", await _median_ms(lambda: keyset(deep_after_id), repeat)),
+                ("offset, first", await _median_ms(lambda: offset_page(0), repeat)),
+                ("offset, deep", await _median_ms(lambda: offset_page(deep_offset), repeat)),
+            ]
+
+            plan_stmt = select(Order).where(Order.status == "paid").order_by(Order.created_at, Order.id).limit(limit)
+            compiled = plan_stmt.compile(engine.sync_engine, compile_kwargs={"literal_binds": True})
+            plan = (await session.execute(text(f"EXPLAIN QUERY PLAN {compiled}"))).all()
+
+        await engine.dispose()
+
+    print(f"rows={rows} limit={limit} indexes={'on' if with_indexes else 'off'}")
+    print(f"{'page':>14} {'ms':>10}")
+    for name, ms in results:
+        print(f"{name:>14} {ms:>10.2f}")
+    print("plan:", "; ".join(row[-1] for row in plan))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--no-indexes", action="store_true", help="сравнить с таблицей без составных индексов")
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.limit, args.repeat, not args.no_indexes))
+
+
+if __name__ == "__main__":
+    main()
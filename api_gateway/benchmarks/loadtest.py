@@ -0,0 +1,263 @@
+"""Нагрузочный тест шлюза в процессе: create_app() через httpx.ASGITransport, SQLite в файле, Kafka-заглушка.
+
+Запуск из каталога api_gateway:
+    python -m benchmarks.loadtest --requests 5000 --concurrency 32 --mix create=5,pay=3,analytics=2 \\
+        --kafka-latency-ms 2 --output results.json
+    python -m benchmarks.loadtest --baseline results.json --max-regression 10
+
+С --baseline результат сравнивается с сохраненным: если req/s упал или p99 какой-либо операции
+вырос больше чем на --max-regression процентов, процесс завершается с кодом 1.
+Смесь с pay без create требует --preload-orders: оплачивать нечего.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+import httpx
+
+import app.main as gateway
+from app import config
+
+OPERATIONS = ("create", "pay", "analytics")
+
+
+class LatencyKafkaPublisher:
+    """Заглушка KafkaPublisher: подтверждение брокера имитируется задержкой latency секунд."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.published = 0
+        self.logs = 0
+
+    async def _ack(self) -> None:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def publish_event(self, topic, event_type, payload, key=None, source=None, correlation_id=None) -> str:
+        await self._ack()
+        self.published += 1
+        return correlation_id or "corr-id"
+
+    async def send_event(self, topic, event_type, payload, key=None, source=None, correlation_id=None):
+        correlation_id = correlation_id or "corr-id"
+        delivery = asyncio.ensure_future(self.publish_event(topic, event_type, payload, correlation_id=correlation_id))
+        return correlation_id, delivery
+
+    async def publish_batch(self, events, correlation_ids=None) -> list[str]:
+        # Продюсер подтверждает пачку целиком, поэтому задержка одна на вызов.
+        await self._ack()
+        self.published += len(events)
+        return [c or "corr-id" for c in (correlation_ids or [None] * len(events))]
+
+    async def log_event(self, event_type: str, payload: dict) -> str:
+        # Лог-события в шлюзе уходят через буферизованный канал и запрос не ждут.
+        self.logs += 1
+        return ""
+
+    def stats(self) -> dict[str, int]:
+        return {"kafka_pending": 0, "kafka_dropped_logs": 0}
+
+    async def close(self) -> None:
+        return None
+
+
+def analytics_client(latency: float) -> httpx.AsyncClient:
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if latency:
+            await asyncio.sleep(latency)
+        limit = int(request.url.params.get("limit", 10))
+        return httpx.Response(
+            200, json={"metric": request.url.params.get("metric"), "rows": [{"n": i} for i in range(limit)]}
+        )
+
+    return httpx.AsyncClient(base_url="http://analytics.bench", transport=httpx.MockTransport(handler))
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Неизвестная операция {name!r}, ожидается одна из {OPERATIONS}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Ближайший ранг по отсортированному списку."""
+    if not values:
+        return 0.0
+    index = max(int(round(q / 100 * len(values))) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+async def run(args: argparse.Namespace) -> dict:
+    rng = random.Random(args.seed)
+    operations, weights = zip(*args.mix.items())
+    publisher = LatencyKafkaPublisher(args.kafka_latency_ms / 1000)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config.settings.database_url = f"sqlite+aiosqlite:///{Path(tmp) / 'loadtest.db'}"
+        config.settings.sqlite_profile = args.profile
+        config.settings.server_timing_enabled = False
+
+        async def create_kafka_publisher() -> LatencyKafkaPublisher:
+            return publisher
+
+        gateway.create_kafka_publisher = create_kafka_publisher
+        gateway.create_analytics_client = lambda: analytics_client(args.analytics_latency_ms / 1000)
+
+        app = gateway.create_app()
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://gateway") as client:
+                order_ids: list[int] = []
+
+                async def call(operation: str) -> tuple[str, int]:
+                    """Операция, выполненная на самом деле, и статус: pay без заказов делает create."""
+                    if operation == "pay" and order_ids:
+                        order_id = rng.choice(order_ids)
+                        resp = await client.post(f"/orders/{order_id}/pay", json={"amount": 5, "method": "card"})
+                    elif operation == "analytics":
+                        metric = rng.choice(("sales", "visits", "refunds"))
+                        resp = await client.get(f"/analytics/{metric}", params={"limit": rng.randint(1, 50)})
+                    else:
+                        operation = "create"
+                        resp = await client.post("/orders", json={"item": "bench", "amount": 5, "currency": "USD"})
+                        if resp.status_code == 200:
+                            order_ids.append(resp.json()["id"])
+                    return operation, resp.status_code
+
+                # pay уходит в create, пока заказов нет (например, все предзагрузки упали), поэтому
+                # корзины заводим для каждой операции, которую call() может выполнить, а не только для смеси.
+                timings: dict[str, list[float]] = {name: [] for name in OPERATIONS}
+                errors = {name: 0 for name in OPERATIONS}
+                failures: Counter[str] = Counter()
+
+                async def drive(total: int, record: bool) -> float:
+                    remaining = total
+
+                    async def worker() -> None:
+                        nonlocal remaining
+                        while remaining > 0:
+                            remaining -= 1
+                            operation = rng.choices(operations, weights)[0]
+                            started = time.perf_counter()
+                            try:
+                                operation, status = await call(operation)
+                                failure = f"HTTP {status}" if status >= 400 else None
+                            except Exception as exc:
+                                failure = type(exc).__name__
+                            if record:
+                                timings[operation].append((time.perf_counter() - started) * 1000)
+                                if failure is not None:
+                                    errors[operation] += 1
+                                    failures[failure] += 1
+
+                    started = time.perf_counter()
+                    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+                    return time.perf_counter() - started
+
+                # Заказы для pay создаем до замера, иначе первые pay уходили бы в create.
+                for _ in range(args.preload_orders):
+                    await call("create")
+                # Прогрев отдельно: первые запросы (пустые кеши, новые соединения) не попадают в замер.
+                await drive(args.warmup, record=False)
+                elapsed = await drive(args.requests, record=True)
+
+    all_timings = sorted(t for values in timings.values() for t in values)
+    result = {
+        "params": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "mix": args.mix,
+            "kafka_latency_ms": args.kafka_latency_ms,
+            "analytics_latency_ms": args.analytics_latency_ms,
+            "profile": args.profile,
+            "preload_orders": args.preload_orders,
+        },
+        "rps": args.requests / elapsed,
+        "elapsed_s": elapsed,
+        "operations": {},
+        "failures": dict(failures),
+    }
+    performed = [(name, values) for name, values in timings.items() if name in args.mix or values]
+    for name, values in [*performed, ("all", all_timings)]:
+        values.sort()
+        result["operations"][name] = {
+            "count": len(values),
+            "errors": sum(errors.values()) if name == "all" else errors[name],
+            "p50_ms": percentile(values, 50),
+            "p95_ms": percentile(values, 95),
+            "p99_ms": percentile(values, 99),
+        }
+    return result
+
+
+def print_result(result: dict) -> None:
+    print(f"req/s: {result['rps']:.0f} за {result['elapsed_s']:.2f} с")
+    print(f"{'operation':>10} {'count':>7} {'errors':>7} {'p50, ms':>8} {'p95, ms':>8} {'p99, ms':>8}")
+    for name, op in result["operations"].items():
+        print(
+            f"{name:>10} {op['count']:>7} {op['errors']:>7} "
+            f"{op['p50_ms']:>8.2f} {op['p95_ms']:>8.2f} {op['p99_ms']:>8.2f}"
+        )
+    if result["failures"]:
+        print("ошибки: " + ", ".join(f"{name} x{count}" for name, count in result["failures"].items()))
+
+
+def compare(result: dict, baseline: dict, max_regression: float) -> list[str]:
+    """Список регрессий больше max_regression процентов относительно baseline."""
+    regressions = []
+    change = (result["rps"] - baseline["rps"]) / baseline["rps"] * 100
+    print(f"\nreq/s: {baseline['rps']:.0f} -> {result['rps']:.0f} ({change:+.1f}%)")
+    if -change > max_regression:
+        regressions.append(f"req/s упал на {-change:.1f}%")
+    for name, op in result["operations"].items():
+        base = baseline["operations"].get(name)
+        if not base or not base["p99_ms"]:
+            continue
+        change = (op["p99_ms"] - base["p99_ms"]) / base["p99_ms"] * 100
+        print(f"{name:>10} p99: {base['p99_ms']:.2f} -> {op['p99_ms']:.2f} ms ({change:+.1f}%)")
+        if change > max_regression:
+            regressions.append(f"p99 {name} вырос на {change:.1f}%")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("create=5,pay=3,analytics=2"))
+    parser.add_argument("--kafka-latency-ms", type=float, default=1.0)
+    parser.add_argument("--analytics-latency-ms", type=float, default=5.0)
+    parser.add_argument("--profile", default="production", help="Профиль SQLite: default или production")
+    parser.add_argument("--preload-orders", type=int, default=0, help="Сколько заказов создать до замера")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", type=Path, help="Куда сохранить результат в JSON")
+    parser.add_argument("--baseline", type=Path, help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--max-regression", type=float, default=10.0, help="Допустимая регрессия, %%")
+    args = parser.parse_args()
+    if "pay" in args.mix and "create" not in args.mix and args.preload_orders <= 0:
+        parser.error("для смеси с pay без create задайте --preload-orders")
+
+    result = asyncio.run(run(args))
+    print_result(result)
+    if args.output:
+        args.output.write_text(json.dumps(result, indent=2, ensure_ascii=False))
+    if args.baseline:
+        regressions = compare(result, json.loads(args.baseline.read_text()), args.max_regression)
+        if regressions:
+            print("\nРегрессия: " + "; ".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
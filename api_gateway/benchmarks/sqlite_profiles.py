@@ -0,0 +1,91 @@
+"""Пропускная способность записи и чтения заказов в SQLite при разных профилях движка.
+
+Запуск из каталога api_gateway: python -m benchmarks.sqlite_profiles --profiles default production
+"""
+import argparse
+import asyncio
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy.exc import OperationalError
+
+from app.db import create_engine_and_sessionmaker, run_migrations
+from app.repositories.orders import OrderRepository
+
+
+class Counter:
+    def __init__(self):
+        self.ops = 0
+        self.errors = 0
+
+
+async def _writer(session_maker, counter: Counter, deadline: float) -> None:
+    while time.perf_counter() < deadline:
+        try:
+            async with session_maker() as session:
+                await OrderRepository(session).create(item="bench", amount=1.0, currency="USD")
+            counter.ops += 1
+        except OperationalError:
+            counter.errors += 1
+
+
+async def _reader(session_maker, counter: Counter, deadline: float, max_id: int) -> None:
+    while time.perf_counter() < deadline:
+        try:
+            async with session_maker() as session:
+                await OrderRepository(session).get(random.randint(1, max_id))
+            counter.ops += 1
+        except OperationalError:
+            counter.errors += 1
+
+
+async def _phase(session_maker, writers: int, readers: int, seconds: float, max_id: int) -> tuple[Counter, Counter]:
+    written, read = Counter(), Counter()
+    deadline = time.perf_counter() + seconds
+    await asyncio.gather(
+        *(_writer(session_maker, written, deadline) for _ in range(writers)),
+        *(_reader(session_maker, read, deadline, max_id) for _ in range(readers)),
+    )
+    return written, read
+
+
+async def run(profiles: list[str], writers: int, readers: int, seconds: float, seed_rows: int) -> None:
+    print(f"{'profile':>11} {'phase':>7} {'writes/s':>9} {'reads/s':>9} {'errors':>7}")
+    for profile in profiles:
+        with tempfile.TemporaryDirectory() as tmp:
+            engine, session_maker = create_engine_and_sessionmaker(
+                f"sqlite+aiosqlite:///{Path(tmp) / 'bench.db'}", profile=profile
+            )
+            await run_migrations(engine)
+            async with session_maker() as session:
+                for _ in range(seed_rows):
+                    await OrderRepository(session).create(item="seed", amount=1.0, currency="USD")
+
+            for phase, phase_writers, phase_readers in (
+                ("write", writers, 0),
+                ("read", 0, readers),
+                ("mixed", writers, readers),
+            ):
+                written, read = await _phase(session_maker, phase_writers, phase_readers, seconds, seed_rows)
+                print(
+                    f"{profile:>11} {phase:>7} {written.ops / seconds:>9.0f} {read.ops / seconds:>9.0f}"
+                    f" {written.errors + read.errors:>7}"
+                )
+            await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profiles", nargs="+", default=["default", "production"])
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--seed-rows", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(run(args.profiles, args.writers, args.readers, args.seconds, args.seed_rows))
+
+
+if __name__ == "__main__":
+    main()
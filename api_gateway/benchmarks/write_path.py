@@ -0,0 +1,77 @@
+"""Задержка и число SQL-запросов на путях записи: создание заказа, оплата, чтение платежа.
+
+Запуск из каталога api_gateway: python -m benchmarks.write_path --iterations 2000
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import event
+
+from app.db import create_engine_and_sessionmaker, run_migrations
+from app.repositories.orders import OrderRepository
+from app.repositories.payments import PaymentRepository
+
+
+async def run(iterations: int, profile: str) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, session_maker = create_engine_and_sessionmaker(
+            f"sqlite+aiosqlite:///{Path(tmp) / 'bench.db'}", profile=profile
+        )
+        await run_migrations(engine)
+
+        statements = 0
+
+        def count(*args) -> None:
+            nonlocal statements
+            statements += 1
+
+        event.listen(engine.sync_engine, "before_cursor_execute", count)
+
+        timings: dict[str, list[float]] = {"create": [], "pay": [], "get payment": []}
+        counts = {name: 0 for name in timings}
+
+        async def measure(name: str, call):
+            nonlocal statements
+            statements = 0
+            started = time.perf_counter()
+            result = await call()
+            timings[name].append((time.perf_counter() - started) * 1000)
+            counts[name] = statements
+            return result
+
+        for _ in range(iterations):
+            async with session_maker() as session:
+                order = await measure(
+                    "create", lambda: OrderRepository(session).create(item="bench", amount=1.0, currency="USD")
+                )
+            async with session_maker() as session:
+                payment = await measure(
+                    "pay",
+                    lambda: PaymentRepository(session).request_payment(order_id=order.id, amount=1.0, method="card"),
+                )
+            async with session_maker() as session:
+                await measure("get payment", lambda: PaymentRepository(session).get(payment.id))
+
+        await engine.dispose()
+
+    print(f"{'path':>12} {'statements':>11} {'p50, ms':>8} {'p95, ms':>8}")
+    for name, values in timings.items():
+        values.sort()
+        p95 = values[int(len(values) * 0.95) - 1]
+        print(f"{name:>12} {counts[name]:>11} {statistics.median(values):>8.3f} {p95:>8.3f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--profile", default="default")
+    args = parser.parse_args()
+    asyncio.run(run(args.iterations, args.profile))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.config import settings
+from app.schemas import AnalyticsRequest
+from app.services.analytics import AnalyticsCache, AnalyticsService, create_analytics_client
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_upstream_call():
+    cache = AnalyticsCache(default_ttl=60)
+    release = asyncio.Event()
+    calls = 0
+
+    async def fetch() -> dict:
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return {"rows": [1]}
+
+    payload = AnalyticsRequest(metric="sales", limit=10)
+    first = asyncio.create_task(cache.get_or_fetch(payload, fetch))
+    second = asyncio.create_task(cache.get_or_fetch(payload, fetch))
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await first == ({"rows": [1]}, "miss")
+    assert await second == ({"rows": [1]}, "coalesced")
+    assert calls == 1
+    assert await cache.get_or_fetch(payload, fetch) == ({"rows": [1]}, "hit")
+
+
+@pytest.mark.asyncio
+async def test_stale_entry_is_served_and_revalidated_in_background():
+    cache = AnalyticsCache(default_ttl=60, ttls={"sales": 0}, stale_ttl=60)
+    versions = iter([{"v": 1}, {"v": 2}])
+
+    async def fetch() -> dict:
+        return next(versions)
+
+    payload = AnalyticsRequest(metric="sales", from_ts="2024-01-01T00:00:00+00:00")
+    assert await cache.get_or_fetch(payload, fetch) == ({"v": 1}, "miss")
+    assert await cache.get_or_fetch(payload, fetch) == ({"v": 1}, "stale")
+
+    await asyncio.sleep(0)
+    data, _ = await cache.get_or_fetch(payload, fetch)
+    assert data == {"v": 2}
+    assert cache.stats() == {"cache_hits": 0, "cache_misses": 1, "cache_coalesced": 0, "cache_stale": 2}
+
+
+def test_cache_key_normalizes_timestamps():
+    a = AnalyticsRequest(metric="sales", from_ts="2024-01-01T00:00:00Z")
+    b = AnalyticsRequest(metric="sales", from_ts="2024-01-01T00:00:00+00:00")
+    assert AnalyticsCache.key(a) == AnalyticsCache.key(b)
+
+
+@pytest.mark.asyncio
+async def test_fetch_keeps_client_connect_timeout(monkeypatch):
+    monkeypatch.setattr(settings, "analytics_timeout", 7.0)
+    monkeypatch.setattr(settings, "analytics_connect_timeout", 0.5)
+    timeouts = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        timeouts.append(request.extensions["timeout"])
+        return httpx.Response(200, json={"rows": []})
+
+    client = create_analytics_client(transport=httpx.MockTransport(handler))
+    service = AnalyticsService(publisher=None, client=client)
+    try:
+        await service._fetch(AnalyticsRequest(metric="sales", limit=1))
+    finally:
+        await client.aclose()
+
+    assert timeouts[0]["connect"] == 0.5
+    assert timeouts[0]["read"] == 7.0
@@ -1,29 +1,50 @@
 import asyncio
-from types import SimpleNamespace
+import json
+from datetime import UTC, datetime, timedelta, timezone
 
 import httpx
 import pytest
 import pytest_asyncio
+from sqlalchemy import event
 
-from app.services import analytics as analytics_service
 import app.main as main
 
 from app import config
+from app.outbox import OutboxRelay
+from app.repositories.outbox import OutboxRepository
 
 
 class FakeKafkaPublisher:
     def __init__(self):
         self.events = []
         self.logs = []
+        self.batches = 0
 
-    async def publish_event(self, topic: str, event_type: str, payload: dict, key: str | None = None, source: str | None = None) -> str:
+    async def publish_event(self, topic: str, event_type: str, payload: dict, key: str | None = None, source: str | None = None, correlation_id: str | None = None) -> str:
         self.events.append({"topic": topic, "event_type": event_type, "payload": payload, "key": key, "source": source})
-        return "corr-id"
+        return correlation_id or "corr-id"
+
+    async def send_event(self, topic: str, event_type: str, payload: dict, key: str | None = None, source: str | None = None, correlation_id: str | None = None):
+        correlation_id = await self.publish_event(topic, event_type, payload, key=key, source=source, correlation_id=correlation_id)
+        delivery = asyncio.get_running_loop().create_future()
+        delivery.set_result(None)
+        return correlation_id, delivery
+
+    async def publish_batch(self, events, correlation_ids=None) -> list[str]:
+        self.batches += 1
+        correlation_ids = correlation_ids or [None] * len(events)
+        return [
+            await self.publish_event(e.topic, e.event_type, e.payload, key=e.key, source=e.source, correlation_id=c)
+            for e, c in zip(events, correlation_ids)
+        ]
 
     async def log_event(self, event_type: str, payload: dict) -> str:
         self.logs.append({"event_type": event_type, "payload": payload})
         return "log-id"
 
+    def stats(self) -> dict[str, int]:
+        return {"kafka_pending": 0, "kafka_dropped_logs": 0}
+
     async def close(self) -> None:
         return None
 
@@ -41,21 +62,52 @@ class FakeResponse:
             raise httpx.HTTPStatusError("error", request=None, response=self)
 
 
+class FakeStreamResponse:
+    def __init__(self, body: bytes, status_code: int = 200, chunk_size: int = 7):
+        self._body = body
+        self.status_code = status_code
+        self.chunk_size = chunk_size
+        self.closed = False
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise httpx.HTTPStatusError("error", request=None, response=self)
+
+    async def aiter_bytes(self):
+        for start in range(0, len(self._body), self.chunk_size):
+            yield self._body[start : start + self.chunk_size]
+
+    async def aclose(self) -> None:
+        self.closed = True
+
+
 class FakeAsyncClient:
-    def __init__(self, base_url: str, timeout: float):
+    def __init__(self, base_url: str, timeout: float | None = None, **kwargs):
         self.base_url = base_url
         self.timeout = timeout
         self.requests = []
+        self.responses = []
+        self.closed = False
 
-    async def __aenter__(self):
-        return self
+    async def get(self, path: str, params: dict | None = None, timeout: float | None = None):
+        self.requests.append({"path": path, "params": params, "timeout": timeout})
+        return FakeResponse(self._data(params))
 
-    async def __aexit__(self, exc_type, exc, tb):
-        return False
+    def build_request(self, method: str, path: str, params: dict | None = None, timeout: float | None = None):
+        return {"method": method, "path": path, "params": params, "timeout": timeout}
 
-    async def get(self, path: str, params: dict | None = None):
-        self.requests.append({"path": path, "params": params})
-        return FakeResponse({"metric": params.get("metric"), "rows": []})
+    async def send(self, request: dict, stream: bool = False):
+        self.requests.append({"path": request["path"], "params": request["params"], "timeout": request["timeout"]})
+        response = FakeStreamResponse(json.dumps(self._data(request["params"])).encode())
+        self.responses.append(response)
+        return response
+
+    @staticmethod
+    def _data(params: dict) -> dict:
+        return {"metric": params.get("metric"), "rows": [{"n": i} for i in range(params.get("limit", 0))]}
+
+    async def aclose(self) -> None:
+        self.closed = True
 
 
 @pytest_asyncio.fixture
@@ -69,9 +121,13 @@ async def test_app(monkeypatch, tmp_path):
     async def fake_create_kafka_publisher():
         return fake_publisher
 
-    # Подменяем фабрику Kafka и httpx-клиент в сервисе аналитики.
+    # Подменяем фабрику Kafka и общий httpx-клиент аналитики.
     monkeypatch.setattr(main, "create_kafka_publisher", fake_create_kafka_publisher)
-    monkeypatch.setattr(analytics_service, "httpx", SimpleNamespace(AsyncClient=FakeAsyncClient))
+    monkeypatch.setattr(
+        main,
+        "create_analytics_client",
+        lambda: FakeAsyncClient(base_url=config.settings.analytics_service_url),
+    )
 
     app = main.create_app()
     lifespan = app.router.lifespan_context(app)
@@ -80,7 +136,7 @@ async def test_app(monkeypatch, tmp_path):
     client = httpx.AsyncClient(transport=transport, base_url="http://testserver")
 
     try:
-        yield {"client": client, "publisher": fake_publisher}
+        yield {"client": client, "publisher": fake_publisher, "app": app}
     finally:
         await client.aclose()
 
@@ -134,3 +190,388 @@ async def test_analytics_http_passthrough(test_app):
     body = resp.json()
     assert body["data"]["metric"] == "sales"
     assert any(log["event_type"] == "AnalyticsHttpRequested" for log in publisher.logs)
+
+
+@pytest.mark.asyncio
+async def test_analytics_reuses_shared_client(test_app):
+    client = test_app["client"]
+    analytics_client = test_app["app"].state.analytics_client
+
+    await client.get("/analytics/sales")
+    await client.get("/analytics/visits", params={"limit": 3})
+
+    assert [r["params"]["metric"] for r in analytics_client.requests] == ["sales", "visits"]
+    # Таймауты задает сам клиент; timeout= в вызове заменил бы и connect.
+    assert analytics_client.requests[0]["timeout"] is None
+
+
+@pytest.mark.asyncio
+async def test_outbox_defers_publish_to_relay(test_app, monkeypatch):
+    client = test_app["client"]
+    publisher = test_app["publisher"]
+    app = test_app["app"]
+    monkeypatch.setattr(config.settings, "outbox_enabled", True)
+
+    await client.post("/orders", json={"item": "lamp", "amount": 7, "currency": "EUR"})
+    resp = await client.post("/orders/1/pay", json={"amount": 7, "method": "card"})
+    assert resp.status_code == 200
+    assert publisher.events == []
+
+    relay = OutboxRelay(app.state.session_maker, publisher, batch_size=10)
+    assert await relay.relay_once() == 2
+    assert await relay.relay_once() == 0
+
+    assert [e["event_type"] for e in publisher.events] == ["OrderCreated", "PaymentRequested"]
+    created_log = next(log for log in publisher.logs if log["event_type"] == "OrderCreatedLog")
+    assert created_log["payload"]["correlation_id"] != "corr-id"
+
+
+@pytest.mark.asyncio
+async def test_outbox_relays_claim_disjoint_batches_and_keep_key_order(test_app, monkeypatch):
+    client = test_app["client"]
+    app = test_app["app"]
+    monkeypatch.setattr(config.settings, "outbox_enabled", True)
+    for item in ("a", "b", "c"):
+        await client.post("/orders", json={"item": item, "amount": 1, "currency": "EUR"})
+    await client.post("/orders/1/pay", json={"amount": 1, "method": "card"})
+
+    # Relay "a" захватил первое событие заказа 1 и завис на отправке.
+    sending, gate = asyncio.Event(), asyncio.Event()
+    slow_publisher = FakeKafkaPublisher()
+    send_event = slow_publisher.send_event
+
+    async def blocked_send_event(*args, **kwargs):
+        sending.set()
+        await gate.wait()
+        return await send_event(*args, **kwargs)
+
+    slow_publisher.send_event = blocked_send_event
+    relay_a = OutboxRelay(app.state.session_maker, slow_publisher, batch_size=1, relay_id="a")
+    task_a = asyncio.create_task(relay_a.relay_once())
+    await asyncio.wait_for(sending.wait(), timeout=1)
+
+    # Relay "b" берет остальное, кроме оплаты заказа 1: ее раньше времени отправлять нельзя.
+    publisher_b = FakeKafkaPublisher()
+    relay_b = OutboxRelay(app.state.session_maker, publisher_b, batch_size=10, relay_id="b")
+    assert await relay_b.relay_once() == 2
+    assert [e["key"] for e in publisher_b.events] == ["2", "3"]
+
+    gate.set()
+    assert await task_a == 1
+    assert await relay_b.relay_once() == 1
+    assert await relay_b.relay_once() == 0
+    assert [e["key"] for e in slow_publisher.events] == ["1"]
+    assert [e["event_type"] for e in publisher_b.events] == ["OrderCreated", "OrderCreated", "PaymentRequested"]
+
+
+@pytest.mark.asyncio
+async def test_outbox_stale_claim_is_taken_over(test_app, monkeypatch):
+    client = test_app["client"]
+    app = test_app["app"]
+    monkeypatch.setattr(config.settings, "outbox_enabled", True)
+    await client.post("/orders", json={"item": "lamp", "amount": 7, "currency": "EUR"})
+
+    # Relay "dead" захватил пачку и пропал, не отправив ее.
+    async with app.state.session_maker() as session:
+        now = datetime.now(UTC)
+        assert await OutboxRepository(session).claim_batch("dead", 10, now, now) == 1
+        await session.commit()
+
+    publisher = FakeKafkaPublisher()
+    assert await OutboxRelay(app.state.session_maker, publisher, relay_id="b").relay_once() == 0
+    assert await OutboxRelay(app.state.session_maker, publisher, claim_timeout=0, relay_id="b").relay_once() == 1
+    assert [e["event_type"] for e in publisher.events] == ["OrderCreated"]
+
+
+@pytest.mark.asyncio
+async def test_analytics_repeated_request_served_from_cache(test_app):
+    client = test_app["client"]
+    publisher = test_app["publisher"]
+    analytics_client = test_app["app"].state.analytics_client
+
+    for _ in range(3):
+        resp = await client.get("/analytics/sales", params={"limit": 5})
+        assert resp.status_code == 200
+
+    assert len(analytics_client.requests) == 1
+    analytics_logs = [log["payload"] for log in publisher.logs if log["event_type"] == "AnalyticsHttpRequested"]
+    assert [entry["cache"] for entry in analytics_logs] == ["miss", "hit", "hit"]
+    assert analytics_logs[-1]["cache_hits"] == 2
+
+
+@pytest.mark.asyncio
+async def test_analytics_streaming_modes(test_app):
+    client = test_app["client"]
+    publisher = test_app["publisher"]
+
+    resp = await client.get("/analytics/sales", params={"limit": 3, "stream": "json"})
+    assert resp.status_code == 200
+    assert resp.json()["data"]["rows"] == [{"n": 0}, {"n": 1}, {"n": 2}]
+
+    resp = await client.get("/analytics/sales", params={"limit": 3, "stream": "ndjson"})
+    assert resp.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in resp.text.splitlines()] == [{"n": 0}, {"n": 1}, {"n": 2}]
+
+    # Потоковый режим идет мимо кеша: каждый запрос уходит в upstream.
+    analytics_client = test_app["app"].state.analytics_client
+    assert len(analytics_client.requests) == 2
+    assert [response.closed for response in analytics_client.responses] == [True, True]
+    streamed = [log["payload"]["stream"] for log in publisher.logs if log["event_type"] == "AnalyticsHttpRequested"]
+    assert streamed == ["json", "ndjson"]
+
+
+@pytest.mark.asyncio
+async def test_create_orders_batch_reports_invalid_items(test_app):
+    client = test_app["client"]
+    publisher = test_app["publisher"]
+
+    resp = await client.post(
+        "/orders:batch",
+        json=[
+            {"item": "book", "amount": 10, "currency": "USD"},
+            {"item": "pen", "amount": -1, "currency": "USD"},
+            {"item": "mug", "amount": 3, "currency": "EUR"},
+            "not-an-order",
+        ],
+    )
+    assert resp.status_code == 200
+    body = resp.json()
+    assert (body["created"], body["failed"]) == (2, 2)
+    assert [(i["index"], i["id"], i["status"]) for i in body["items"]] == [
+        (0, 1, "created"),
+        (1, None, "invalid"),
+        (2, 2, "created"),
+        (3, None, "invalid"),
+    ]
+    assert body["items"][1]["errors"][0]["loc"] == ["amount"]
+    assert body["items"][3]["errors"][0]["type"] == "model_type"
+
+    assert publisher.batches == 1
+    assert [(e["event_type"], e["key"]) for e in publisher.events] == [("OrderCreated", "1"), ("OrderCreated", "2")]
+    assert publisher.events[1]["payload"]["item"] == "mug"
+
+
+@pytest.mark.asyncio
+async def test_create_orders_batch_size_limit(test_app, monkeypatch):
+    monkeypatch.setattr(config.settings, "orders_batch_max_size", 2)
+    resp = await test_app["client"].post("/orders:batch", json=[{"item": "a", "amount": 1, "currency": "USD"}] * 3)
+    assert resp.status_code == 413
+
+
+@pytest.mark.asyncio
+async def test_get_order_etag_and_invalidation_on_payment(test_app):
+    client = test_app["client"]
+    read_cache = test_app["app"].state.read_cache
+
+    await client.post("/orders", json={"item": "lamp", "amount": 7, "currency": "EUR"})
+    resp = await client.get("/orders/1")
+    assert resp.status_code == 200
+    assert resp.json()["status"] == "created"
+    etag = resp.headers["etag"]
+
+    resp = await client.get("/orders/1", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+    assert resp.headers["etag"] == etag
+    assert read_cache.hits == 1
+
+    pay = await client.post("/orders/1/pay", json={"amount": 7, "method": "card"})
+    resp = await client.get("/orders/1", headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.json()["status"] == "payment_requested"
+    assert resp.headers["etag"] != etag
+
+    payment = await client.get(f"/payments/{pay.json()['id']}")
+    assert payment.json()["order_id"] == 1
+
+    assert (await client.get("/orders/999")).status_code == 404
+    assert (await client.get("/payments/999")).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_list_orders_keyset_pagination(test_app):
+    client = test_app["client"]
+    for item in ["a", "b", "c", "d", "e"]:
+        await client.post("/orders", json={"item": item, "amount": 1, "currency": "USD"})
+    await client.post("/orders/2/pay", json={"amount": 1, "method": "card"})
+
+    pages, after_id = [], None
+    while True:
+        params = {"limit": 2} | ({"after_id": after_id} if after_id else {})
+        body = (await client.get("/orders", params=params)).json()
+        pages.append([order["item"] for order in body["items"]])
+        after_id = body["next_after_id"]
+        if after_id is None:
+            break
+    assert pages == [["a", "b"], ["c", "d"], ["e"]]
+
+    created = (await client.get("/orders", params={"status": "created", "limit": 10})).json()
+    assert [order["id"] for order in created["items"]] == [1, 3, 4, 5]
+    # created_at вычисляется на каждую строку, а не один раз при импорте модуля.
+    assert len({order["created_at"] for order in created["items"]}) == 4
+
+    resp = await client.get("/orders", params={"after_id": 999})
+    assert resp.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_list_orders_since_with_utc_offset(test_app):
+    client = test_app["client"]
+    await client.post("/orders", json={"item": "a", "amount": 1, "currency": "USD"})
+
+    # Тот же момент в UTC+03:00: без приведения к UTC строки сравнивались бы по локальному времени.
+    offset = timezone(timedelta(hours=3))
+    past = (datetime.now(UTC) - timedelta(minutes=1)).astimezone(offset).isoformat()
+    future = (datetime.now(UTC) + timedelta(minutes=1)).astimezone(offset).isoformat()
+
+    assert len((await client.get("/orders", params={"since": past})).json()["items"]) == 1
+    assert (await client.get("/orders", params={"since": future})).json()["items"] == []
+
+
+@pytest.mark.asyncio
+async def test_write_paths_issue_minimal_statements(test_app):
+    client = test_app["client"]
+    statements = []
+
+    def listener(conn, cursor, statement, *args):
+        statements.append(statement.split()[0])
+
+    engine = test_app["app"].state.engine
+    event.listen(engine.sync_engine, "before_cursor_execute", listener)
+    try:
+        await client.post("/orders", json={"item": "lamp", "amount": 7, "currency": "EUR"})
+        assert statements == ["INSERT"]
+
+        statements.clear()
+        resp = await client.post("/orders/1/pay", json={"amount": 7, "method": "card"})
+        assert statements == ["UPDATE", "INSERT"]
+
+        statements.clear()
+        await client.get(f"/payments/{resp.json()['id']}")
+        assert statements == ["SELECT"]
+
+        statements.clear()
+        assert (await client.post("/orders/42/pay", json={"amount": 7, "method": "card"})).status_code == 404
+        assert statements == ["UPDATE"]
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", listener)
+
+
+@pytest.mark.asyncio
+async def test_idempotency_key_replays_and_coalesces(test_app):
+    client = test_app["client"]
+    publisher = test_app["publisher"]
+    store = test_app["app"].state.idempotency_store
+    order = {"item": "lamp", "amount": 7, "currency": "EUR"}
+
+    first, second = await asyncio.gather(
+        client.post("/orders", json=order, headers={"Idempotency-Key": "k-1"}),
+        client.post("/orders", json=order, headers={"Idempotency-Key": "k-1"}),
+    )
+    assert first.json() == second.json() == {"id": 1, "status": "created"}
+    assert len(publisher.events) == 1
+
+    # Ответ переживает вытеснение из LRU: достается из таблицы.
+    store._cache.clear()
+    replay = await client.post("/orders", json=order, headers={"Idempotency-Key": "k-1"})
+    assert replay.json() == {"id": 1, "status": "created"}
+    assert replay.headers["idempotent-replayed"] == "true"
+
+    conflict = await client.post("/orders", json={**order, "amount": 8}, headers={"Idempotency-Key": "k-1"})
+    assert conflict.status_code == 422
+
+    pay = {"amount": 7, "method": "card"}
+    pays = [await client.post("/orders/1/pay", json=pay, headers={"Idempotency-Key": "p-1"}) for _ in range(2)]
+    assert pays[0].json() == pays[1].json()
+    assert [e["event_type"] for e in publisher.events] == ["OrderCreated", "PaymentRequested"]
+
+    # Без ключа — обычное поведение.
+    await client.post("/orders", json=order)
+    assert len(publisher.events) == 3
+
+
+@pytest.mark.asyncio
+async def test_idempotency_save_failure_keeps_the_response(test_app, monkeypatch):
+    store = test_app["app"].state.idempotency_store
+
+    async def failing_save(key, stored):
+        raise RuntimeError("db is down")
+
+    monkeypatch.setattr(store, "save", failing_save)
+    order = {"item": "lamp", "amount": 7, "currency": "EUR"}
+    resp = await test_app["client"].post("/orders", json=order, headers={"Idempotency-Key": "k-2"})
+
+    assert resp.status_code == 200
+    assert store.inflight == {}
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_reports_routes_db_and_kafka(test_app):
+    client = test_app["client"]
+
+    await client.post("/orders", json={"item": "toy", "amount": 5, "currency": "USD"})
+    await client.get("/orders/1")
+    await client.get("/analytics/sales")
+
+    resp = await client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    lines = resp.text.splitlines()
+    assert 'gateway_http_requests_total{method="GET",route="/orders/{order_id}",status="200"} 1' in lines
+    assert 'gateway_http_request_duration_seconds_count{method="POST",route="/orders"} 1' in lines
+    assert 'gateway_http_request_db_seconds_count{method="POST",route="/orders"} 1' in lines
+    assert 'gateway_analytics_upstream_duration_seconds_count{outcome="ok"} 1' in lines
+    # Сам /metrics еще в обработке в момент выгрузки.
+    assert "gateway_http_requests_in_flight 1" in lines
+    assert 'gateway_component_stat{name="read_cache_misses"} 1' in lines
+
+
+@pytest.fixture
+def server_timing_on(monkeypatch):
+    monkeypatch.setattr(config.settings, "server_timing_enabled", True)
+
+
+@pytest.mark.asyncio
+async def test_server_timing_header_breaks_down_request(server_timing_on, test_app):
+    client = test_app["client"]
+
+    resp = await client.post("/orders", json={"item": "toy", "amount": 5, "currency": "USD"})
+    phases = {part.split(";")[0]: part for part in resp.headers["server-timing"].split(", ")}
+    # db попадает в заголовок, значит contextvar доходит до greenlet, где SQLAlchemy шлет события.
+    assert {"db", "app", "total"} <= set(phases)
+    assert 'desc="1x"' in phases["db"]
+
+    resp = await client.get("/orders/1")
+    assert "serialize;dur=" in resp.headers["server-timing"]
+    resp = await client.get("/analytics/sales")
+    assert "analytics;dur=" in resp.headers["server-timing"]
+
+
+@pytest.mark.asyncio
+async def test_server_timing_is_off_by_default(test_app):
+    resp = await test_app["client"].post("/orders", json={"item": "toy", "amount": 5, "currency": "USD"})
+    assert "server-timing" not in resp.headers
+
+
+@pytest.mark.asyncio
+async def test_server_timing_drops_start_mark_of_failed_statement():
+    from sqlalchemy import text
+    from sqlalchemy.exc import OperationalError
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    from app.timing import ServerTiming, _current, instrument_engine
+
+    engine = create_async_engine("sqlite+aiosqlite://")
+    instrument_engine(engine)
+    timing = ServerTiming()
+    token = _current.set(timing)
+    try:
+        async with engine.connect() as conn:
+            with pytest.raises(OperationalError):
+                await conn.execute(text("SELECT * FROM missing_table"))
+            assert conn.sync_connection.info["timing_started"] == []
+            await conn.execute(text("SELECT 1"))
+    finally:
+        _current.reset(token)
+        await engine.dispose()
+
+    assert timing.phases["db"][1] == 2
@@ -0,0 +1,132 @@
+import asyncio
+import json
+
+import pytest
+
+from app.codecs import get_codec
+from app.kafka_client import KafkaPublisher
+
+
+class FakeProducer:
+    """Продюсер, у которого доставкой управляет тест."""
+
+    def __init__(self):
+        self.sent = []
+        self.deliveries = []
+        self.stopped = False
+
+    async def send(self, topic: str, value: bytes, key: bytes | None = None, **kwargs):
+        delivery = asyncio.get_running_loop().create_future()
+        self.sent.append({"topic": topic, "value": json.loads(value), "key": key, **kwargs})
+        self.deliveries.append(delivery)
+        return delivery
+
+    async def send_and_wait(self, topic: str, value: bytes, key: bytes | None = None, **kwargs):
+        delivery = await self.send(topic, value, key=key, **kwargs)
+        delivery.set_result(None)
+        return await delivery
+
+    async def stop(self) -> None:
+        self.stopped = True
+
+
+@pytest.mark.asyncio
+async def test_pipelined_log_event_does_not_wait_for_broker():
+    producer = FakeProducer()
+    publisher = KafkaPublisher(producer, pipelined=True)
+
+    correlation_id = await asyncio.wait_for(publisher.log_event("SomethingHappened", {"a": 1}), timeout=1)
+
+    assert correlation_id
+    assert producer.sent[0]["value"]["event_type"] == "SomethingHappened"
+    assert not producer.deliveries[0].done()
+
+    producer.deliveries[0].set_result(None)
+    await publisher.close()
+    assert producer.stopped is True
+
+
+@pytest.mark.asyncio
+async def test_pipelined_publish_event_waits_for_delivery():
+    producer = FakeProducer()
+    publisher = KafkaPublisher(producer, pipelined=True)
+
+    task = asyncio.create_task(publisher.publish_event("orders", "OrderCreated", {"order_id": 1}, key="1"))
+    await asyncio.sleep(0)
+    assert producer.sent[0]["key"] == b"1"
+    assert not task.done()
+
+    producer.deliveries[0].set_result(None)
+    correlation_id = await asyncio.wait_for(task, timeout=1)
+    assert producer.sent[0]["value"]["payload"]["correlation_id"] == correlation_id
+
+
+@pytest.mark.asyncio
+async def test_pipelined_log_event_dropped_when_window_is_full():
+    producer = FakeProducer()
+    publisher = KafkaPublisher(producer, pipelined=True, max_in_flight=1)
+
+    await publisher.log_event("First", {})
+    assert await publisher.log_event("Second", {}) == ""
+
+    assert len(producer.sent) == 1
+    assert publisher.dropped_logs == 1
+
+    producer.deliveries[0].set_result(None)
+    await asyncio.sleep(0)
+    await publisher.log_event("Third", {})
+    assert len(producer.sent) == 2
+
+
+@pytest.mark.asyncio
+async def test_publisher_encodes_with_codec_and_sets_content_type():
+    producer = FakeProducer()
+    publisher = KafkaPublisher(producer, codec=get_codec("orjson"))
+
+    await publisher.publish_event("orders", "OrderCreated", {"item": "книга"}, key="1")
+
+    sent = producer.sent[0]
+    assert sent["headers"] == [("content-type", b"application/json")]
+    assert sent["value"]["payload"]["item"] == "книга"
+
+
+@pytest.mark.asyncio
+async def test_publisher_records_latency_and_delivery_errors():
+    from app.metrics import GatewayMetrics
+
+    producer = FakeProducer()
+    publisher = KafkaPublisher(producer, pipelined=True)
+    publisher.metrics = metrics = GatewayMetrics()
+
+    _, ok = await publisher.send_event("orders", "OrderCreated", {"order_id": 1})
+    _, failed = await publisher.send_event("orders", "OrderCreated", {"order_id": 2})
+    producer.deliveries[0].set_result(None)
+    producer.deliveries[1].set_exception(RuntimeError("broker down"))
+    await publisher.flush()
+
+    assert metrics.kafka_publish_duration.labels("orders").counts[-1] == 0
+    assert sum(metrics.kafka_publish_duration.labels("orders").counts) == 2
+    assert metrics.kafka_publish_errors.value("orders") == 1
+    assert publisher.stats()["kafka_pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_server_timing_splits_kafka_and_log_phases():
+    import httpx
+
+    from app.timing import ServerTimingMiddleware
+
+    publisher = KafkaPublisher(FakeProducer())
+
+    async def endpoint(scope, receive, send):
+        await publisher.publish_event("orders", "OrderCreated", {"order_id": 1})
+        await publisher.log_event("OrderCreatedLog", {"order_id": 1})
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    transport = httpx.ASGITransport(app=ServerTimingMiddleware(endpoint))
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+        resp = await client.get("/")
+
+    names = [part.split(";")[0] for part in resp.headers["server-timing"].split(", ")]
+    assert names == ["kafka", "log", "app", "total"]
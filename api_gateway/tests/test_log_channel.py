@@ -0,0 +1,70 @@
+import asyncio
+import itertools
+
+import pytest
+
+from app.kafka_client import KafkaPublisher
+from app.log_channel import LogChannel
+
+
+class RecordingSink:
+    def __init__(self, fail: bool = False):
+        self.batches = []
+        self.fail = fail
+
+    async def __call__(self, batch: dict) -> None:
+        if self.fail:
+            raise RuntimeError("logs topic unavailable")
+        self.batches.append(batch)
+
+
+@pytest.mark.asyncio
+async def test_sampling_and_overflow_are_counted():
+    sink = RecordingSink()
+    # Детерминированный rng: 0.0, 0.5, 0.0, 0.5 ... — доля 0.25 пропускает только нули.
+    rng = itertools.cycle([0.0, 0.5]).__next__
+    channel = LogChannel(sink, capacity=3, batch_size=10, sample_rates={"Noisy": 0.25}, rng=rng)
+
+    assert [channel.emit("Noisy", {"n": n}) for n in range(4)] == [True, False, True, False]
+    assert channel.emit("OrderCreatedLog", {}) is True
+    assert channel.emit("OrderCreatedLog", {}) is False
+
+    await channel.flush()
+    batch = sink.batches[0]
+    assert batch["count"] == 3
+    assert batch["by_type"] == {"Noisy": 2, "OrderCreatedLog": 1}
+    assert (batch["dropped"], batch["sampled_out"]) == (1, 2)
+    assert channel.stats() == {"buffered": 0, "dropped": 1, "sampled_out": 2, "sent": 3, "failed": 0}
+
+
+@pytest.mark.asyncio
+async def test_background_flush_on_size_and_time():
+    sink = RecordingSink()
+    channel = LogChannel(sink, batch_size=2, flush_interval=0.05)
+    channel.start()
+    try:
+        channel.emit("A", {})
+        channel.emit("A", {})
+        await asyncio.sleep(0.01)
+        assert [b["count"] for b in sink.batches] == [2]
+
+        channel.emit("B", {})
+        await asyncio.sleep(0.1)
+        assert [b["count"] for b in sink.batches] == [2, 1]
+    finally:
+        await channel.stop()
+
+
+@pytest.mark.asyncio
+async def test_publisher_log_event_never_waits_for_failing_logs_topic():
+    class HangingProducer:
+        async def send_and_wait(self, *args, **kwargs):
+            await asyncio.Event().wait()
+
+    publisher = KafkaPublisher(HangingProducer())
+    sink = RecordingSink(fail=True)
+    publisher.log_channel = LogChannel(sink, batch_size=1)
+
+    await asyncio.wait_for(publisher.log_event("OrderCreatedLog", {"order_id": 1}), timeout=0.1)
+    await publisher.log_channel.flush()
+    assert publisher.log_channel.stats()["failed"] == 1
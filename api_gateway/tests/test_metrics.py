@@ -0,0 +1,22 @@
+from app.metrics import Counter, Gauge, Histogram, MetricsRegistry
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.register(Histogram("latency_seconds", "Латентность", ("route",), buckets=(0.1, 1.0)))
+    counter = registry.register(Counter("errors_total", "Ошибки", ("topic",)))
+    registry.register(Gauge("queue_size", "Очередь", ("name",), collect=lambda: {("logs",): 3}))
+
+    for value in (0.05, 0.1, 0.5, 7.0):
+        histogram.observe(value, "/orders/{order_id}")
+    counter.inc('a"b')
+
+    lines = registry.render().splitlines()
+    assert "# TYPE latency_seconds histogram" in lines
+    assert 'latency_seconds_bucket{route="/orders/{order_id}",le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{route="/orders/{order_id}",le="1.0"} 3' in lines
+    assert 'latency_seconds_bucket{route="/orders/{order_id}",le="+Inf"} 4' in lines
+    assert 'latency_seconds_sum{route="/orders/{order_id}"} 7.65' in lines
+    assert 'latency_seconds_count{route="/orders/{order_id}"} 4' in lines
+    assert 'errors_total{topic="a\\"b"} 1' in lines
+    assert 'queue_size{name="logs"} 3' in lines
@@ -0,0 +1,35 @@
+import json
+
+import pytest
+
+from app.streaming import iter_ndjson_rows
+
+
+async def _chunks(body: bytes, size: int):
+    for start in range(0, len(body), size):
+        yield body[start : start + size]
+
+
+async def _collect(body: bytes, size: int) -> list[bytes]:
+    return [line async for line in iter_ndjson_rows(_chunks(body, size))]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("size", [1, 3, 1024])
+async def test_iter_ndjson_rows_splits_rows_across_chunks(size):
+    rows = [{"n": 1, "name": "заказ ]"}, 12.5, [1, {"rows": []}], None, 'x\\"y']
+    body = json.dumps({"metric": "sales", "rows": rows, "total": 5}, ensure_ascii=False, indent=2).encode()
+
+    lines = await _collect(body, size)
+
+    assert [json.loads(line) for line in lines] == rows
+    assert all(line.endswith(b"\n") and line.count(b"\n") == 1 for line in lines)
+
+
+@pytest.mark.asyncio
+async def test_iter_ndjson_rows_without_rows_and_truncated_body():
+    assert await _collect(b'{"metric": "sales"}', 4) == []
+    assert await _collect(b'{"rows": []}', 4) == []
+
+    with pytest.raises(ValueError):
+        await _collect(b'{"rows": [{"n": 1}, {"n": 2', 4)
@@ -1,29 +1,166 @@
+import logging
+from datetime import UTC, datetime, timedelta
+from typing import Awaitable, Callable
+
 from orders_service.domain import commands, events
 from orders_service.domain.errors import OrderAlreadyExists, OrderNotFound
-from orders_service.domain.ports import EventPublisher
-from orders_service.domain.uow import UoWFactory
+from orders_service.domain.models import OrderEventRecord
+from orders_service.domain.ports import EventPublisher, ProcessedCommandCache
+from orders_service.domain.uow import OrderUnitOfWork, UoWFactory
+
+log = logging.getLogger("order_service.service")
+
+CommandApplier = Callable[[OrderUnitOfWork, dict], Awaitable[OrderEventRecord]]
 
 
 class OrderCommandService:
-    """Бизнес-логика обработки команд заказов. Работает только через UoW и репозитории."""
+    """Бизнес-логика обработки команд заказов. Работает только через UoW и репозитории.
+
+    Команды с command_id применяются не более одного раза: id пишется в processed_commands
+    в той же транзакции, что и событие, вместе с самим событием. Повтор, найденный в таблице,
+    публикует сохраненные события заново: процесс мог упасть между коммитом и публикацией.
+    Повтор, известный кешу processed, отбрасывается еще до открытия UoW — в кеш команда
+    попадает только после публикации.
+    """
 
-    def __init__(self, uow_factory: UoWFactory, publisher: EventPublisher):
+    def __init__(
+        self,
+        uow_factory: UoWFactory,
+        publisher: EventPublisher,
+        processed: ProcessedCommandCache | None = None,
+    ):
         self.uow_factory = uow_factory
         self.publisher = publisher
+        self.processed = processed
+        self.duplicates = 0
+        self._appliers: dict[str, CommandApplier] = {
+            commands.CREATE_ORDER: self._apply_create,
+            commands.CANCEL_ORDER: self._apply_cancel,
+            commands.MARK_PAID: self._apply_mark_paid,
+            commands.SHIP_ORDER: self._apply_ship,
+        }
 
     async def handle_command(self, command: dict) -> None:
-        cmd_type = command.get("type")
-        if cmd_type == commands.CREATE_ORDER:
-            await self._handle_create(command)
-        elif cmd_type == commands.CANCEL_ORDER:
-            await self._handle_cancel(command)
-        elif cmd_type == commands.MARK_PAID:
-            await self._handle_mark_paid(command)
-        elif cmd_type == commands.SHIP_ORDER:
-            await self._handle_ship(command)
-        # Неизвестные команды игнорируем, но можно залогировать снаружи.
-
-    async def _handle_create(self, cmd: dict) -> None:
+        applier = self._appliers.get(command.get("type"))
+        if applier is None:
+            # Неизвестные команды игнорируем, но можно залогировать снаружи.
+            return
+        if self._seen(command):
+            return
+
+        committed = False
+        try:
+            async with self.uow_factory() as uow:
+                produced = await self._apply_once(uow, applier, command)
+                await uow.commit()
+                committed = True
+        except Exception:
+            if not committed:
+                raise
+            # Транзакция уже закоммичена, упало закрытие сессии: команда применена, событие надо отдать.
+            log.warning("Ошибка после коммита команды %s", command.get("type"), exc_info=True)
+
+        for event in produced:
+            await self.publisher.publish_event(event.type, event.order_id, event.payload)
+        self._remember(command)
+
+    async def handle_batch(self, batch: list[dict]) -> list[Exception | None]:
+        """Применяет пачку команд в одной транзакции (group commit).
+
+        Каждая команда выполняется в своем savepoint, поэтому ошибка откатывает только ее.
+        События публикуются одной пачкой после общего коммита. Возвращает ошибку
+        (или None) для каждой команды в порядке пачки.
+        """
+        results: list[Exception | None] = []
+        pending: list[OrderEventRecord] = []
+        applied: list[dict] = []
+        applied_ids: set[str] = set()
+        committed = False
+        try:
+            async with self.uow_factory() as uow:
+                for command in batch:
+                    applier = self._appliers.get(command.get("type"))
+                    if applier is None or self._seen(command):
+                        results.append(None)
+                        continue
+                    command_id = command.get(commands.COMMAND_ID)
+                    if command_id is not None and str(command_id) in applied_ids:
+                        # Повтор внутри пачки: события первой копии и так уйдут в pending.
+                        self.duplicates += 1
+                        results.append(None)
+                        continue
+                    try:
+                        async with uow.savepoint():
+                            produced = await self._apply_once(uow, applier, command)
+                    except Exception as exc:
+                        results.append(exc)
+                        continue
+                    applied.append(command)
+                    if command_id is not None:
+                        applied_ids.add(str(command_id))
+                    pending.extend(produced)
+                    results.append(None)
+                await uow.commit()
+                committed = True
+        except Exception:
+            if not committed:
+                # Общая транзакция не прошла целиком — применяем команды по одной.
+                return await self._handle_one_by_one(batch)
+            # Пачка уже закоммичена, упало закрытие сессии. Повтор по одной задвоил бы события,
+            # а проброс ошибки потерял бы их: consumer все равно закоммитит оффсеты. Считаем успехом.
+            log.warning("Ошибка после коммита пачки из %s команд", len(batch), exc_info=True)
+
+        if pending:
+            await self.publisher.publish_events(pending)
+        for command in applied:
+            self._remember(command)
+        return results
+
+    async def purge_processed(self, ttl: float) -> int:
+        """Удаляет из processed_commands отметки старше ttl секунд; возвращает число строк."""
+        async with self.uow_factory() as uow:
+            purged = await uow.processed.purge(datetime.now(UTC) - timedelta(seconds=ttl))
+            await uow.commit()
+        return purged
+
+    async def _handle_one_by_one(self, batch: list[dict]) -> list[Exception | None]:
+        results: list[Exception | None] = []
+        for command in batch:
+            try:
+                await self.handle_command(command)
+            except Exception as exc:
+                results.append(exc)
+            else:
+                results.append(None)
+        return results
+
+    async def _apply_once(
+        self, uow: OrderUnitOfWork, applier: CommandApplier, command: dict
+    ) -> list[OrderEventRecord]:
+        """Применяем команду, если ее id еще не встречался; для повтора — ее сохраненные события."""
+        command_id = command.get(commands.COMMAND_ID)
+        if command_id is None:
+            return [await applier(uow, command)]
+        if not await uow.processed.mark_processed(str(command_id)):
+            self.duplicates += 1
+            return await uow.processed.load_events(str(command_id))
+        event = await applier(uow, command)
+        await uow.processed.record_events(str(command_id), [event])
+        return [event]
+
+    def _seen(self, command: dict) -> bool:
+        command_id = command.get(commands.COMMAND_ID)
+        if command_id is None or self.processed is None or str(command_id) not in self.processed:
+            return False
+        self.duplicates += 1
+        return True
+
+    def _remember(self, command: dict) -> None:
+        command_id = command.get(commands.COMMAND_ID)
+        if command_id is not None and self.processed is not None:
+            self.processed.add(str(command_id))
+
+    async def _apply_create(self, uow: OrderUnitOfWork, cmd: dict) -> OrderEventRecord:
         order_id = str(cmd["order_id"])
         payload = {
             "order_id": order_id,
@@ -31,51 +168,39 @@ class OrderCommandService:
             "amount": cmd.get("amount"),
             "currency": cmd.get("currency"),
         }
-        async with self.uow_factory() as uow:
-            existing = await uow.state.get_state(order_id)
-            if existing:
-                raise OrderAlreadyExists(f"Заказ {order_id} уже создан")
-            await uow.events.append_event(order_id, events.ORDER_CREATED, payload)
-            await uow.state.upsert_state(order_id, status="created")
-            await uow.commit()
-
-        await self.publisher.publish_event(events.ORDER_CREATED, order_id, payload)
+        existing = await uow.state.get_state(order_id)
+        if existing:
+            raise OrderAlreadyExists(f"Заказ {order_id} уже создан")
+        await uow.events.append_event(order_id, events.ORDER_CREATED, payload)
+        await uow.state.upsert_state(order_id, status="created")
+        return OrderEventRecord(order_id=order_id, type=events.ORDER_CREATED, payload=payload)
 
-    async def _handle_cancel(self, cmd: dict) -> None:
+    async def _apply_cancel(self, uow: OrderUnitOfWork, cmd: dict) -> OrderEventRecord:
         order_id = str(cmd["order_id"])
         payload = {"order_id": order_id, "reason": cmd.get("reason")}
-        async with self.uow_factory() as uow:
-            state = await uow.state.get_state(order_id)
-            if not state:
-                raise OrderNotFound(f"Заказ {order_id} не найден")
-            await uow.events.append_event(order_id, events.ORDER_CANCELLED, payload)
-            await uow.state.upsert_state(order_id, status="cancelled")
-            await uow.commit()
-
-        await self.publisher.publish_event(events.ORDER_CANCELLED, order_id, payload)
+        return await self._apply_transition(uow, order_id, events.ORDER_CANCELLED, "cancelled", payload)
 
-    async def _handle_mark_paid(self, cmd: dict) -> None:
+    async def _apply_mark_paid(self, uow: OrderUnitOfWork, cmd: dict) -> OrderEventRecord:
         order_id = str(cmd["order_id"])
         payload = {"order_id": order_id, "paid_at": cmd.get("paid_at")}
-        async with self.uow_factory() as uow:
-            state = await uow.state.get_state(order_id)
-            if not state:
-                raise OrderNotFound(f"Заказ {order_id} не найден")
-            await uow.events.append_event(order_id, events.ORDER_PAID, payload)
-            await uow.state.upsert_state(order_id, status="paid")
-            await uow.commit()
+        return await self._apply_transition(uow, order_id, events.ORDER_PAID, "paid", payload)
 
-        await self.publisher.publish_event(events.ORDER_PAID, order_id, payload)
-
-    async def _handle_ship(self, cmd: dict) -> None:
+    async def _apply_ship(self, uow: OrderUnitOfWork, cmd: dict) -> OrderEventRecord:
         order_id = str(cmd["order_id"])
         payload = {"order_id": order_id, "shipped_at": cmd.get("shipped_at")}
-        async with self.uow_factory() as uow:
-            state = await uow.state.get_state(order_id)
-            if not state:
-                raise OrderNotFound(f"Заказ {order_id} не найден")
-            await uow.events.append_event(order_id, events.ORDER_SHIPPED, payload)
-            await uow.state.upsert_state(order_id, status="shipped")
-            await uow.commit()
+        return await self._apply_transition(uow, order_id, events.ORDER_SHIPPED, "shipped", payload)
 
-        await self.publisher.publish_event(events.ORDER_SHIPPED, order_id, payload)
+    async def _apply_transition(
+        self,
+        uow: OrderUnitOfWork,
+        order_id: str,
+        event_type: str,
+        status: str,
+        payload: dict,
+    ) -> OrderEventRecord:
+        state = await uow.state.get_state(order_id)
+        if not state:
+            raise OrderNotFound(f"Заказ {order_id} не найден")
+        await uow.events.append_event(order_id, event_type, payload)
+        await uow.state.upsert_state(order_id, status=status)
+        return OrderEventRecord(order_id=order_id, type=event_type, payload=payload)
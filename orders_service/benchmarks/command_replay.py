@@ -0,0 +1,277 @@
+"""Прогон синтетического потока команд через consume_commands и OrderCommandService на SQLite.
+
+Запуск: python -m orders_service.benchmarks.command_replay --orders 2000 --commands-per-order 4 --skew 1.1
+    --lanes 4 --publish-latency-ms 1
+
+Поток: у каждого заказа сначала CreateOrder, затем команды MarkPaid/Ship/Cancel. Заказ для очередной
+команды выбирается по Zipf с показателем --skew (0 — равномерно), так что горячие заказы получают
+большую часть потока. Доля --redeliveries команд доставляется повторно с тем же command_id.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import tempfile
+import time
+import zlib
+from pathlib import Path
+
+from aiokafka import TopicPartition
+from sqlalchemy import event
+
+from orders_service.application.service import OrderCommandService
+from orders_service.domain import commands
+from orders_service.infrastructure.cache import LRUCache, ProcessedCommandsLRU
+from orders_service.infrastructure.codecs import JsonCodec, content_type_headers
+from orders_service.infrastructure.db import create_engine_and_sessionmaker, run_migrations
+from orders_service.infrastructure.kafka import consume_command_batches, consume_commands
+from orders_service.infrastructure.metrics import ConsumerMetrics, InstrumentedEventPublisher, instrument_uow_factory
+from orders_service.infrastructure.uow import create_uow_factory
+
+TOPIC = "orders_commands"
+FOLLOW_UPS = (commands.MARK_PAID, commands.SHIP_ORDER, commands.CANCEL_ORDER)
+
+
+class ReplayMessage:
+    __slots__ = ("topic", "partition", "offset", "value", "headers")
+
+    def __init__(self, partition: int, offset: int, value: bytes, headers):
+        self.topic = TOPIC
+        self.partition = partition
+        self.offset = offset
+        self.value = value
+        self.headers = headers
+
+
+class ReplayConsumer:
+    """Consumer в памяти, как FakeConsumer в тестах: сообщения заданы заранее, коммиты считаются."""
+
+    def __init__(self, messages: list[ReplayMessage]):
+        self._messages = messages
+        self._position = 0
+        self.drained = asyncio.Event()
+        self.commits = 0
+        self._highwater: dict[TopicPartition, int] = {}
+        for msg in messages:
+            tp = TopicPartition(msg.topic, msg.partition)
+            self._highwater[tp] = max(self._highwater.get(tp, 0), msg.offset + 1)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> ReplayMessage:
+        if self._position >= len(self._messages):
+            raise StopAsyncIteration
+        msg = self._messages[self._position]
+        self._position += 1
+        return msg
+
+    async def getmany(self, timeout_ms: int = 0, max_records: int | None = None):
+        if self._position >= len(self._messages):
+            self.drained.set()
+            await asyncio.sleep(timeout_ms / 1000)
+            return {}
+        batch = self._messages[self._position : self._position + (max_records or len(self._messages))]
+        self._position += len(batch)
+        records: dict[TopicPartition, list[ReplayMessage]] = {}
+        for msg in batch:
+            records.setdefault(TopicPartition(msg.topic, msg.partition), []).append(msg)
+        return records
+
+    def highwater(self, tp: TopicPartition) -> int | None:
+        return self._highwater.get(tp)
+
+    async def position(self, tp: TopicPartition) -> int:
+        return 0
+
+    def assignment(self) -> set[TopicPartition]:
+        return set(self._highwater)
+
+    async def commit(self, offsets=None) -> None:
+        self.commits += 1
+
+    async def stop(self) -> None:
+        self.drained.set()
+
+
+class LatencyPublisher:
+    """Публикация событий с имитацией подтверждения брокера."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.published = 0
+
+    async def publish_event(self, event_type: str, order_id: str, payload: dict) -> None:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.published += 1
+
+    async def publish_events(self, events) -> None:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.published += len(list(events))
+
+
+def generate_commands(
+    orders: int, commands_per_order: int, skew: float, redeliveries: float, rng: random.Random
+) -> list[dict]:
+    weights = [1 / (rank**skew) for rank in range(1, orders + 1)] if skew else None
+    follow_ups = rng.choices(range(orders), weights=weights, k=orders * (commands_per_order - 1))
+    created: set[int] = set()
+    stream: list[dict] = []
+
+    def emit(command: dict) -> None:
+        command[commands.COMMAND_ID] = f"cmd-{len(stream)}"
+        stream.append(command)
+        if rng.random() < redeliveries:
+            stream.append(dict(command))
+
+    # Новые заказы появляются по ходу потока, а не все в начале.
+    pending_creates = list(range(orders))
+    rng.shuffle(pending_creates)
+    def create(index: int) -> None:
+        created.add(index)
+        emit({"type": commands.CREATE_ORDER, "order_id": str(index), "item": "replay", "amount": 10})
+
+    creates_per_step = orders / max(len(follow_ups), 1)
+    quota = 0.0
+    for index in follow_ups:
+        if index not in created:
+            create(index)
+        emit({"type": rng.choice(FOLLOW_UPS), "order_id": str(index), "reason": "replay"})
+        quota += creates_per_step
+        while quota >= 1 and pending_creates:
+            new = pending_creates.pop()
+            if new not in created:
+                create(new)
+                quota -= 1
+    for index in pending_creates:
+        if index not in created:
+            create(index)
+    return stream
+
+
+def to_messages(stream: list[dict], partitions: int) -> list[ReplayMessage]:
+    codec = JsonCodec()
+    headers = tuple(content_type_headers(codec))
+    offsets = [0] * partitions
+    messages = []
+    for command in stream:
+        # Ключ сообщения — order_id, как у отправителя, поэтому заказ всегда в одной партиции.
+        partition = zlib.crc32(command["order_id"].encode("utf-8")) % partitions
+        messages.append(ReplayMessage(partition, offsets[partition], codec.encode(command), headers))
+        offsets[partition] += 1
+    return messages
+
+
+def percentile(values: list[float], q: float) -> float:
+    index = max(int(round(q / 100 * len(values))) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+async def run(args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    stream = generate_commands(args.orders, args.commands_per_order, args.skew, args.redeliveries, rng)
+    consumer = ReplayConsumer(to_messages(stream, args.partitions))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, session_maker = create_engine_and_sessionmaker(
+            f"sqlite+aiosqlite:///{Path(tmp) / 'replay.db'}", profile=args.profile
+        )
+        await run_migrations(engine)
+        statements = 0
+
+        def count_statement(*args) -> None:
+            nonlocal statements
+            statements += 1
+
+        event.listen(engine.sync_engine, "before_cursor_execute", count_statement)
+        metrics = ConsumerMetrics()
+        uow_factory = create_uow_factory(
+            session_maker,
+            state_cache=LRUCache(args.state_cache_size) if args.state_cache_size else None,
+            snapshot_interval=args.snapshot_interval,
+        )
+        service = OrderCommandService(
+            instrument_uow_factory(uow_factory, metrics),
+            InstrumentedEventPublisher(LatencyPublisher(args.publish_latency_ms / 1000), metrics),
+            processed=ProcessedCommandsLRU(args.processed_cache_size) if args.processed_cache_size else None,
+        )
+
+        latencies: dict[str, list[float]] = {}
+
+        async def handler(command: dict) -> None:
+            started = time.perf_counter()
+            try:
+                await service.handle_command(command)
+            finally:
+                latencies.setdefault(command["type"], []).append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        if args.batch_size > 1:
+            task = asyncio.create_task(
+                consume_command_batches(
+                    consumer, service.handle_batch, max_records=args.batch_size, timeout_ms=1, metrics=metrics
+                )
+            )
+            await consumer.drained.wait()
+            elapsed = time.perf_counter() - started
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        else:
+            await consume_commands(consumer, handler, lanes=args.lanes, metrics=metrics)
+            elapsed = time.perf_counter() - started
+        await engine.dispose()
+
+    total = len(stream)
+    print(
+        f"{total} команд ({args.orders} заказов, skew={args.skew}) за {elapsed:.2f} с: "
+        f"{total / elapsed:.0f} команд/с, коммитов оффсетов: {consumer.commits}"
+    )
+    if latencies:
+        print(f"{'command':>20} {'count':>7} {'p50, ms':>8} {'p95, ms':>8} {'p99, ms':>8} {'max, ms':>8}")
+        for name, values in sorted(latencies.items()):
+            values.sort()
+            print(
+                f"{name:>20} {len(values):>7} {statistics.median(values):>8.3f} "
+                f"{percentile(values, 95):>8.3f} {percentile(values, 99):>8.3f} {values[-1]:>8.3f}"
+            )
+    else:
+        batches = metrics.batch_duration.count()
+        print(f"пачек: {batches}, среднее время пачки: {metrics.batch_duration.total() / batches * 1000:.2f} ms")
+
+    # Время обработчиков суммируется по лейнам, поэтому при lanes > 1 оно больше wall-clock.
+    handler_time = sum(sum(values) for values in latencies.values()) / 1000 or metrics.batch_duration.total()
+    commit_time = metrics.commit_duration.total()
+    publish_time = metrics.publish_duration.total()
+    other_time = max(handler_time - commit_time - publish_time, 0.0)
+    print(f"{'phase':>20} {'total, s':>9} {'share':>6}")
+    for name, value in (("db commit", commit_time), ("publish", publish_time), ("db reads/writes + app", other_time)):
+        print(f"{name:>20} {value:>9.3f} {value / handler_time:>6.1%}")
+    print(f"SQL-выражений на команду: {statements / total:.1f}, повторов отброшено: {service.duplicates}")
+    errors = {labels[0]: int(value) for labels, value in metrics.errors.values().items()}
+    if errors:
+        print("ошибки: " + ", ".join(f"{name} x{count}" for name, count in sorted(errors.items())))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=1000)
+    parser.add_argument("--commands-per-order", type=int, default=4)
+    parser.add_argument("--skew", type=float, default=1.0, help="показатель Zipf для горячих заказов, 0 — равномерно")
+    parser.add_argument("--redeliveries", type=float, default=0.01, help="доля повторно доставленных команд")
+    parser.add_argument("--partitions", type=int, default=4)
+    parser.add_argument("--lanes", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=1, help="больше 1 — group commit через handle_batch")
+    parser.add_argument("--publish-latency-ms", type=float, default=1.0)
+    parser.add_argument("--profile", default="production", help="профиль SQLite: default или production")
+    parser.add_argument("--state-cache-size", type=int, default=10000)
+    parser.add_argument("--processed-cache-size", type=int, default=100000)
+    parser.add_argument("--snapshot-interval", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
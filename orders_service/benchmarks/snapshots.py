@@ -0,0 +1,83 @@
+"""Время восстановления агрегата заказа от длины истории: со снимком и без.
+
+Запуск: python -m orders_service.benchmarks.snapshots --lengths 10 100 1000 10000
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from datetime import datetime, UTC
+from pathlib import Path
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from orders_service.domain import events
+from orders_service.infrastructure.models import Base, OrderEvent
+from orders_service.infrastructure.repositories import SqlAlchemyOrderEventRepository
+
+
+async def _append_history(session_maker: async_sessionmaker[AsyncSession], order_id: str, length: int) -> None:
+    now = datetime.now(UTC)
+    rows = [
+        {
+            "order_id": order_id,
+            "type": events.ORDER_CREATED if seq == 0 else events.ORDER_PAID,
+            "payload": {"order_id": order_id, "seq": seq, "item": "benchmark"},
+            "created_at": now,
+        }
+        for seq in range(length)
+    ]
+    async with session_maker() as session:
+        await session.execute(insert(OrderEvent), rows)
+        await session.commit()
+
+
+async def _rebuild_ms(session_maker: async_sessionmaker[AsyncSession], order_id: str, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        async with session_maker() as session:
+            repo = SqlAlchemyOrderEventRepository(session)
+            started = time.perf_counter()
+            await repo.load_aggregate(order_id)
+            timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+async def run(lengths: list[int], tail: int, repeat: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{Path(tmp) / 'bench.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_maker = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+
+        print(f"{'events':>8} {'full, ms':>10} {'snapshot, ms':>13} {'speedup':>8}")
+        for length in lengths:
+            plain_id, snapshot_id = f"plain-{length}", f"snap-{length}"
+            await _append_history(session_maker, plain_id, length)
+            await _append_history(session_maker, snapshot_id, length)
+            async with session_maker() as session:
+                await SqlAlchemyOrderEventRepository(session).take_snapshot(snapshot_id)
+                await session.commit()
+            # После снимка успело прийти еще tail событий — их придется догрузить.
+            await _append_history(session_maker, snapshot_id, tail)
+
+            full_ms = await _rebuild_ms(session_maker, plain_id, repeat)
+            snapshot_ms = await _rebuild_ms(session_maker, snapshot_id, repeat)
+            print(f"{length:>8} {full_ms:>10.2f} {snapshot_ms:>13.2f} {full_ms / snapshot_ms:>7.1f}x")
+
+        await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--tail", type=int, default=10, help="событий после снимка")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.lengths, args.tail, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -10,7 +10,37 @@ class Settings(BaseModel):
     kafka_bootstrap_servers: str = env.str("KAFKA_BOOTSTRAP", "localhost:9092")
     commands_topic: str = env.str("ORDERS_COMMANDS_TOPIC", "orders_commands")
     events_topic: str = env.str("ORDERS_EVENTS_TOPIC", "orders_events")
+    # Кодек исходящих событий: json, orjson (тот же JSON, быстрее) или msgpack.
+    # Входящие команды декодируются по заголовку content-type независимо от этой настройки.
+    kafka_codec: str = env.str("ORDERS_KAFKA_CODEC", "json")
     database_url: str = env.str("ORDERS_DATABASE_URL", "sqlite+aiosqlite:///./data/orders.db")
+    # Профиль SQLite: default — настройки драйвера; production — WAL, synchronous=NORMAL, mmap и т.д.
+    sqlite_profile: str = env.str("ORDERS_SQLITE_PROFILE", "default")
+    sqlite_mmap_size: int = env.int("ORDERS_SQLITE_MMAP_SIZE", 256 * 1024 * 1024)
+    sqlite_cache_size_kb: int = env.int("ORDERS_SQLITE_CACHE_SIZE_KB", 64 * 1024)
+    sqlite_busy_timeout_ms: int = env.int("ORDERS_SQLITE_BUSY_TIMEOUT_MS", 5000)
+    db_pool_size: int = env.int("ORDERS_DB_POOL_SIZE", 5)
+    db_max_overflow: int = env.int("ORDERS_DB_MAX_OVERFLOW", 10)
+    # Число параллельных лейнов обработки команд (1 — строго последовательно).
+    command_lanes: int = env.int("ORDERS_COMMAND_LANES", 1)
+    lane_queue_size: int = env.int("ORDERS_LANE_QUEUE_SIZE", 100)
+    # Размер пачки для group commit (1 — пакетный режим выключен).
+    command_batch_size: int = env.int("ORDERS_COMMAND_BATCH_SIZE", 1)
+    command_batch_timeout_ms: int = env.int("ORDERS_COMMAND_BATCH_TIMEOUT_MS", 100)
+    # Размер LRU состояний заказов (0 — кеш выключен).
+    state_cache_size: int = env.int("ORDERS_STATE_CACHE_SIZE", 10000)
+    # Сколько id обработанных команд держать в памяти для отсева повторов (0 — только таблица).
+    processed_cache_size: int = env.int("ORDERS_PROCESSED_CACHE_SIZE", 100000)
+    # Сколько секунд хранить строки processed_commands. Должно перекрывать окно повторной доставки
+    # Kafka (retention топика команд): повтор старше TTL будет применен заново.
+    processed_ttl: int = env.int("ORDERS_PROCESSED_TTL", 7 * 24 * 3600)
+    # Период фоновой чистки processed_commands в секундах (0 — выключено).
+    processed_purge_interval: int = env.int("ORDERS_PROCESSED_PURGE_INTERVAL", 3600)
+    # Снимок агрегата пишется, когда после предыдущего накопилось столько событий (0 — выключено).
+    snapshot_interval: int = env.int("ORDERS_SNAPSHOT_INTERVAL", 50)
+    # HTTP-порт с /metrics (Prometheus) и /health (отставание consumer'а); 0 — выключено.
+    metrics_host: str = env.str("ORDERS_METRICS_HOST", "0.0.0.0")
+    metrics_port: int = env.int("ORDERS_METRICS_PORT", 9108)
 
 
 settings = Settings()
@@ -4,10 +4,15 @@ from aiokafka import AIOKafkaConsumer, AIOKafkaProducer
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
 
 from orders_service.config import settings
+from orders_service.domain.models import OrderStateRecord
 from orders_service.domain.uow import UoWFactory
+from orders_service.infrastructure.cache import LRUCache, ProcessedCommandsLRU
+from orders_service.infrastructure.codecs import get_codec
 from orders_service.infrastructure.db import create_engine_and_sessionmaker, run_migrations
 from orders_service.infrastructure.kafka import (
     KafkaEventPublisher,
+    OffsetRebalanceListener,
+    consume_command_batches,
     consume_commands,
     create_consumer,
     create_producer,
@@ -20,33 +25,50 @@ class OrderServiceDeps:
     engine: AsyncEngine
     session_maker: async_sessionmaker[AsyncSession]
     uow_factory: UoWFactory
+    state_cache: LRUCache[str, OrderStateRecord] | None
+    processed_commands: ProcessedCommandsLRU | None
     producer: AIOKafkaProducer
     publisher: KafkaEventPublisher
     consumer: AIOKafkaConsumer
+    rebalance: OffsetRebalanceListener
 
 
 async def build_dependencies() -> OrderServiceDeps:
     engine, session_maker = create_engine_and_sessionmaker()
     await run_migrations(engine)
 
-    uow_factory = create_uow_factory(session_maker)
+    state_cache = LRUCache(settings.state_cache_size) if settings.state_cache_size > 0 else None
+    uow_factory = create_uow_factory(
+        session_maker,
+        state_cache=state_cache,
+        snapshot_interval=settings.snapshot_interval,
+    )
+
+    processed_commands = (
+        ProcessedCommandsLRU(settings.processed_cache_size) if settings.processed_cache_size > 0 else None
+    )
 
     producer = await create_producer()
-    publisher = KafkaEventPublisher(producer, topic=settings.events_topic)
-    consumer = await create_consumer()
+    publisher = KafkaEventPublisher(producer, topic=settings.events_topic, codec=get_codec(settings.kafka_codec))
+    rebalance = OffsetRebalanceListener()
+    consumer = await create_consumer(rebalance)
 
     return OrderServiceDeps(
         engine=engine,
         session_maker=session_maker,
         uow_factory=uow_factory,
+        state_cache=state_cache,
+        processed_commands=processed_commands,
         producer=producer,
         publisher=publisher,
         consumer=consumer,
+        rebalance=rebalance,
     )
 
 
 __all__ = [
     "build_dependencies",
+    "consume_command_batches",
     "consume_commands",
     "OrderServiceDeps",
 ]
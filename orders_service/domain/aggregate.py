@@ -0,0 +1,52 @@
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Any, Iterable
+
+from . import events
+from .models import OrderEventRecord, OrderSnapshotRecord
+
+
+@dataclass
+class OrderAggregate:
+    """Состояние заказа, свернутое из его событий.
+
+    version — id последнего примененного события: снимок с этой версией
+    позволяет догружать только более новые события.
+    """
+
+    order_id: str
+    status: str | None = None
+    item: str | None = None
+    amount: Any = None
+    currency: str | None = None
+    version: int = 0
+    updated_at: datetime | None = None
+
+    def apply(self, event: OrderEventRecord) -> None:
+        if event.type == events.ORDER_CREATED:
+            self.item = event.payload.get("item")
+            self.amount = event.payload.get("amount")
+            self.currency = event.payload.get("currency")
+        self.status = events.STATUS_BY_EVENT.get(event.type, self.status)
+        self.version = event.id or self.version
+        self.updated_at = event.created_at or self.updated_at
+
+    def apply_all(self, history: Iterable[OrderEventRecord]) -> "OrderAggregate":
+        for event in history:
+            self.apply(event)
+        return self
+
+    def to_snapshot(self) -> OrderSnapshotRecord:
+        state = asdict(self)
+        state.pop("order_id")
+        state.pop("version")
+        if self.updated_at is not None:
+            state["updated_at"] = self.updated_at.isoformat()
+        return OrderSnapshotRecord(order_id=self.order_id, version=self.version, state=state)
+
+    @classmethod
+    def from_snapshot(cls, snapshot: OrderSnapshotRecord) -> "OrderAggregate":
+        state = dict(snapshot.state)
+        if state.get("updated_at"):
+            state["updated_at"] = datetime.fromisoformat(state["updated_at"])
+        return cls(order_id=snapshot.order_id, version=snapshot.version, **state)
@@ -3,3 +3,6 @@ CREATE_ORDER = "CreateOrderCommand"
 CANCEL_ORDER = "CancelOrderCommand"
 MARK_PAID = "MarkPaidCommand"
 SHIP_ORDER = "ShipOrderCommand"
+
+# Уникальный id команды от отправителя: по нему отбрасываются повторные доставки.
+COMMAND_ID = "command_id"
@@ -3,3 +3,11 @@ ORDER_CREATED = "OrderCreated"
 ORDER_CANCELLED = "OrderCancelled"
 ORDER_PAID = "OrderPaid"
 ORDER_SHIPPED = "OrderShipped"
+
+# Статус заказа, в который переводит событие.
+STATUS_BY_EVENT = {
+    ORDER_CREATED: "created",
+    ORDER_CANCELLED: "cancelled",
+    ORDER_PAID: "paid",
+    ORDER_SHIPPED: "shipped",
+}
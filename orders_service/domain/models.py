@@ -12,6 +12,14 @@ class OrderEventRecord:
     created_at: datetime | None = None
 
 
+@dataclass
+class OrderSnapshotRecord:
+    order_id: str
+    version: int
+    state: dict[str, Any]
+    created_at: datetime | None = None
+
+
 @dataclass
 class OrderStateRecord:
     order_id: str
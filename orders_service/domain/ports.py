@@ -1,6 +1,21 @@
-from typing import Protocol
+from typing import Iterable, Protocol
+
+from .models import OrderEventRecord
 
 
 class EventPublisher(Protocol):
     async def publish_event(self, event_type: str, order_id: str, payload: dict) -> None:
         ...
+
+    async def publish_events(self, events: Iterable[OrderEventRecord]) -> None:
+        ...
+
+
+class ProcessedCommandCache(Protocol):
+    """Быстрая проверка в памяти: id команд, уже закоммиченных этим процессом."""
+
+    def __contains__(self, command_id: str) -> bool:
+        ...
+
+    def add(self, command_id: str) -> None:
+        ...
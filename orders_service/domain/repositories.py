@@ -1,5 +1,7 @@
-from typing import Iterable, Protocol
+from datetime import datetime
+from typing import Iterable, Protocol, Sequence
 
+from .aggregate import OrderAggregate
 from .models import OrderEventRecord, OrderStateRecord
 
 
@@ -7,7 +9,13 @@ class OrderEventRepository(Protocol):
     async def append_event(self, order_id: str, event_type: str, payload: dict) -> OrderEventRecord:
         ...
 
-    async def load_events(self, order_id: str) -> Iterable[OrderEventRecord]:
+    async def load_events(self, order_id: str, after_id: int = 0) -> Iterable[OrderEventRecord]:
+        ...
+
+    async def load_aggregate(self, order_id: str) -> OrderAggregate | None:
+        ...
+
+    async def take_snapshot(self, order_id: str) -> OrderAggregate | None:
         ...
 
 
@@ -17,3 +25,24 @@ class OrderStateRepository(Protocol):
 
     async def upsert_state(self, order_id: str, status: str) -> OrderStateRecord:
         ...
+
+    async def bulk_upsert_states(self, records: Iterable[OrderStateRecord]) -> int:
+        ...
+
+
+class ProcessedCommandRepository(Protocol):
+    async def mark_processed(self, command_id: str) -> bool:
+        """Отмечаем команду обработанной; False — она уже была обработана раньше."""
+        ...
+
+    async def record_events(self, command_id: str, events: Sequence[OrderEventRecord]) -> None:
+        """Сохраняем события команды рядом с отметкой, в той же транзакции."""
+        ...
+
+    async def load_events(self, command_id: str) -> list[OrderEventRecord]:
+        """События, которые породила уже обработанная команда."""
+        ...
+
+    async def purge(self, older_than: datetime) -> int:
+        """Удаляем отметки, обработанные раньше older_than; возвращаем число строк."""
+        ...
@@ -1,11 +1,12 @@
 from typing import AsyncContextManager, Callable, Protocol
 
-from .repositories import OrderEventRepository, OrderStateRepository
+from .repositories import OrderEventRepository, OrderStateRepository, ProcessedCommandRepository
 
 
 class OrderUnitOfWork(Protocol):
     events: OrderEventRepository
     state: OrderStateRepository
+    processed: ProcessedCommandRepository
 
     async def commit(self) -> None:
         ...
@@ -13,5 +14,9 @@ class OrderUnitOfWork(Protocol):
     async def rollback(self) -> None:
         ...
 
+    def savepoint(self) -> AsyncContextManager[None]:
+        """Вложенная транзакция: исключение внутри откатывает только ее."""
+        ...
+
 
 UoWFactory = Callable[[], AsyncContextManager[OrderUnitOfWork]]
@@ -0,0 +1,62 @@
+from collections import OrderedDict
+from typing import Generic, Hashable, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LRUCache(Generic[K, V]):
+    """Ограниченный по размеру in-process LRU со счетчиками попаданий и промахов."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items: OrderedDict[K, V] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: K) -> V | None:
+        value = self._items.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def peek(self, key: K) -> V | None:
+        """Читаем значение без влияния на порядок вытеснения и счетчики."""
+        return self._items.get(key)
+
+    def put(self, key: K, value: V) -> None:
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def invalidate(self, key: K) -> None:
+        self._items.pop(key, None)
+
+    def clear(self) -> None:
+        self._items.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {"size": len(self._items), "hits": self.hits, "misses": self.misses}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class ProcessedCommandsLRU:
+    """Последние max_size id обработанных команд; промах не значит, что команда новая."""
+
+    def __init__(self, max_size: int):
+        self._ids: LRUCache[str, bool] = LRUCache(max_size)
+
+    def __contains__(self, command_id: str) -> bool:
+        return self._ids.get(command_id) is not None
+
+    def add(self, command_id: str) -> None:
+        self._ids.put(command_id, True)
+
+    def stats(self) -> dict[str, int]:
+        return self._ids.stats()
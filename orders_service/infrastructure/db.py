@@ -1,6 +1,7 @@
 from pathlib import Path
 from typing import Tuple
 
+from sqlalchemy import event, inspect
 from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 
@@ -16,15 +17,90 @@ def _ensure_sqlite_dir(database_url: str) -> None:
             db_path.parent.mkdir(parents=True, exist_ok=True)
 
 
-def create_engine_and_sessionmaker() -> Tuple[AsyncEngine, async_sessionmaker[AsyncSession]]:
+def sqlite_pragmas(profile: str) -> dict[str, str | int]:
+    """PRAGMA, которые выполняются на каждом новом соединении выбранного профиля."""
+    if profile == "default":
+        return {}
+    if profile == "production":
+        # WAL: читатели не ждут писателя; NORMAL в WAL теряет при сбое питания лишь последние коммиты.
+        return {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "temp_store": "MEMORY",
+            "mmap_size": settings.sqlite_mmap_size,
+            "cache_size": -settings.sqlite_cache_size_kb,
+            "busy_timeout": settings.sqlite_busy_timeout_ms,
+        }
+    raise ValueError(f"Неизвестный профиль SQLite: {profile}")
+
+
+def apply_sqlite_pragmas(engine: AsyncEngine, pragmas: dict[str, str | int]) -> None:
+    if engine.dialect.name != "sqlite" or not pragmas:
+        return
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def _pool_options(database_url: str) -> dict[str, int]:
+    url = make_url(database_url)
+    # In-memory SQLite живет на StaticPool, у которого нет размера пула.
+    if url.drivername.startswith("sqlite") and url.database in (None, "", ":memory:"):
+        return {}
+    return {"pool_size": settings.db_pool_size, "max_overflow": settings.db_max_overflow}
+
+
+def enable_sqlite_savepoints(engine: AsyncEngine) -> None:
+    """Отдаем управление транзакциями SQLAlchemy, иначе драйвер sqlite3 ломает SAVEPOINT.
+
+    Без этого RELEASE внешнего savepoint коммитит всю транзакцию, и пачка команд
+    перестает быть атомарной.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _disable_pysqlite_transactions(dbapi_connection, connection_record) -> None:
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine.sync_engine, "begin")
+    def _emit_begin(conn) -> None:
+        conn.exec_driver_sql("BEGIN")
+
+
+def create_engine_and_sessionmaker(
+    database_url: str | None = None,
+    profile: str | None = None,
+) -> Tuple[AsyncEngine, async_sessionmaker[AsyncSession]]:
     """Создаем движок и sessionmaker для сервиса заказов."""
-    _ensure_sqlite_dir(settings.database_url)
-    engine = create_async_engine(settings.database_url, future=True, echo=False)
+    database_url = database_url or settings.database_url
+    _ensure_sqlite_dir(database_url)
+    engine = create_async_engine(database_url, future=True, echo=False, **_pool_options(database_url))
+    enable_sqlite_savepoints(engine)
+    apply_sqlite_pragmas(engine, sqlite_pragmas(profile or settings.sqlite_profile))
     session_maker = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
     return engine, session_maker
 
 
+def _upgrade_existing_tables(connection) -> None:
+    # create_all пропускает существующие таблицы целиком: новые nullable-колонки и индексы добавляем сами.
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing and column.nullable:
+                column_type = column.type.compile(connection.dialect)
+                connection.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
 async def run_migrations(engine: AsyncEngine) -> None:
-    """Поднимаем таблицы event-sourcing модели."""
+    """Поднимаем таблицы event-sourcing модели и догоняем схему существующих."""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_upgrade_existing_tables)
@@ -1,10 +1,16 @@
-import json
+import asyncio
 import logging
-from typing import Callable, Awaitable
+import time
+import zlib
+from collections import deque
+from typing import Callable, Awaitable, Iterable
 
-from aiokafka import AIOKafkaConsumer, AIOKafkaProducer
+from aiokafka import AIOKafkaConsumer, AIOKafkaProducer, ConsumerRebalanceListener, TopicPartition
 
 from orders_service.config import settings
+from orders_service.infrastructure.codecs import Codec, JsonCodec, MessageDecoder, content_type_headers
+from orders_service.infrastructure.metrics import ConsumerMetrics
+from orders_service.domain.models import OrderEventRecord
 
 log = logging.getLogger("order_service.kafka")
 
@@ -12,21 +18,48 @@ log = logging.getLogger("order_service.kafka")
 class KafkaEventPublisher:
     """Изолированная обертка для публикации событий заказов."""
 
-    def __init__(self, producer: AIOKafkaProducer, topic: str):
+    def __init__(self, producer: AIOKafkaProducer, topic: str, codec: Codec | None = None):
         self.producer = producer
         self.topic = topic
+        self.codec = codec or JsonCodec()
+        self._headers = content_type_headers(self.codec)
 
     async def publish_event(self, event_type: str, order_id: str, payload: dict) -> None:
+        await self.producer.send_and_wait(
+            self.topic,
+            self._encode_event(event_type, order_id, payload),
+            key=str(order_id).encode("utf-8"),
+            headers=self._headers,
+        )
+
+    async def publish_events(self, events: Iterable[OrderEventRecord]) -> None:
+        """Ставим все события в очередь продюсера и ждем подтверждения разом."""
+        deliveries = [
+            await self.producer.send(
+                self.topic,
+                self._encode_event(event.type, event.order_id, event.payload),
+                key=str(event.order_id).encode("utf-8"),
+                headers=self._headers,
+            )
+            for event in events
+        ]
+        await asyncio.gather(*deliveries)
+
+    def _encode_event(self, event_type: str, order_id: str, payload: dict) -> bytes:
         envelope = {
             "type": event_type,
             "order_id": order_id,
             "payload": payload,
         }
-        await self.producer.send_and_wait(
-            self.topic,
-            json.dumps(envelope).encode("utf-8"),
-            key=str(order_id).encode("utf-8"),
-        )
+        return self.codec.encode(envelope)
+
+
+_decoder = MessageDecoder()
+
+
+def decode_command(msg) -> dict:
+    """Тело команды по заголовку content-type; без заголовка — JSON от старых отправителей."""
+    return _decoder.decode(msg.value, msg.headers)
 
 
 async def create_producer() -> AIOKafkaProducer:
@@ -38,28 +71,284 @@ async def create_producer() -> AIOKafkaProducer:
     return producer
 
 
-async def create_consumer() -> AIOKafkaConsumer:
+async def create_consumer(listener: ConsumerRebalanceListener | None = None) -> AIOKafkaConsumer:
     consumer = AIOKafkaConsumer(
-        settings.commands_topic,
         bootstrap_servers=settings.kafka_bootstrap_servers,
         client_id=settings.service_name,
         group_id=f"{settings.service_name}-group",
         enable_auto_commit=False,
     )
+    consumer.subscribe([settings.commands_topic], listener=listener)
     await consumer.start()
     return consumer
 
 
-async def consume_commands(consumer: AIOKafkaConsumer, handler: Callable[[dict], Awaitable[None]]) -> None:
-    """Запускает бесконечное чтение команд с последовательной обработкой."""
+class OffsetRebalanceListener(ConsumerRebalanceListener):
+    """Передает ребаланс группы в учет оффсетов лейнов; без лейнов ничего не делает."""
+
+    def __init__(self):
+        self.committer: _OffsetCommitter | None = None
+
+    async def on_partitions_revoked(self, revoked) -> None:
+        if self.committer is not None:
+            await self.committer.revoke(revoked)
+
+    async def on_partitions_assigned(self, assigned) -> None:
+        if self.committer is not None:
+            self.committer.assign(assigned)
+
+
+CommandHandler = Callable[[dict], Awaitable[None]]
+BatchHandler = Callable[[list[dict]], Awaitable[list[Exception | None]]]
+
+
+async def _handle(handler: CommandHandler, command: dict, metrics: ConsumerMetrics | None) -> None:
+    if metrics is None:
+        await handler(command)
+        return
+    started = time.perf_counter()
     try:
+        await handler(command)
+    except Exception as exc:
+        metrics.observe_command(command.get("type"), time.perf_counter() - started, exc)
+        raise
+    metrics.observe_command(command.get("type"), time.perf_counter() - started)
+
+
+async def consume_commands(
+    consumer: AIOKafkaConsumer,
+    handler: CommandHandler,
+    lanes: int = 1,
+    lane_queue_size: int = 100,
+    metrics: ConsumerMetrics | None = None,
+    rebalance: OffsetRebalanceListener | None = None,
+) -> None:
+    """Запускает бесконечное чтение команд.
+
+    При lanes == 1 команды обрабатываются строго последовательно. При lanes > 1
+    команды шардируются по order_id между лейнами: порядок внутри заказа
+    сохраняется, независимые заказы обрабатываются параллельно.
+    Если передан metrics, в него пишутся латентность, ошибки и отставание по партициям.
+    rebalance — listener, с которым подписан consumer: через него лейны узнают о ребалансе.
+    """
+    try:
+        if lanes > 1:
+            await _consume_sharded(consumer, handler, lanes, lane_queue_size, metrics, rebalance)
+            return
+
         async for msg in consumer:
+            tp = TopicPartition(msg.topic, msg.partition)
+            if metrics is not None:
+                await metrics.observe_highwater(consumer, tp)
+            command = None
             try:
-                command = json.loads(msg.value.decode("utf-8"))
-                await handler(command)
+                command = decode_command(msg)
+                await _handle(handler, command, metrics)
                 await consumer.commit()
             except Exception as exc:
                 log.exception("Ошибка обработки команды: %s", exc)
+                if metrics is not None and command is None:
+                    metrics.observe_command(None, None, exc)
+                await consumer.commit()
+            if metrics is not None:
+                metrics.observe_committed({tp: msg.offset + 1})
+    finally:
+        await consumer.stop()
+
+
+class _PartitionOffsets:
+    """Оффсеты одной партиции: коммитить можно только до первой незавершенной команды."""
+
+    def __init__(self):
+        self._pending: deque[int] = deque()
+        self._done: set[int] = set()
+        self._last: int | None = None
+        self.committable: int | None = None
+
+    def track(self, offset: int) -> None:
+        if self._last is not None and offset <= self._last:
+            # Партицию перечитывают с меньшего оффсета (ребаланс, seek): старая позиция недействительна.
+            log.info("Оффсет %s не больше уже прочитанного %s, сбрасываем позицию партиции", offset, self._last)
+            self._pending.clear()
+            self._done.clear()
+            self.committable = None
+        self._pending.append(offset)
+        self._last = offset
+
+    def done(self, offset: int) -> bool:
+        """Отмечаем оффсет обработанным; True, если позиция для коммита сдвинулась."""
+        if not self._pending or offset < self._pending[0]:
+            # Команда из прошлого поколения партиции, ее позиция уже сброшена.
+            return False
+        self._done.add(offset)
+        advanced = False
+        while self._pending and self._pending[0] in self._done:
+            finished = self._pending.popleft()
+            self._done.discard(finished)
+            self.committable = finished + 1
+            advanced = True
+        return advanced
+
+
+class _OffsetCommitter:
+    """Копит сдвиги оффсетов от лейнов и коммитит их одним вызовом consumer.commit."""
+
+    def __init__(self, consumer: AIOKafkaConsumer, metrics: ConsumerMetrics | None = None):
+        self._consumer = consumer
+        self._metrics = metrics
+        self._partitions: dict[TopicPartition, _PartitionOffsets] = {}
+        self._dirty: set[TopicPartition] = set()
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+
+    def track(self, tp: TopicPartition, offset: int) -> None:
+        self._partitions.setdefault(tp, _PartitionOffsets()).track(offset)
+
+    def done(self, tp: TopicPartition, offset: int) -> None:
+        partition = self._partitions.get(tp)
+        # Партицию могли отозвать, пока команда была в лейне: ее оффсет уже не наш.
+        if partition is not None and partition.done(offset):
+            self._dirty.add(tp)
+            self._wakeup.set()
+
+    async def revoke(self, partitions: Iterable[TopicPartition]) -> None:
+        """Коммитим готовое, пока партиции еще наши, и забываем их оффсеты."""
+        await self.flush()
+        async with self._lock:
+            for tp in partitions:
+                self._partitions.pop(tp, None)
+                self._dirty.discard(tp)
+
+    def assign(self, partitions: Iterable[TopicPartition]) -> None:
+        """Новые партиции читаются с закоммиченного оффсета — начинаем их учет с нуля."""
+        for tp in partitions:
+            self._partitions.pop(tp, None)
+            self._dirty.discard(tp)
+
+    async def run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if not self._dirty:
+                return
+            offsets = {tp: self._partitions[tp].committable for tp in self._dirty}
+            self._dirty.clear()
+            try:
+                await self._consumer.commit(offsets)
+            except Exception as exc:
+                # Например, партицию уже забрали при ребалансе — команды будут перечитаны.
+                log.warning("Не удалось закоммитить оффсеты %s: %s", offsets, exc)
+                return
+            if self._metrics is not None:
+                self._metrics.observe_committed(offsets)
+
+
+async def _consume_sharded(
+    consumer: AIOKafkaConsumer,
+    handler: CommandHandler,
+    lanes: int,
+    lane_queue_size: int,
+    metrics: ConsumerMetrics | None = None,
+    rebalance: OffsetRebalanceListener | None = None,
+) -> None:
+    committer = _OffsetCommitter(consumer, metrics)
+    if rebalance is not None:
+        rebalance.committer = committer
+    queues: list[asyncio.Queue] = [asyncio.Queue(maxsize=lane_queue_size) for _ in range(lanes)]
+
+    async def lane_worker(queue: asyncio.Queue) -> None:
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            tp, offset, command = item
+            try:
+                await _handle(handler, command, metrics)
+            except Exception as exc:
+                log.exception("Ошибка обработки команды: %s", exc)
+            committer.done(tp, offset)
+
+    workers = [asyncio.create_task(lane_worker(queue)) for queue in queues]
+    committer_task = asyncio.create_task(committer.run())
+    try:
+        async for msg in consumer:
+            tp = TopicPartition(msg.topic, msg.partition)
+            committer.track(tp, msg.offset)
+            if metrics is not None:
+                await metrics.observe_highwater(consumer, tp)
+            try:
+                command = decode_command(msg)
+            except Exception as exc:
+                log.exception("Не удалось разобрать команду: %s", exc)
+                if metrics is not None:
+                    metrics.observe_command(None, None, exc)
+                committer.done(tp, msg.offset)
+                continue
+            # Стабильный хеш: все команды одного заказа попадают в один лейн.
+            lane = zlib.crc32(str(command.get("order_id")).encode("utf-8")) % lanes
+            await queues[lane].put((tp, msg.offset, command))
+    finally:
+        for queue in queues:
+            await queue.put(None)
+        await asyncio.gather(*workers, return_exceptions=True)
+        committer_task.cancel()
+        await asyncio.gather(committer_task, return_exceptions=True)
+        await committer.flush()
+        if rebalance is not None:
+            rebalance.committer = None
+
+
+async def consume_command_batches(
+    consumer: AIOKafkaConsumer,
+    batch_handler: BatchHandler,
+    max_records: int = 100,
+    timeout_ms: int = 100,
+    metrics: ConsumerMetrics | None = None,
+) -> None:
+    """Читает команды пачками через getmany и отдает их обработчику одной пачкой.
+
+    Оффсеты коммитятся один раз на пачку, ошибки отдельных команд только логируются.
+    Латентность отдельной команды в пачке не видна, поэтому в metrics пишется время пачки.
+    """
+    try:
+        while True:
+            records = await consumer.getmany(timeout_ms=timeout_ms, max_records=max_records)
+            batch = []
+            for messages in records.values():
+                for msg in messages:
+                    try:
+                        batch.append(decode_command(msg))
+                    except Exception as exc:
+                        log.exception("Не удалось разобрать команду: %s", exc)
+                        if metrics is not None:
+                            metrics.observe_command(None, None, exc)
+            if batch:
+                started = time.perf_counter()
+                try:
+                    results = await batch_handler(batch)
+                    for command, error in zip(batch, results):
+                        if error is not None:
+                            log.error("Ошибка обработки команды %s: %r", command.get("type"), error)
+                        if metrics is not None:
+                            metrics.observe_command(command.get("type"), None, error)
+                except Exception as exc:
+                    log.exception("Ошибка обработки пачки команд: %s", exc)
+                    if metrics is not None:
+                        metrics.errors.inc(type(exc).__name__)
+                if metrics is not None:
+                    metrics.batch_duration.observe(time.perf_counter() - started)
+            if records:
                 await consumer.commit()
+                if metrics is not None:
+                    positions = {}
+                    for tp, messages in records.items():
+                        tp = TopicPartition(*tp)
+                        await metrics.observe_highwater(consumer, tp)
+                        positions[tp] = messages[-1].offset + 1
+                    metrics.observe_committed(positions)
     finally:
         await consumer.stop()
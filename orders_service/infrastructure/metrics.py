@@ -0,0 +1,395 @@
+"""Метрики consumer'а команд: Prometheus-текст и /health на отдельном порту.
+
+Примитивы (_format_labels ... MetricsRegistry) — копия api_gateway/app/metrics.py:
+сервисы собираются в отдельные образы и общего пакета не имеют. Правьте обе копии разом,
+тест orders_service/tests/test_metrics.py проверяет, что они совпадают.
+"""
+import asyncio
+import json
+import logging
+import time
+from bisect import bisect_left
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Iterable, Sequence
+
+from aiokafka import TopicPartition
+
+from orders_service.domain import commands
+from orders_service.domain.models import OrderEventRecord
+from orders_service.domain.ports import EventPublisher
+from orders_service.domain.uow import OrderUnitOfWork, UoWFactory
+
+log = logging.getLogger("order_service.metrics")
+
+DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+# Тип команды идет в метку только из этого списка, чтобы мусорные сообщения не плодили ряды.
+_COMMAND_TYPES = frozenset({commands.CREATE_ORDER, commands.CANCEL_ORDER, commands.MARK_PAID, commands.SHIP_ORDER})
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _HistogramSeries:
+    """Счетчики одного набора меток. Корзины выделены заранее, observe — bisect и два сложения."""
+
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: tuple[float, ...]):
+        self.bounds = bounds
+        # Последняя ячейка — значения больше верхней границы (+Inf).
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Histogram:
+    """Гистограмма в стиле Prometheus; накопительные суммы считаются только при выгрузке.
+
+    Блокировок нет: все вызовы идут из потока event loop (события движка SQLAlchemy
+    выполняются в greenlet того же потока), так что += не пересекаются.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.bounds = tuple(sorted(buckets))
+        self._series: dict[tuple[str, ...], _HistogramSeries] = {}
+
+    def labels(self, *values: str) -> _HistogramSeries:
+        series = self._series.get(values)
+        if series is None:
+            series = self._series[values] = _HistogramSeries(self.bounds)
+        return series
+
+    def observe(self, value: float, *labels: str) -> None:
+        self.labels(*labels).observe(value)
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return sum(series.counts) if series else 0
+
+    def total(self, *labels: str) -> float:
+        series = self._series.get(labels)
+        return series.sum if series else 0.0
+
+    def samples(self) -> Iterable[str]:
+        for values, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.bounds, float("inf")), series.counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}"
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {_format_value(series.sum)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def values(self) -> dict[tuple[str, ...], float]:
+        return dict(self._values)
+
+    def samples(self) -> Iterable[str]:
+        for values, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    """Текущее значение; если задан collect, оно читается в момент выгрузки."""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        collect: Callable[[], dict[tuple[str, ...], float]] | None = None,
+    ):
+        super().__init__(name, help, labelnames)
+        self._collect = collect
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+    def samples(self) -> Iterable[str]:
+        if self._collect is not None:
+            self._values = dict(self._collect())
+        return super().samples()
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: dict[str, Histogram | Counter] = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Текстовый формат Prometheus 0.0.4."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+class RateMeter:
+    """Событий в секунду за последние window секунд: кольцо посекундных ячеек."""
+
+    def __init__(self, window: int = 10, clock: Callable[[], float] = time.monotonic):
+        self._window = window
+        self._clock = clock
+        self._buckets = [0] * window
+        self._seconds = [0] * window
+
+    def add(self, amount: int = 1) -> None:
+        second = int(self._clock())
+        slot = second % self._window
+        if self._seconds[slot] != second:
+            self._seconds[slot] = second
+            self._buckets[slot] = 0
+        self._buckets[slot] += amount
+
+    def rate(self) -> float:
+        now = int(self._clock())
+        # Текущая секунда еще не закончилась, поэтому берем window полных секунд до нее.
+        total = sum(
+            count for second, count in zip(self._seconds, self._buckets) if now - self._window <= second < now
+        )
+        return total / self._window
+
+
+class ConsumerMetrics:
+    """Метрики чтения команд: отставание по партициям, латентность, ошибки, коммит БД и публикация."""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.registry = MetricsRegistry()
+        register = self.registry.register
+        self.commands = register(Counter("orders_commands_total", "Обработанные команды", ("type", "outcome")))
+        self.command_duration = register(
+            Histogram("orders_command_duration_seconds", "Время обработки одной команды", ("type",))
+        )
+        self.batch_duration = register(
+            Histogram("orders_command_batch_duration_seconds", "Время обработки пачки команд")
+        )
+        self.errors = register(
+            Counter("orders_command_errors_total", "Ошибки обработки по классу исключения", ("error",))
+        )
+        self.commit_duration = register(Histogram("orders_db_commit_duration_seconds", "Время коммита транзакции UoW"))
+        self.publish_duration = register(
+            Histogram("orders_publish_duration_seconds", "Время публикации событий в Kafka")
+        )
+        self.rate = RateMeter(clock=clock)
+        self._consumer = None
+        self._highwater: dict[TopicPartition, int] = {}
+        self._committed: dict[TopicPartition, int] = {}
+        self._sources: list[Callable[[], dict[str, float]]] = []
+        register(
+            Gauge(
+                "orders_consumer_lag",
+                "High watermark минус закоммиченный оффсет",
+                ("topic", "partition"),
+                collect=lambda: {(tp.topic, str(tp.partition)): lag for tp, lag in self.lag().items()},
+            )
+        )
+        register(
+            Gauge(
+                "orders_commands_per_second",
+                "Команд в секунду за последние 10 секунд",
+                collect=lambda: {(): self.rate.rate()},
+            )
+        )
+        register(
+            Gauge(
+                "orders_component_stat",
+                "Счетчики компонентов: кешей, отсева повторов",
+                ("name",),
+                collect=lambda: {(name,): value for source in self._sources for name, value in source().items()},
+            )
+        )
+
+    def add_source(self, source: Callable[[], dict[str, float]]) -> None:
+        self._sources.append(source)
+
+    def observe_command(self, command_type, elapsed: float | None, error: BaseException | None = None) -> None:
+        label = command_type if isinstance(command_type, str) and command_type in _COMMAND_TYPES else "other"
+        if elapsed is not None:
+            self.command_duration.observe(elapsed, label)
+        self.commands.inc(label, "ok" if error is None else "error")
+        if error is not None:
+            self.errors.inc(type(error).__name__)
+        self.rate.add()
+
+    async def observe_highwater(self, consumer, tp: TopicPartition) -> None:
+        self._consumer = consumer
+        highwater = consumer.highwater(tp)
+        if highwater is not None:
+            self._highwater[tp] = highwater
+        if tp not in self._committed:
+            # До первого своего коммита берем позицию consumer'а: иначе лагом считался бы
+            # весь диапазон оффсетов партиции. Запрос один раз на партицию.
+            try:
+                self._committed[tp] = await consumer.position(tp)
+            except Exception as exc:
+                log.debug("Не удалось узнать позицию %s: %s", tp, exc)
+
+    def observe_committed(self, offsets: dict[TopicPartition, int]) -> None:
+        self._committed.update(offsets)
+
+    def lag(self) -> dict[TopicPartition, int]:
+        if self._consumer is not None:
+            # Отозванные при ребалансе партиции больше не наши: их отставание читает другой consumer.
+            assigned = self._consumer.assignment()
+            for offsets in (self._highwater, self._committed):
+                for tp in [tp for tp in offsets if tp not in assigned]:
+                    del offsets[tp]
+        return {
+            tp: max(highwater - self._committed[tp], 0)
+            for tp, highwater in self._highwater.items()
+            if tp in self._committed
+        }
+
+    def render(self) -> str:
+        return self.registry.render()
+
+    def health(self) -> dict:
+        lag = self.lag()
+        return {
+            "status": "ok",
+            "lag": sum(lag.values()),
+            "partitions": {f"{tp.topic}-{tp.partition}": value for tp, value in lag.items()},
+            "commands_per_second": self.rate.rate(),
+        }
+
+
+class _TimedUnitOfWork:
+    """Прокси UoW, засекающий commit; остальное отдается исходному UoW."""
+
+    def __init__(self, uow: OrderUnitOfWork, metrics: ConsumerMetrics):
+        self._uow = uow
+        self._metrics = metrics
+
+    def __getattr__(self, name: str):
+        return getattr(self._uow, name)
+
+    async def commit(self) -> None:
+        started = time.perf_counter()
+        try:
+            await self._uow.commit()
+        finally:
+            self._metrics.commit_duration.observe(time.perf_counter() - started)
+
+
+def instrument_uow_factory(uow_factory: UoWFactory, metrics: ConsumerMetrics) -> UoWFactory:
+    @asynccontextmanager
+    async def _factory() -> AsyncIterator[OrderUnitOfWork]:
+        async with uow_factory() as uow:
+            yield _TimedUnitOfWork(uow, metrics)
+
+    return _factory
+
+
+class InstrumentedEventPublisher:
+    """EventPublisher, засекающий время публикации."""
+
+    def __init__(self, publisher: EventPublisher, metrics: ConsumerMetrics):
+        self._publisher = publisher
+        self._metrics = metrics
+
+    async def publish_event(self, event_type: str, order_id: str, payload: dict) -> None:
+        started = time.perf_counter()
+        try:
+            await self._publisher.publish_event(event_type, order_id, payload)
+        finally:
+            self._metrics.publish_duration.observe(time.perf_counter() - started)
+
+    async def publish_events(self, events: Iterable[OrderEventRecord]) -> None:
+        started = time.perf_counter()
+        try:
+            await self._publisher.publish_events(events)
+        finally:
+            self._metrics.publish_duration.observe(time.perf_counter() - started)
+
+
+_STATUS_TEXT = {200: "OK", 404: "Not Found"}
+
+
+async def start_metrics_server(metrics: ConsumerMetrics, host: str, port: int) -> asyncio.AbstractServer:
+    """Минимальный HTTP/1.0-сервер: GET /metrics (Prometheus) и GET /health (JSON с отставанием)."""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Заголовки не нужны, но их надо дочитать до пустой строки.
+            while (await asyncio.wait_for(reader.readline(), timeout=5)).strip():
+                pass
+            parts = request_line.decode("latin-1").split()
+            path = parts[1] if len(parts) > 1 else ""
+            if path == "/metrics":
+                status, body, content_type = 200, metrics.render(), "text/plain; version=0.0.4; charset=utf-8"
+            elif path == "/health":
+                status, body, content_type = 200, json.dumps(metrics.health()), "application/json"
+            else:
+                status, body, content_type = 404, "not found\n", "text/plain; charset=utf-8"
+            payload = body.encode("utf-8")
+            writer.write(
+                f"HTTP/1.0 {status} {_STATUS_TEXT[status]}\r\n"
+                f"Content-Type: {content_type}\r\nContent-Length: {len(payload)}\r\n\r\n".encode("latin-1")
+                + payload
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError) as exc:
+            log.debug("Запрос к порту метрик оборван: %s", exc)
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
@@ -13,7 +13,7 @@ class OrderEvent(Base):
     order_id = Column(String, index=True, nullable=False)
     type = Column(String, nullable=False)
     payload = Column(JSON, nullable=False)
-    created_at = Column(DateTime, default=datetime.now(UTC), nullable=False)
+    created_at = Column(DateTime, default=lambda: datetime.now(UTC), nullable=False)
 
 
 class OrderState(Base):
@@ -21,4 +21,29 @@ class OrderState(Base):
 
     order_id = Column(String, primary_key=True)
     status = Column(String, nullable=False)
-    updated_at = Column(DateTime, default=datetime.now(UTC), nullable=False)
+    updated_at = Column(DateTime, default=lambda: datetime.now(UTC), nullable=False)
+
+
+class ProcessedCommand(Base):
+    """Id уже примененной команды: повторная доставка из Kafka пропускается.
+
+    events — порожденные командой события; повтор публикует их заново, на случай если процесс
+    упал между коммитом и публикацией. Строки старше ORDERS_PROCESSED_TTL удаляются фоном.
+    """
+
+    __tablename__ = "processed_commands"
+
+    command_id = Column(String, primary_key=True)
+    processed_at = Column(DateTime, default=lambda: datetime.now(UTC), nullable=False, index=True)
+    events = Column(JSON, nullable=True)
+
+
+class OrderSnapshot(Base):
+    """Последний снимок агрегата заказа; version — id последнего свернутого события."""
+
+    __tablename__ = "order_snapshots"
+
+    order_id = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False)
+    state = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=lambda: datetime.now(UTC), nullable=False)
@@ -1,22 +1,60 @@
 from datetime import datetime, UTC
-from typing import Iterable
+from typing import Iterable, Sequence
 
-from sqlalchemy import select, update
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from orders_service.domain.models import OrderEventRecord, OrderStateRecord
-from orders_service.domain.repositories import OrderEventRepository, OrderStateRepository
-from orders_service.infrastructure.models import OrderEvent, OrderState
+from orders_service.domain.aggregate import OrderAggregate
+from orders_service.domain.models import OrderEventRecord, OrderSnapshotRecord, OrderStateRecord
+from orders_service.domain.repositories import (
+    OrderEventRepository,
+    OrderStateRepository,
+    ProcessedCommandRepository,
+)
+from orders_service.infrastructure.cache import LRUCache
+from orders_service.infrastructure.models import OrderEvent, OrderSnapshot, OrderState, ProcessedCommand
+
+# Диалекты с нативным INSERT ... ON CONFLICT (DO UPDATE ... RETURNING и DO NOTHING).
+_UPSERT_INSERTS = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert,
+}
+# Строк в одном executemany bulk-upsert'а. Лимит параметров SQLite тут ни при чем: каждая строка
+# привязывается отдельно. Чанк ограничивает список параметров в памяти драйвера и длину одного
+# вызова в потоке aiosqlite, между чанками event loop успевает обслужить остальные задачи.
+_BULK_UPSERT_CHUNK = 1000
+
+
+def _upsert_statement(insert, rows: list[dict] | None = None):
+    """INSERT ... ON CONFLICT DO UPDATE для order_state; без rows — под executemany."""
+    stmt = insert(OrderState)
+    if rows is not None:
+        stmt = stmt.values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[OrderState.order_id],
+        set_={"status": stmt.excluded.status, "updated_at": stmt.excluded.updated_at},
+    )
 
 
 class SqlAlchemyOrderEventRepository(OrderEventRepository):
-    def __init__(self, session: AsyncSession):
+    """Event store заказов.
+
+    load_aggregate читает последний снимок и только более новые события. Если таких
+    событий набралось snapshot_interval или больше, снимок перезаписывается (0 — не снимать).
+    append_event проверяет то же условие, так что снимки появляются и на пути записи команд.
+    """
+
+    def __init__(self, session: AsyncSession, snapshot_interval: int = 0):
         self.session = session
+        self.snapshot_interval = snapshot_interval
 
     async def append_event(self, order_id: str, event_type: str, payload: dict) -> OrderEventRecord:
         event = OrderEvent(order_id=order_id, type=event_type, payload=payload)
         self.session.add(event)
         await self.session.flush()
+        if self.snapshot_interval:
+            await self._snapshot_if_due(order_id)
         return OrderEventRecord(
             id=event.id,
             order_id=event.order_id,
@@ -25,8 +63,12 @@ class SqlAlchemyOrderEventRepository(OrderEventRepository):
             created_at=event.created_at,
         )
 
-    async def load_events(self, order_id: str) -> Iterable[OrderEventRecord]:
-        stmt = select(OrderEvent).where(OrderEvent.order_id == order_id).order_by(OrderEvent.id)
+    async def load_events(self, order_id: str, after_id: int = 0) -> Iterable[OrderEventRecord]:
+        stmt = (
+            select(OrderEvent)
+            .where(OrderEvent.order_id == order_id, OrderEvent.id > after_id)
+            .order_by(OrderEvent.id)
+        )
         result = await self.session.execute(stmt)
         events = result.scalars().all()
         return [
@@ -40,29 +82,199 @@ class SqlAlchemyOrderEventRepository(OrderEventRepository):
             for item in events
         ]
 
+    async def load_aggregate(self, order_id: str) -> OrderAggregate | None:
+        snapshot = await self.session.get(OrderSnapshot, order_id)
+        if snapshot:
+            aggregate = OrderAggregate.from_snapshot(
+                OrderSnapshotRecord(order_id=order_id, version=snapshot.version, state=snapshot.state)
+            )
+        else:
+            aggregate = OrderAggregate(order_id=order_id)
+
+        tail = await self.load_events(order_id, after_id=aggregate.version)
+        if not snapshot and not tail:
+            return None
+        aggregate.apply_all(tail)
+
+        if self.snapshot_interval and len(tail) >= self.snapshot_interval:
+            await self.save_snapshot(aggregate)
+        return aggregate
+
+    async def _snapshot_if_due(self, order_id: str) -> None:
+        # Один COUNT по индексу order_id: события новее снимка (или все, если снимка нет).
+        version = select(OrderSnapshot.version).where(OrderSnapshot.order_id == order_id).scalar_subquery()
+        tail = await self.session.scalar(
+            select(func.count())
+            .select_from(OrderEvent)
+            .where(OrderEvent.order_id == order_id, OrderEvent.id > func.coalesce(version, 0))
+        )
+        if tail >= self.snapshot_interval:
+            await self.load_aggregate(order_id)
+
+    async def take_snapshot(self, order_id: str) -> OrderAggregate | None:
+        """Снимок по требованию: сворачиваем историю и сохраняем, если появились новые события."""
+        aggregate = await self.load_aggregate(order_id)
+        if aggregate is None:
+            return None
+        snapshot = await self.session.get(OrderSnapshot, order_id)
+        if snapshot is None or snapshot.version < aggregate.version:
+            await self.save_snapshot(aggregate)
+        return aggregate
+
+    async def save_snapshot(self, aggregate: OrderAggregate) -> None:
+        record = aggregate.to_snapshot()
+        await self.session.merge(
+            OrderSnapshot(
+                order_id=record.order_id,
+                version=record.version,
+                state=record.state,
+                created_at=datetime.now(UTC),
+            )
+        )
+        await self.session.flush()
+
 
 class SqlAlchemyOrderStateRepository(OrderStateRepository):
-    def __init__(self, session: AsyncSession):
+    """Репозиторий состояний с опциональным write-through LRU.
+
+    Кеш разделяется между UoW и безопасен, пока этот consumer — единственный писатель
+    в свою БД. Ключи, измененные в незакоммиченной транзакции, UoW сбрасывает при откате.
+    """
+
+    def __init__(self, session: AsyncSession, cache: LRUCache[str, OrderStateRecord] | None = None):
         self.session = session
+        self.cache = cache
+        self._pending: set[str] = set()
 
     async def get_state(self, order_id: str) -> OrderStateRecord | None:
+        if self.cache is not None:
+            cached = self.cache.get(order_id)
+            if cached is not None:
+                return cached
+
         state = await self.session.get(OrderState, order_id)
         if not state:
             return None
-        return OrderStateRecord(order_id=state.order_id, status=state.status, updated_at=state.updated_at)
+        record = OrderStateRecord(order_id=state.order_id, status=state.status, updated_at=state.updated_at)
+        # Прочитанное внутри транзакции может включать ее же незакоммиченные изменения.
+        self._remember(record)
+        return record
 
     async def upsert_state(self, order_id: str, status: str) -> OrderStateRecord:
         now = datetime.now(UTC)
-        existing = await self.session.get(OrderState, order_id)
-        if existing:
+        insert = _UPSERT_INSERTS.get(self.session.get_bind().dialect.name)
+        if insert is not None:
+            (record,) = await self._upsert_rows(insert, [{"order_id": order_id, "status": status, "updated_at": now}])
+            self._remember(record)
+            return record
+
+        known = self.cache.peek(order_id) if self.cache is not None else None
+        if known is None:
+            known = await self.session.get(OrderState, order_id)
+        if known:
             await self.session.execute(
                 update(OrderState)
                 .where(OrderState.order_id == order_id)
                 .values(status=status, updated_at=now)
             )
-            return OrderStateRecord(order_id=order_id, status=status, updated_at=now)
+            record = OrderStateRecord(order_id=order_id, status=status, updated_at=now)
+        else:
+            state = OrderState(order_id=order_id, status=status, updated_at=now)
+            self.session.add(state)
+            await self.session.flush()
+            record = OrderStateRecord(order_id=state.order_id, status=state.status, updated_at=state.updated_at)
 
-        state = OrderState(order_id=order_id, status=status, updated_at=now)
-        self.session.add(state)
-        await self.session.flush()
-        return OrderStateRecord(order_id=state.order_id, status=state.status, updated_at=state.updated_at)
+        self._remember(record)
+        return record
+
+    async def bulk_upsert_states(self, records: Iterable[OrderStateRecord]) -> int:
+        """Пишем много состояний подготовленным INSERT ... ON CONFLICT через executemany, чанками."""
+        now = datetime.now(UTC)
+        # Каждая строка executemany — отдельное выполнение, так что повторы ключа сами дали бы
+        # last-write-wins. Схлопываем их заранее, чтобы не гонять лишние строки и вернуть число
+        # разных заказов, а не входных записей.
+        rows = {
+            record.order_id: {
+                "order_id": record.order_id,
+                "status": record.status,
+                "updated_at": record.updated_at or now,
+            }
+            for record in records
+        }
+        insert = _UPSERT_INSERTS.get(self.session.get_bind().dialect.name)
+        if insert is None:
+            for row in rows.values():
+                await self.upsert_state(row["order_id"], row["status"])
+            return len(rows)
+
+        batch = list(rows.values())
+        stmt = _upsert_statement(insert)
+        connection = await self.session.connection()
+        for start in range(0, len(batch), _BULK_UPSERT_CHUNK):
+            await connection.execute(stmt, batch[start : start + _BULK_UPSERT_CHUNK])
+        # Запись шла мимо ORM: загруженные в сессию объекты состояний могли устареть.
+        self.session.expire_all()
+        for row in batch:
+            self._remember(OrderStateRecord(**row))
+        return len(batch)
+
+    async def _upsert_rows(self, insert, rows: list[dict]) -> list[OrderStateRecord]:
+        stmt = _upsert_statement(insert, rows).returning(OrderState)
+        # populate_existing обновляет объекты, уже загруженные в identity map этой сессии.
+        result = await self.session.scalars(stmt, execution_options={"populate_existing": True})
+        return [
+            OrderStateRecord(order_id=state.order_id, status=state.status, updated_at=state.updated_at)
+            for state in result
+        ]
+
+    def _remember(self, record: OrderStateRecord) -> None:
+        if self.cache is not None:
+            self.cache.put(record.order_id, record)
+            self._pending.add(record.order_id)
+
+    def confirm_pending(self) -> None:
+        """Транзакция закоммичена: записанные в кеш значения стали истинными."""
+        self._pending.clear()
+
+    def discard_pending(self) -> None:
+        """Транзакция (или savepoint) откатилась: выкидываем из кеша все незакоммиченные ключи."""
+        if self.cache is not None:
+            for order_id in self._pending:
+                self.cache.invalidate(order_id)
+        self._pending.clear()
+
+
+class SqlAlchemyProcessedCommandRepository(ProcessedCommandRepository):
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def mark_processed(self, command_id: str) -> bool:
+        insert = _UPSERT_INSERTS.get(self.session.get_bind().dialect.name)
+        if insert is None:
+            if await self.session.get(ProcessedCommand, command_id) is not None:
+                return False
+            self.session.add(ProcessedCommand(command_id=command_id))
+            await self.session.flush()
+            return True
+
+        # Один INSERT ... ON CONFLICT DO NOTHING: отметка и проверка на повтор разом.
+        stmt = insert(ProcessedCommand).values(command_id=command_id, processed_at=datetime.now(UTC))
+        result = await self.session.execute(stmt.on_conflict_do_nothing(index_elements=[ProcessedCommand.command_id]))
+        return result.rowcount == 1
+
+    async def record_events(self, command_id: str, events: Sequence[OrderEventRecord]) -> None:
+        await self.session.execute(
+            update(ProcessedCommand)
+            .where(ProcessedCommand.command_id == command_id)
+            .values(events=[{"type": e.type, "order_id": e.order_id, "payload": e.payload} for e in events])
+        )
+
+    async def load_events(self, command_id: str) -> list[OrderEventRecord]:
+        stored = await self.session.scalar(
+            select(ProcessedCommand.events).where(ProcessedCommand.command_id == command_id)
+        )
+        return [OrderEventRecord(**event) for event in stored or ()]
+
+    async def purge(self, older_than: datetime) -> int:
+        result = await self.session.execute(delete(ProcessedCommand).where(ProcessedCommand.processed_at < older_than))
+        return result.rowcount
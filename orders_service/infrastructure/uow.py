@@ -1,28 +1,40 @@
 from contextlib import asynccontextmanager
-from typing import AsyncContextManager
+from typing import AsyncContextManager, AsyncIterator
 
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
+from orders_service.domain.models import OrderStateRecord
 from orders_service.domain.uow import UoWFactory, OrderUnitOfWork
+from orders_service.infrastructure.cache import LRUCache
 from orders_service.infrastructure.repositories import (
     SqlAlchemyOrderEventRepository,
     SqlAlchemyOrderStateRepository,
+    SqlAlchemyProcessedCommandRepository,
 )
 
 
 class SqlAlchemyOrderUnitOfWork(OrderUnitOfWork):
     """UoW, инкапсулирующий сессию БД и репозитории."""
 
-    def __init__(self, session_maker: async_sessionmaker[AsyncSession]):
+    def __init__(
+        self,
+        session_maker: async_sessionmaker[AsyncSession],
+        state_cache: LRUCache[str, OrderStateRecord] | None = None,
+        snapshot_interval: int = 0,
+    ):
         self._session_maker = session_maker
+        self._state_cache = state_cache
+        self._snapshot_interval = snapshot_interval
         self._session: AsyncSession | None = None
         self.events = None
         self.state = None
+        self.processed = None
 
     async def __aenter__(self) -> "SqlAlchemyOrderUnitOfWork":
         self._session = self._session_maker()
-        self.events = SqlAlchemyOrderEventRepository(self._session)
-        self.state = SqlAlchemyOrderStateRepository(self._session)
+        self.events = SqlAlchemyOrderEventRepository(self._session, snapshot_interval=self._snapshot_interval)
+        self.state = SqlAlchemyOrderStateRepository(self._session, cache=self._state_cache)
+        self.processed = SqlAlchemyProcessedCommandRepository(self._session)
         return self
 
     async def __aexit__(self, exc_type, exc, tb) -> None:
@@ -30,21 +42,40 @@ class SqlAlchemyOrderUnitOfWork(OrderUnitOfWork):
             return
         if exc:
             await self.rollback()
+        # Все, что не было закоммичено, сессия отбросит при закрытии.
+        self.state.discard_pending()
         await self._session.close()
 
     async def commit(self) -> None:
         if self._session:
             await self._session.commit()
+            self.state.confirm_pending()
 
     async def rollback(self) -> None:
         if self._session:
             await self._session.rollback()
+            self.state.discard_pending()
+
+    @asynccontextmanager
+    async def savepoint(self) -> AsyncIterator[None]:
+        try:
+            async with self._session.begin_nested():
+                yield
+        except Exception:
+            self.state.discard_pending()
+            raise
 
 
-def create_uow_factory(session_maker: async_sessionmaker[AsyncSession]) -> UoWFactory:
+def create_uow_factory(
+    session_maker: async_sessionmaker[AsyncSession],
+    state_cache: LRUCache[str, OrderStateRecord] | None = None,
+    snapshot_interval: int = 0,
+) -> UoWFactory:
     @asynccontextmanager
     async def _factory() -> AsyncContextManager[SqlAlchemyOrderUnitOfWork]:
-        async with SqlAlchemyOrderUnitOfWork(session_maker) as uow:
+        async with SqlAlchemyOrderUnitOfWork(
+            session_maker, state_cache=state_cache, snapshot_interval=snapshot_interval
+        ) as uow:
             yield uow
 
     return _factory
@@ -3,17 +3,86 @@ import logging
 
 from orders_service import config
 from orders_service.application.service import OrderCommandService
-from orders_service.deps import build_dependencies, consume_commands
+from orders_service.deps import build_dependencies, consume_command_batches, consume_commands
+from orders_service.infrastructure.metrics import (
+    ConsumerMetrics,
+    InstrumentedEventPublisher,
+    instrument_uow_factory,
+    start_metrics_server,
+)
 
 log = logging.getLogger("order_service")
 
 
+async def purge_processed_periodically(service: OrderCommandService, ttl: float, interval: float) -> None:
+    """Фоновая чистка processed_commands: без нее таблица растет бесконечно."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            purged = await service.purge_processed(ttl)
+        except Exception:
+            log.exception("Не удалось почистить processed_commands")
+            continue
+        if purged:
+            log.info("Удалено %s устаревших отметок processed_commands", purged)
+
+
 async def bootstrap() -> None:
     deps = await build_dependencies()
-    service = OrderCommandService(uow_factory=deps.uow_factory, publisher=deps.publisher)
+    metrics = ConsumerMetrics() if config.settings.metrics_port else None
+    uow_factory, publisher = deps.uow_factory, deps.publisher
+    if metrics is not None:
+        uow_factory = instrument_uow_factory(uow_factory, metrics)
+        publisher = InstrumentedEventPublisher(publisher, metrics)
+    service = OrderCommandService(
+        uow_factory=uow_factory,
+        publisher=publisher,
+        processed=deps.processed_commands,
+    )
+
+    server = None
+    if metrics is not None:
+        metrics.add_source(lambda: {"duplicates": service.duplicates})
+        for name, cache in (("processed_cache", deps.processed_commands), ("state_cache", deps.state_cache)):
+            if cache is not None:
+                metrics.add_source(lambda name=name, cache=cache: {f"{name}_{k}": v for k, v in cache.stats().items()})
+        server = await start_metrics_server(metrics, config.settings.metrics_host, config.settings.metrics_port)
+        log.info("Metrics served on %s:%s", config.settings.metrics_host, config.settings.metrics_port)
+
+    purge_task = None
+    if config.settings.processed_purge_interval > 0:
+        purge_task = asyncio.create_task(
+            purge_processed_periodically(
+                service, config.settings.processed_ttl, config.settings.processed_purge_interval
+            )
+        )
 
     log.info("Order service started, listening commands topic %s", config.settings.commands_topic)
-    await consume_commands(deps.consumer, service.handle_command)
+    try:
+        if config.settings.command_batch_size > 1:
+            await consume_command_batches(
+                deps.consumer,
+                service.handle_batch,
+                max_records=config.settings.command_batch_size,
+                timeout_ms=config.settings.command_batch_timeout_ms,
+                metrics=metrics,
+            )
+            return
+
+        await consume_commands(
+            deps.consumer,
+            service.handle_command,
+            lanes=config.settings.command_lanes,
+            lane_queue_size=config.settings.lane_queue_size,
+            metrics=metrics,
+            rebalance=deps.rebalance,
+        )
+    finally:
+        if purge_task is not None:
+            purge_task.cancel()
+        if server is not None:
+            server.close()
+            await server.wait_closed()
 
 
 def main() -> None:
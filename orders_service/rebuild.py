@@ -0,0 +1,199 @@
+"""Пересборка проекции order_states из order_events.
+
+Запуск: python -m orders_service.rebuild --workers 4 --truncate
+
+События читаются чанками по id, каждый чанк — серверным курсором в короткой транзакции,
+поэтому читатели не держат блокировку БД во время записи соседних воркеров. Работа делится
+между процессами по хешу order_id. Свернутые состояния сбрасываются bulk-upsert'ом каждые
+--flush-every заказов, так что память воркера ограничена этим числом плюс чанком, а не числом заказов.
+Заказ, чьи события попали в разные сбросы, пишется дважды: последний upsert несет итоговый статус.
+Перед пересборкой остановите consumer: он держит кеш состояний и пишет в ту же таблицу.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+from sqlalchemy import delete, event, func, select
+
+from orders_service.config import settings
+from orders_service.domain.events import STATUS_BY_EVENT
+from orders_service.domain.models import OrderStateRecord
+from orders_service.infrastructure.db import create_engine_and_sessionmaker
+from orders_service.infrastructure.models import OrderEvent, OrderState
+from orders_service.infrastructure.repositories import SqlAlchemyOrderStateRepository
+
+log = logging.getLogger("order_service.rebuild")
+
+
+@dataclass
+class PartitionStats:
+    partition: int
+    scanned: int = 0
+    events: int = 0
+    orders: int = 0
+    seconds: float = 0.0
+
+
+def partition_of(order_id: str, partitions: int) -> int:
+    return zlib.crc32(order_id.encode("utf-8")) % partitions
+
+
+def _register_sqlite_partition_function(dbapi_connection, connection_record) -> None:
+    dbapi_connection.create_function("order_partition", 2, partition_of, deterministic=True)
+
+
+async def rebuild_partition(
+    database_url: str,
+    partition: int = 0,
+    partitions: int = 1,
+    chunk_size: int = 10_000,
+    progress_every: int = 500_000,
+    flush_every: int = 50_000,
+) -> PartitionStats:
+    """Сворачиваем события своей партиции заказов и пишем состояния bulk-upsert'ом.
+
+    stats.orders — число записанных строк: заказ, попавший в несколько сбросов, считается в каждом.
+    """
+    started = time.perf_counter()
+    stats = PartitionStats(partition=partition)
+    engine, session_maker = create_engine_and_sessionmaker(database_url)
+
+    stmt = select(OrderEvent.id, OrderEvent.order_id, OrderEvent.type, OrderEvent.created_at)
+    # Партицию фильтруем на стороне БД, чтобы не гонять чужие строки через драйвер.
+    client_side = False
+    if partitions > 1 and engine.dialect.name == "sqlite":
+        event.listen(engine.sync_engine, "connect", _register_sqlite_partition_function)
+        stmt = stmt.where(func.order_partition(OrderEvent.order_id, partitions) == partition)
+    elif partitions > 1 and engine.dialect.name == "postgresql":
+        stmt = stmt.where(func.abs(func.hashtext(OrderEvent.order_id)) % partitions == partition)
+    else:
+        client_side = partitions > 1
+
+    folded: dict[str, OrderStateRecord] = {}
+    last_id = 0
+    next_report = progress_every
+
+    async def flush() -> None:
+        async with session_maker() as session:
+            stats.orders += await SqlAlchemyOrderStateRepository(session).bulk_upsert_states(folded.values())
+            await session.commit()
+        folded.clear()
+
+    try:
+        while True:
+            fetched = 0
+            async with engine.connect() as conn:
+                chunk = stmt.where(OrderEvent.id > last_id).order_by(OrderEvent.id).limit(chunk_size)
+                result = await conn.stream(chunk)
+                async for event_id, order_id, event_type, created_at in result:
+                    fetched += 1
+                    last_id = event_id
+                    if client_side and partition_of(order_id, partitions) != partition:
+                        continue
+                    stats.events += 1
+                    status = STATUS_BY_EVENT.get(event_type)
+                    if status is not None:
+                        folded[order_id] = OrderStateRecord(order_id=order_id, status=status, updated_at=created_at)
+            stats.scanned += fetched
+            # Пишем вне серверного курсора: читатель не держит транзакцию, пока идет запись.
+            if len(folded) >= flush_every:
+                await flush()
+            if stats.scanned >= next_report:
+                elapsed = time.perf_counter() - started
+                log.info(
+                    "Партиция %s/%s: прочитано %s событий, записано %s заказов, %.0f событий/с",
+                    partition + 1,
+                    partitions,
+                    stats.scanned,
+                    stats.orders,
+                    stats.scanned / elapsed,
+                )
+                next_report += progress_every
+            if fetched < chunk_size:
+                break
+
+        if folded:
+            await flush()
+    finally:
+        await engine.dispose()
+
+    stats.seconds = time.perf_counter() - started
+    return stats
+
+
+def _run_partition(args: tuple) -> PartitionStats:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(processName)s %(message)s")
+    return asyncio.run(rebuild_partition(*args))
+
+
+async def _truncate_states(database_url: str) -> None:
+    engine, session_maker = create_engine_and_sessionmaker(database_url)
+    try:
+        async with session_maker() as session:
+            await session.execute(delete(OrderState))
+            await session.commit()
+    finally:
+        await engine.dispose()
+
+
+def rebuild(
+    database_url: str,
+    workers: int = 1,
+    chunk_size: int = 10_000,
+    truncate: bool = False,
+    progress_every: int = 500_000,
+    flush_every: int = 50_000,
+) -> tuple[list[PartitionStats], float]:
+    started = time.perf_counter()
+    if truncate:
+        asyncio.run(_truncate_states(database_url))
+
+    jobs = [
+        (database_url, partition, workers, chunk_size, progress_every, flush_every) for partition in range(workers)
+    ]
+    if workers == 1:
+        results = [asyncio.run(rebuild_partition(*jobs[0]))]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_run_partition, jobs))
+    return results, time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Пересборка order_states из order_events")
+    parser.add_argument("--database-url", default=settings.database_url)
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--chunk-size", type=int, default=10_000)
+    parser.add_argument("--progress-every", type=int, default=500_000)
+    parser.add_argument("--flush-every", type=int, default=50_000, help="сколько заказов держать в памяти до записи")
+    parser.add_argument("--truncate", action="store_true", help="очистить order_states перед пересборкой")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(processName)s %(message)s")
+    results, elapsed = rebuild(
+        args.database_url,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        truncate=args.truncate,
+        progress_every=args.progress_every,
+        flush_every=args.flush_every,
+    )
+    events_total = sum(item.events for item in results)
+    orders_total = sum(item.orders for item in results)
+    log.info(
+        "Готово: %s событий, %s заказов за %.1f с (%.0f событий/с, воркеров: %s)",
+        events_total,
+        orders_total,
+        elapsed,
+        events_total / elapsed if elapsed else 0.0,
+        args.workers,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,7 @@ from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
 
 from orders_service.application.service import OrderCommandService
 from orders_service.domain.uow import UoWFactory
+from orders_service.infrastructure.db import enable_sqlite_savepoints
 from orders_service.infrastructure.models import Base
 from orders_service.infrastructure.uow import create_uow_factory
 from orders_service.tests.fakes import FakePublisher, FakeUoW
@@ -31,6 +32,7 @@ def event_loop() -> Iterator[asyncio.AbstractEventLoop]:
 async def async_engine(tmp_path) -> AsyncIterator[AsyncEngine]:
     db_path = tmp_path / "test.db"
     engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    enable_sqlite_savepoints(engine)
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
     try:
@@ -1,19 +1,36 @@
+import asyncio
+from contextlib import asynccontextmanager
 from dataclasses import dataclass, field
+from datetime import UTC, datetime
 from typing import Any
 
-from orders_service.domain.models import OrderStateRecord
+from aiokafka import TopicPartition
+
+from orders_service.domain.aggregate import OrderAggregate
+from orders_service.domain.models import OrderEventRecord, OrderStateRecord
 from orders_service.domain.uow import OrderUnitOfWork
 
 
 @dataclass
 class FakeMessage:
     value: bytes
+    topic: str = "orders_commands"
+    partition: int = 0
+    offset: int = 0
+    headers: tuple = ()
 
 
 class FakeConsumer:
     def __init__(self, messages):
         self._messages = messages
+        self.highwaters: dict[tuple[str, int], int] = {}
+        for msg in messages:
+            key = (msg.topic, msg.partition)
+            self.highwaters[key] = max(self.highwaters.get(key, 0), msg.offset + 1)
+        self.positions: dict[tuple[str, int], int] = {}
+        self.revoked: set[tuple[str, int]] = set()
         self.committed = 0
+        self.commits: list[dict] = []
         self.stopped = False
 
     def __aiter__(self):
@@ -22,10 +39,36 @@ class FakeConsumer:
     async def __anext__(self):
         if not self._messages:
             raise StopAsyncIteration
-        return self._messages.pop(0)
+        msg = self._messages.pop(0)
+        self.positions[(msg.topic, msg.partition)] = msg.offset + 1
+        return msg
 
-    async def commit(self):
+    async def getmany(self, timeout_ms: int = 0, max_records: int | None = None):
+        if not self._messages:
+            await asyncio.sleep(timeout_ms / 1000)
+            return {}
+        batch = self._messages[:max_records]
+        del self._messages[: len(batch)]
+        records: dict[tuple[str, int], list] = {}
+        for msg in batch:
+            records.setdefault((msg.topic, msg.partition), []).append(msg)
+            self.positions[(msg.topic, msg.partition)] = msg.offset + 1
+        return records
+
+    def highwater(self, tp):
+        # Как у брокера: следующий оффсет после последнего сообщения партиции.
+        return self.highwaters.get((tp.topic, tp.partition))
+
+    async def position(self, tp):
+        return self.positions.get((tp.topic, tp.partition), 0)
+
+    def assignment(self):
+        return {TopicPartition(*key) for key in self.highwaters if key not in self.revoked}
+
+    async def commit(self, offsets=None):
         self.committed += 1
+        if offsets:
+            self.commits.append(dict(offsets))
 
     async def stop(self):
         self.stopped = True
@@ -35,9 +78,16 @@ class FakeConsumer:
 class FakePublisher:
     published: list[dict[str, Any]] = field(default_factory=list)
 
+    batches: int = 0
+
     async def publish_event(self, event_type: str, order_id: str, payload: dict) -> None:
         self.published.append({"type": event_type, "order_id": order_id, "payload": payload})
 
+    async def publish_events(self, events) -> None:
+        self.batches += 1
+        for event in events:
+            await self.publish_event(event.type, event.order_id, event.payload)
+
     @property
     def events(self) -> list[dict[str, Any]]:
         # Совместимость с тестами, ожидающими .events
@@ -49,10 +99,19 @@ class FakeOrderEventsRepo:
         self.items = []
 
     async def append_event(self, order_id: str, event_type: str, payload: dict) -> None:
-        self.items.append({"order_id": order_id, "type": event_type, "payload": payload})
+        self.items.append({"id": len(self.items) + 1, "order_id": order_id, "type": event_type, "payload": payload})
 
-    async def load_events(self, order_id: str):
-        return [e for e in self.items if e["order_id"] == order_id]
+    async def load_events(self, order_id: str, after_id: int = 0):
+        return [e for e in self.items if e["order_id"] == order_id and e["id"] > after_id]
+
+    async def load_aggregate(self, order_id: str):
+        history = [OrderEventRecord(**e) for e in await self.load_events(order_id)]
+        if not history:
+            return None
+        return OrderAggregate(order_id=order_id).apply_all(history)
+
+    async def take_snapshot(self, order_id: str):
+        return await self.load_aggregate(order_id)
 
 
 class FakeOrderStateRepo:
@@ -67,11 +126,43 @@ class FakeOrderStateRepo:
         self.items[order_id] = rec
         return rec
 
+    async def bulk_upsert_states(self, records) -> int:
+        written = {record.order_id: record for record in records}
+        self.items.update(written)
+        return len(written)
+
+
+class FakeProcessedCommandsRepo:
+    def __init__(self):
+        # command_id -> processed_at
+        self.ids: dict[str, datetime] = {}
+        self.events: dict[str, list[OrderEventRecord]] = {}
+
+    async def mark_processed(self, command_id: str) -> bool:
+        if command_id in self.ids:
+            return False
+        self.ids[command_id] = datetime.now(UTC)
+        return True
+
+    async def record_events(self, command_id: str, events) -> None:
+        self.events[command_id] = list(events)
+
+    async def load_events(self, command_id: str) -> list[OrderEventRecord]:
+        return list(self.events.get(command_id, []))
+
+    async def purge(self, older_than: datetime) -> int:
+        stale = [command_id for command_id, at in self.ids.items() if at < older_than]
+        for command_id in stale:
+            del self.ids[command_id]
+            self.events.pop(command_id, None)
+        return len(stale)
+
 
 class FakeUoW(OrderUnitOfWork):
     def __init__(self):
         self.events = FakeOrderEventsRepo()
         self.state = FakeOrderStateRepo()
+        self.processed = FakeProcessedCommandsRepo()
         self.committed = False
 
     async def __aenter__(self) -> "FakeUoW":
@@ -86,3 +177,16 @@ class FakeUoW(OrderUnitOfWork):
 
     async def rollback(self) -> None:
         self.committed = False
+
+    @asynccontextmanager
+    async def savepoint(self):
+        events_snapshot = list(self.events.items)
+        state_snapshot = dict(self.state.items)
+        processed_snapshot = dict(self.processed.ids), dict(self.processed.events)
+        try:
+            yield
+        except Exception:
+            self.events.items = events_snapshot
+            self.state.items = state_snapshot
+            self.processed.ids, self.processed.events = processed_snapshot
+            raise
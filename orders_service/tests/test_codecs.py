@@ -0,0 +1,40 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+from orders_service.infrastructure.codecs import MessageDecoder
+
+# Модуль шлюза грузим по пути: общего пакета у сервисов нет, как и в проде.
+_GATEWAY_CODECS = Path(__file__).resolve().parents[2] / "api_gateway" / "app" / "codecs.py"
+
+
+def _load_gateway_codecs():
+    spec = importlib.util.spec_from_file_location("gateway_codecs", _GATEWAY_CODECS)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+gateway_codecs = _load_gateway_codecs()
+
+COMMAND = {
+    "event_type": "OrderCreated",
+    "payload": {"order_id": "42", "item": "книга", "amount": 10.5, "tags": ["a", "b"], "note": None},
+    "source": "api_gateway",
+}
+
+
+@pytest.mark.parametrize("name", gateway_codecs.available_codecs())
+def test_gateway_encoded_messages_decode_in_orders_service(name):
+    codec = gateway_codecs.get_codec(name)
+    value = codec.encode(COMMAND)
+    headers = gateway_codecs.content_type_headers(codec)
+
+    assert MessageDecoder().decode(value, headers) == COMMAND
+
+
+def test_gateway_json_without_headers_decodes_as_json():
+    # Так пишут версии шлюза до появления кодеков.
+    value = gateway_codecs.JsonCodec().encode(COMMAND)
+    assert MessageDecoder().decode(value, None) == COMMAND
@@ -1,11 +1,20 @@
 from dataclasses import dataclass
+import asyncio
 import json
 
 import pytest
+from aiokafka import TopicPartition
 
 from orders_service.application.service import OrderCommandService
 from orders_service.domain import commands, events
-from orders_service.infrastructure.kafka import consume_commands
+from orders_service.infrastructure.codecs import content_type_headers, get_codec
+from orders_service.infrastructure.kafka import (
+    OffsetRebalanceListener,
+    _OffsetCommitter,
+    _PartitionOffsets,
+    consume_command_batches,
+    consume_commands,
+)
 from orders_service.tests.fakes import FakeMessage, FakeConsumer
 
 
@@ -22,3 +31,136 @@ async def test_consume_commands_end_to_end(fake_uow_factory, fake_publisher):
     assert consumer.committed == 1
     assert consumer.stopped is True
     assert fake_publisher.events[0]["type"] == events.ORDER_CREATED
+
+
+@pytest.mark.asyncio
+async def test_consume_commands_sharded_keeps_order_and_commits_lowest_offset():
+    # Заказы "1" и "4" попадают в разные лейны при lanes=2.
+    gate = asyncio.Event()
+    handled = []
+
+    async def handler(command: dict) -> None:
+        if command["order_id"] == "1":
+            await gate.wait()
+        handled.append((command["order_id"], command["seq"]))
+
+    payloads = [{"order_id": "1", "seq": 0}, {"order_id": "4", "seq": 1}, {"order_id": "4", "seq": 2}]
+    messages = [
+        FakeMessage(value=json.dumps(p).encode("utf-8"), offset=offset) for offset, p in enumerate(payloads)
+    ]
+    consumer = FakeConsumer(messages)
+
+    task = asyncio.create_task(consume_commands(consumer, handler, lanes=2))
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+    # Заказ "4" обработан, пока "1" висит, но оффсет не коммитится дальше незавершенного.
+    assert handled == [("4", 1), ("4", 2)]
+    assert consumer.commits == []
+
+    gate.set()
+    await asyncio.wait_for(task, timeout=1)
+
+    assert handled[-1] == ("1", 0)
+    assert consumer.commits[-1] == {TopicPartition("orders_commands", 0): 3}
+    assert consumer.stopped is True
+
+
+def test_partition_offsets_reset_when_lower_offsets_redelivered():
+    offsets = _PartitionOffsets()
+    for offset in range(5):
+        offsets.track(offset)
+    offsets.done(0)
+    offsets.done(1)
+    assert offsets.committable == 2
+
+    # После ребаланса партицию перечитывают с закоммиченного оффсета 2.
+    offsets.track(2)
+    offsets.track(3)
+    assert offsets.committable is None
+
+    offsets.done(2)
+    offsets.done(3)
+    assert offsets.committable == 4
+    # Оффсет 4 из прошлого поколения уже не учитывается и позицию не портит.
+    assert offsets.done(4) is False
+    assert offsets.committable == 4
+
+
+@pytest.mark.asyncio
+async def test_revoked_partition_offsets_are_not_committed():
+    tp0, tp1 = TopicPartition("orders_commands", 0), TopicPartition("orders_commands", 1)
+    consumer = FakeConsumer([])
+    committer = _OffsetCommitter(consumer)
+    listener = OffsetRebalanceListener()
+    listener.committer = committer
+    for tp in (tp0, tp1):
+        committer.track(tp, 0)
+        committer.track(tp, 1)
+    committer.done(tp1, 0)
+
+    # Перед отзывом готовое коммитится, пока партиция еще наша.
+    await listener.on_partitions_revoked({tp1})
+    assert consumer.commits == [{tp1: 1}]
+
+    # Команда отозванной партиции дообработалась в лейне — ее оффсет не коммитим.
+    committer.done(tp1, 1)
+    committer.done(tp0, 0)
+    await committer.flush()
+    assert consumer.commits[-1] == {tp0: 1}
+
+    # Назначенная заново партиция учитывается с нуля, с закоммиченного оффсета.
+    await listener.on_partitions_assigned({tp1})
+    committer.track(tp1, 1)
+    committer.done(tp1, 1)
+    await committer.flush()
+    assert consumer.commits[-1] == {tp1: 2}
+
+
+@pytest.mark.asyncio
+async def test_consume_command_batches_commits_once_per_batch(fake_uow_factory, fake_publisher):
+    service = OrderCommandService(fake_uow_factory, fake_publisher)
+    payloads = [
+        {"type": commands.CREATE_ORDER, "order_id": "1"},
+        {"type": commands.CANCEL_ORDER, "order_id": "missing"},
+        {"type": commands.MARK_PAID, "order_id": "1"},
+    ]
+    consumer = FakeConsumer([FakeMessage(value=json.dumps(p).encode("utf-8")) for p in payloads])
+
+    task = asyncio.create_task(consume_command_batches(consumer, service.handle_batch, max_records=10, timeout_ms=1))
+    for _ in range(20):
+        await asyncio.sleep(0)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert consumer.committed == 1
+    assert consumer.stopped is True
+    assert fake_publisher.batches == 1
+    assert [e["type"] for e in fake_publisher.published] == [events.ORDER_CREATED, events.ORDER_PAID]
+
+
+@pytest.mark.asyncio
+async def test_commands_decoded_by_content_type_header():
+    received = []
+
+    async def handler(command: dict) -> None:
+        received.append(command["order_id"])
+
+    orjson_codec = get_codec("orjson")
+    messages = [
+        # Старый отправитель: без заголовка, stdlib JSON.
+        FakeMessage(value=json.dumps({"order_id": "1"}).encode("utf-8"), offset=0),
+        FakeMessage(
+            value=orjson_codec.encode({"order_id": "2"}),
+            offset=1,
+            headers=tuple(content_type_headers(orjson_codec)),
+        ),
+        FakeMessage(value=b"\x81", offset=2, headers=(("content-type", b"application/x-unknown"),)),
+    ]
+    consumer = FakeConsumer(messages)
+
+    await consume_commands(consumer, handler)
+
+    assert received == ["1", "2"]
+    assert consumer.committed == 3
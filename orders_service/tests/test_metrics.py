@@ -0,0 +1,129 @@
+import asyncio
+import json
+import re
+from pathlib import Path
+
+import pytest
+from aiokafka import TopicPartition
+
+from orders_service.application.service import OrderCommandService
+from orders_service.domain import commands
+from orders_service.infrastructure.kafka import consume_commands
+from orders_service.infrastructure import metrics as metrics_module
+from orders_service.infrastructure.metrics import (
+    ConsumerMetrics,
+    InstrumentedEventPublisher,
+    RateMeter,
+    instrument_uow_factory,
+    start_metrics_server,
+)
+from orders_service.tests.fakes import FakeConsumer, FakeMessage
+
+
+@pytest.mark.asyncio
+async def test_consume_commands_records_latency_errors_and_lag(fake_uow_factory, fake_publisher):
+    metrics = ConsumerMetrics()
+    service = OrderCommandService(
+        instrument_uow_factory(fake_uow_factory, metrics), InstrumentedEventPublisher(fake_publisher, metrics)
+    )
+    payloads = [
+        {"type": commands.CREATE_ORDER, "order_id": "1"},
+        {"type": commands.CREATE_ORDER, "order_id": "1"},
+        {"type": commands.SHIP_ORDER, "order_id": "missing"},
+    ]
+    messages = [FakeMessage(value=json.dumps(p).encode("utf-8"), offset=offset) for offset, p in enumerate(payloads)]
+    messages.append(FakeMessage(value=b"not json", offset=3))
+    consumer = FakeConsumer(messages)
+    # Брокер уже принял еще два сообщения, которые consumer не прочитал.
+    consumer.highwaters[("orders_commands", 0)] = 6
+
+    await consume_commands(consumer, service.handle_command, metrics=metrics)
+
+    assert metrics.commands.value(commands.CREATE_ORDER, "ok") == 1
+    assert metrics.commands.value(commands.CREATE_ORDER, "error") == 1
+    assert metrics.errors.value("OrderAlreadyExists") == 1
+    assert metrics.errors.value("OrderNotFound") == 1
+    assert metrics.commands.value("other", "error") == 1
+    assert metrics.command_duration.count(commands.CREATE_ORDER) == 2
+    assert metrics.commit_duration.count() == 1
+    assert metrics.publish_duration.count() == 1
+    assert metrics.lag() == {TopicPartition("orders_commands", 0): 2}
+
+
+@pytest.mark.asyncio
+async def test_lag_starts_from_consumer_position_and_drops_revoked_partitions():
+    metrics = ConsumerMetrics()
+    # Группа уже прочитала партицию до оффсета 10; процесс еще ничего не закоммитил.
+    consumer = FakeConsumer([FakeMessage(value=b"{}", offset=10), FakeMessage(value=b"{}", offset=11)])
+    tp = TopicPartition("orders_commands", 0)
+
+    await consumer.__anext__()
+    await metrics.observe_highwater(consumer, tp)
+    assert metrics.lag() == {tp: 1}
+
+    consumer.revoked.add(("orders_commands", 0))
+    assert metrics.lag() == {}
+    assert metrics.health()["partitions"] == {}
+
+
+def test_label_values_are_escaped():
+    metrics = ConsumerMetrics()
+    metrics.errors.inc('Bad"Error\\n')
+    assert 'orders_command_errors_total{error="Bad\\"Error\\\\n"} 1' in metrics.render()
+
+
+def test_metric_primitives_match_gateway_copy():
+    gateway = Path(__file__).resolve().parents[2] / "api_gateway" / "app" / "metrics.py"
+
+    def primitives(path: Path) -> str:
+        # От _format_labels до первого верхнеуровневого объекта после MetricsRegistry.
+        source = path.read_text(encoding="utf-8")
+        start = source.index("\ndef _format_labels(")
+        registry = source.index("\nclass MetricsRegistry:")
+        end = re.compile(r"^(class|def|async def) ", re.M).search(source, registry + len("\nclass MetricsRegistry:"))
+        return source[start : end.start()].strip()
+
+    assert "_escape(value)" in primitives(Path(metrics_module.__file__))
+    assert primitives(Path(metrics_module.__file__)) == primitives(gateway)
+
+
+@pytest.mark.asyncio
+async def test_metrics_server_serves_prometheus_text_and_health():
+    metrics = ConsumerMetrics()
+    metrics.observe_command(commands.CREATE_ORDER, 0.002)
+    metrics.add_source(lambda: {"duplicates": 3})
+    server = await start_metrics_server(metrics, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+
+    async def get(path: str) -> tuple[str, str]:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        response = (await reader.read()).decode()
+        writer.close()
+        head, _, body = response.partition("\r\n\r\n")
+        return head.splitlines()[0], body
+
+    try:
+        status, body = await get("/metrics")
+        assert status == "HTTP/1.0 200 OK"
+        assert f'orders_command_duration_seconds_count{{type="{commands.CREATE_ORDER}"}} 1' in body
+        assert 'orders_component_stat{name="duplicates"} 3' in body
+
+        status, body = await get("/health")
+        assert json.loads(body)["lag"] == 0
+        assert (await get("/nope"))[0] == "HTTP/1.0 404 Not Found"
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+def test_rate_meter_counts_full_seconds_in_window():
+    now = [100.5]
+    meter = RateMeter(window=10, clock=lambda: now[0])
+    for _ in range(20):
+        meter.add()
+    now[0] = 101.2
+    meter.add(5)
+    assert meter.rate() == 2.0
+    now[0] = 111.0
+    assert meter.rate() == 0.5
@@ -0,0 +1,69 @@
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from orders_service.domain import events
+from orders_service.infrastructure.models import OrderState
+from orders_service.infrastructure.repositories import (
+    SqlAlchemyOrderEventRepository,
+    SqlAlchemyOrderStateRepository,
+)
+from orders_service.rebuild import rebuild_partition
+
+
+@pytest.mark.asyncio
+async def test_rebuild_partitions_restore_order_states(
+    async_engine: AsyncEngine, session_maker: async_sessionmaker[AsyncSession]
+):
+    async with session_maker() as session:
+        repo = SqlAlchemyOrderEventRepository(session)
+        for order_id in ("1", "2", "3", "4"):
+            await repo.append_event(order_id, events.ORDER_CREATED, {"order_id": order_id})
+        await repo.append_event("2", events.ORDER_PAID, {"order_id": "2"})
+        await repo.append_event("3", events.ORDER_CANCELLED, {"order_id": "3"})
+        await repo.append_event("2", events.ORDER_SHIPPED, {"order_id": "2"})
+        session.add(OrderState(order_id="2", status="corrupted"))
+        await session.commit()
+
+    database_url = async_engine.url.render_as_string(hide_password=False)
+    first = await rebuild_partition(database_url, partition=0, partitions=2, chunk_size=2)
+    second = await rebuild_partition(database_url, partition=1, partitions=2, chunk_size=2)
+
+    assert first.events + second.events == first.scanned + second.scanned == 7
+    assert first.orders + second.orders == 4
+
+    async with session_maker() as session:
+        rows = await session.execute(select(OrderState.order_id, OrderState.status).order_by(OrderState.order_id))
+        assert rows.all() == [("1", "created"), ("2", "shipped"), ("3", "cancelled"), ("4", "created")]
+
+
+@pytest.mark.asyncio
+async def test_rebuild_flushes_folded_states_in_bounded_batches(
+    async_engine: AsyncEngine, session_maker: async_sessionmaker[AsyncSession], monkeypatch
+):
+    async with session_maker() as session:
+        repo = SqlAlchemyOrderEventRepository(session)
+        for order_id in ("1", "2", "3", "4", "5"):
+            await repo.append_event(order_id, events.ORDER_CREATED, {"order_id": order_id})
+        await repo.append_event("1", events.ORDER_PAID, {"order_id": "1"})
+        await session.commit()
+
+    flushed: list[int] = []
+    bulk_upsert_states = SqlAlchemyOrderStateRepository.bulk_upsert_states
+
+    async def counting_bulk_upsert(self, records):
+        records = list(records)
+        flushed.append(len(records))
+        return await bulk_upsert_states(self, records)
+
+    monkeypatch.setattr(SqlAlchemyOrderStateRepository, "bulk_upsert_states", counting_bulk_upsert)
+
+    database_url = async_engine.url.render_as_string(hide_password=False)
+    stats = await rebuild_partition(database_url, chunk_size=2, flush_every=2)
+
+    assert flushed == [2, 2, 2]
+    assert stats.orders == 6
+
+    async with session_maker() as session:
+        rows = await session.execute(select(OrderState.order_id, OrderState.status).order_by(OrderState.order_id))
+        assert rows.all() == [("1", "paid"), ("2", "created"), ("3", "created"), ("4", "created"), ("5", "created")]
@@ -1,8 +1,12 @@
+from contextlib import asynccontextmanager
+
 import pytest
 
+from orders_service.application.service import OrderCommandService
 from orders_service.domain import commands, events
 from orders_service.domain.errors import OrderAlreadyExists, OrderNotFound
 from orders_service.domain.models import OrderStateRecord
+from orders_service.infrastructure.cache import ProcessedCommandsLRU
 
 
 @pytest.mark.asyncio
@@ -40,3 +44,85 @@ async def test_mark_paid_and_ship_flow(order_service, fake_uow, fake_publisher):
 
     assert fake_uow.state.items["42"].status == "shipped"
     assert fake_publisher.published[-1]["type"] == events.ORDER_SHIPPED
+
+
+@pytest.mark.asyncio
+async def test_redelivered_command_is_skipped(fake_uow_factory, fake_uow, fake_publisher):
+    processed = ProcessedCommandsLRU(max_size=10)
+    service = OrderCommandService(fake_uow_factory, fake_publisher, processed=processed)
+    create = {"type": commands.CREATE_ORDER, "order_id": "1", "command_id": "c-1"}
+    paid = {"type": commands.MARK_PAID, "order_id": "1", "command_id": "c-2"}
+
+    for command in [create, paid, create, paid]:
+        await service.handle_command(command)
+    assert [e["type"] for e in fake_publisher.published] == [events.ORDER_CREATED, events.ORDER_PAID]
+    assert len(fake_uow.events.items) == 2
+
+    # Кеш потерян (рестарт) — повтор отсеивается по таблице processed_commands,
+    # а сохраненное событие публикуется заново (at-least-once для событий).
+    restarted = OrderCommandService(fake_uow_factory, fake_publisher)
+    await restarted.handle_command(paid)
+    assert [e["type"] for e in fake_publisher.published[2:]] == [events.ORDER_PAID]
+    assert len(fake_uow.events.items) == 2
+    assert (service.duplicates, restarted.duplicates) == (2, 1)
+
+
+@pytest.mark.asyncio
+async def test_redelivery_republishes_events_lost_between_commit_and_publish(
+    fake_uow_factory, fake_uow, fake_publisher
+):
+    processed = ProcessedCommandsLRU(max_size=10)
+    publish = fake_publisher.publish_event
+
+    async def crash(*args, **kwargs):
+        raise RuntimeError("kafka down")
+
+    fake_publisher.publish_event = crash
+    service = OrderCommandService(fake_uow_factory, fake_publisher, processed=processed)
+    create = {"type": commands.CREATE_ORDER, "order_id": "1", "item": "book", "command_id": "c-1"}
+    with pytest.raises(RuntimeError):
+        await service.handle_command(create)
+    assert fake_uow.committed is True
+    assert "c-1" not in processed
+
+    fake_publisher.publish_event = publish
+    await service.handle_command(create)
+
+    assert [e["type"] for e in fake_publisher.published] == [events.ORDER_CREATED]
+    assert fake_publisher.published[0]["payload"]["item"] == "book"
+    assert len(fake_uow.events.items) == 1
+    assert "c-1" in processed
+
+
+@pytest.mark.asyncio
+async def test_handle_batch_publishes_when_close_fails_after_commit(fake_uow, fake_publisher):
+    @asynccontextmanager
+    async def failing_close_factory():
+        async with fake_uow:
+            yield fake_uow
+        raise RuntimeError("session close failed")
+
+    service = OrderCommandService(failing_close_factory, fake_publisher)
+
+    results = await service.handle_batch([{"type": commands.CREATE_ORDER, "order_id": "1"}])
+
+    # Пачка закоммичена один раз, без повтора по одной, и ее событие дошло до publisher.
+    assert results == [None]
+    assert fake_uow.committed is True
+    assert len(fake_uow.events.items) == 1
+    assert [event["type"] for event in fake_publisher.published] == [events.ORDER_CREATED]
+
+
+@pytest.mark.asyncio
+async def test_handle_command_publishes_when_close_fails_after_commit(fake_uow, fake_publisher):
+    @asynccontextmanager
+    async def failing_close_factory():
+        async with fake_uow:
+            yield fake_uow
+        raise RuntimeError("session close failed")
+
+    service = OrderCommandService(failing_close_factory, fake_publisher)
+
+    await service.handle_command({"type": commands.CREATE_ORDER, "order_id": "1"})
+
+    assert [event["type"] for event in fake_publisher.published] == [events.ORDER_CREATED]
@@ -1,13 +1,21 @@
+from datetime import UTC, datetime, timedelta
+
 import pytest
-from sqlalchemy import select
+from sqlalchemy import event, select, update
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-from orders_service.domain import events
-from orders_service.infrastructure.models import OrderEvent, OrderState
+from orders_service.application.service import OrderCommandService
+from orders_service.domain import commands, events
+from orders_service.domain.errors import OrderAlreadyExists, OrderNotFound
+from orders_service.domain.models import OrderStateRecord
+from orders_service.infrastructure.cache import LRUCache
+from orders_service.infrastructure.db import create_engine_and_sessionmaker, run_migrations
+from orders_service.infrastructure.models import OrderEvent, OrderSnapshot, OrderState, ProcessedCommand
 from orders_service.infrastructure.repositories import (
     SqlAlchemyOrderEventRepository,
     SqlAlchemyOrderStateRepository,
 )
+from orders_service.infrastructure.uow import create_uow_factory
 @pytest.mark.asyncio
 async def test_uow_commit_persists_changes(session_maker: async_sessionmaker[AsyncSession], uow_factory):
     async with uow_factory() as uow:
@@ -38,3 +46,210 @@ async def test_repositories_load_and_upsert(session_maker: async_sessionmaker[As
         assert len(loaded) == 1
         assert loaded[0].type == events.ORDER_CREATED
         assert state.status == "created"
+
+
+@pytest.mark.asyncio
+async def test_handle_batch_group_commit_isolates_failed_commands(
+    session_maker: async_sessionmaker[AsyncSession], uow_factory, fake_publisher
+):
+    service = OrderCommandService(uow_factory, fake_publisher)
+    batch = [
+        {"type": commands.CREATE_ORDER, "order_id": "1", "item": "book"},
+        {"type": commands.CREATE_ORDER, "order_id": "1", "item": "book"},
+        {"type": commands.CANCEL_ORDER, "order_id": "missing"},
+        {"type": commands.MARK_PAID, "order_id": "1", "paid_at": "t"},
+    ]
+
+    results = await service.handle_batch(batch)
+
+    assert results[0] is None
+    assert isinstance(results[1], OrderAlreadyExists)
+    assert isinstance(results[2], OrderNotFound)
+    assert results[3] is None
+    assert fake_publisher.batches == 1
+    assert [e["type"] for e in fake_publisher.published] == [events.ORDER_CREATED, events.ORDER_PAID]
+
+    async with session_maker() as session:
+        stored = await session.execute(select(OrderEvent).order_by(OrderEvent.id))
+        assert [e.type for e in stored.scalars()] == [events.ORDER_CREATED, events.ORDER_PAID]
+        assert (await session.get(OrderState, "1")).status == "paid"
+
+
+@pytest.mark.asyncio
+async def test_state_cache_is_write_through_and_invalidated_on_rollback(
+    session_maker: async_sessionmaker[AsyncSession],
+):
+    cache = LRUCache(max_size=10)
+    uow_factory = create_uow_factory(session_maker, state_cache=cache)
+
+    async with uow_factory() as uow:
+        await uow.state.upsert_state("5", "created")
+        await uow.commit()
+
+    async with uow_factory() as uow:
+        state = await uow.state.get_state("5")
+        assert state.status == "created"
+        await uow.state.upsert_state("5", "paid")
+        await uow.rollback()
+
+    assert cache.peek("5") is None
+    assert cache.hits == 1
+
+    async with uow_factory() as uow:
+        assert (await uow.state.get_state("5")).status == "created"
+    assert cache.misses == 1
+
+
+@pytest.mark.asyncio
+async def test_upsert_state_is_single_statement(async_engine, session_maker: async_sessionmaker[AsyncSession]):
+    statements = []
+
+    def listener(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", listener)
+
+    async with session_maker() as session:
+        repo = SqlAlchemyOrderStateRepository(session)
+        await repo.upsert_state("8", "created")
+        assert (await repo.get_state("8")).status == "created"
+
+        statements.clear()
+        record = await repo.upsert_state("8", "paid")
+        assert len(statements) == 1
+        assert "ON CONFLICT" in statements[0]
+        assert record.status == "paid"
+        # Объект в identity map тоже обновлен.
+        assert (await repo.get_state("8")).status == "paid"
+        await session.commit()
+
+    event.remove(async_engine.sync_engine, "before_cursor_execute", listener)
+
+
+@pytest.mark.asyncio
+async def test_bulk_upsert_states(session_maker: async_sessionmaker[AsyncSession]):
+    async with session_maker() as session:
+        repo = SqlAlchemyOrderStateRepository(session)
+        await repo.upsert_state("1", "created")
+        written = await repo.bulk_upsert_states(
+            [
+                OrderStateRecord(order_id="1", status="paid"),
+                OrderStateRecord(order_id="2", status="created"),
+                OrderStateRecord(order_id="2", status="cancelled"),
+            ]
+        )
+        await session.commit()
+
+    assert written == 2
+    async with session_maker() as session:
+        rows = await session.execute(select(OrderState.order_id, OrderState.status).order_by(OrderState.order_id))
+        assert rows.all() == [("1", "paid"), ("2", "cancelled")]
+
+
+@pytest.mark.asyncio
+async def test_load_aggregate_uses_snapshot_and_newer_events(session_maker: async_sessionmaker[AsyncSession]):
+    async with session_maker() as session:
+        repo = SqlAlchemyOrderEventRepository(session, snapshot_interval=3)
+        await repo.append_event("9", events.ORDER_CREATED, {"order_id": "9", "item": "desk", "amount": 3})
+        await repo.append_event("9", events.ORDER_PAID, {"order_id": "9"})
+        assert (await repo.load_aggregate("9")).status == "paid"
+        assert await session.get(OrderSnapshot, "9") is None
+
+        await repo.append_event("9", events.ORDER_SHIPPED, {"order_id": "9"})
+        aggregate = await repo.load_aggregate("9")
+        snapshot = await session.get(OrderSnapshot, "9")
+        assert snapshot.version == aggregate.version
+        assert snapshot.state["status"] == "shipped"
+
+        await repo.append_event("9", events.ORDER_CANCELLED, {"order_id": "9"})
+        await session.commit()
+
+    async with session_maker() as session:
+        repo = SqlAlchemyOrderEventRepository(session, snapshot_interval=3)
+        aggregate = await repo.load_aggregate("9")
+        assert aggregate.status == "cancelled"
+        assert aggregate.item == "desk"
+        assert len(await repo.load_events("9", after_id=(await session.get(OrderSnapshot, "9")).version)) == 1
+
+        assert await repo.load_aggregate("unknown") is None
+
+
+@pytest.mark.asyncio
+async def test_append_event_snapshots_every_interval(session_maker: async_sessionmaker[AsyncSession]):
+    async with session_maker() as session:
+        repo = SqlAlchemyOrderEventRepository(session, snapshot_interval=2)
+        await repo.append_event("7", events.ORDER_CREATED, {"order_id": "7", "item": "desk"})
+        assert await session.get(OrderSnapshot, "7") is None
+
+        paid = await repo.append_event("7", events.ORDER_PAID, {"order_id": "7"})
+        assert (await session.get(OrderSnapshot, "7")).version == paid.id
+
+        await repo.append_event("7", events.ORDER_SHIPPED, {"order_id": "7"})
+        assert (await session.get(OrderSnapshot, "7")).version == paid.id
+        cancelled = await repo.append_event("7", events.ORDER_CANCELLED, {"order_id": "7"})
+        snapshot = await session.get(OrderSnapshot, "7")
+        assert snapshot.version == cancelled.id
+        assert snapshot.state["status"] == "cancelled"
+
+
+@pytest.mark.asyncio
+async def test_production_sqlite_profile_applies_pragmas(tmp_path):
+    engine, session_maker = create_engine_and_sessionmaker(
+        f"sqlite+aiosqlite:///{tmp_path / 'prod.db'}", profile="production"
+    )
+    try:
+        await run_migrations(engine)
+        async with engine.connect() as conn:
+            assert (await conn.exec_driver_sql("PRAGMA journal_mode")).scalar() == "wal"
+            assert (await conn.exec_driver_sql("PRAGMA synchronous")).scalar() == 1
+            assert (await conn.exec_driver_sql("PRAGMA busy_timeout")).scalar() == 5000
+
+        # Управление транзакциями для SAVEPOINT по-прежнему работает.
+        async with create_uow_factory(session_maker)() as uow:
+            async with uow.savepoint():
+                await uow.state.upsert_state("1", "created")
+            await uow.commit()
+        async with session_maker() as session:
+            assert (await session.get(OrderState, "1")).status == "created"
+    finally:
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_processed_commands_dedupe_in_batch_and_redelivery(
+    session_maker: async_sessionmaker[AsyncSession], uow_factory, fake_publisher
+):
+    service = OrderCommandService(uow_factory, fake_publisher)
+    create = {"type": commands.CREATE_ORDER, "order_id": "1", "item": "book", "command_id": "c-1"}
+    paid = {"type": commands.MARK_PAID, "order_id": "1", "paid_at": "t", "command_id": "c-2"}
+
+    assert await service.handle_batch([create, paid, paid]) == [None, None, None]
+    await service.handle_command(create)
+
+    # Повтор внутри пачки не публикуется второй раз; повтор из таблицы — публикует сохраненное событие.
+    assert service.duplicates == 2
+    assert [e["type"] for e in fake_publisher.published] == [
+        events.ORDER_CREATED,
+        events.ORDER_PAID,
+        events.ORDER_CREATED,
+    ]
+    async with session_maker() as session:
+        stored = await session.execute(select(OrderEvent.type).order_by(OrderEvent.id))
+        assert stored.scalars().all() == [events.ORDER_CREATED, events.ORDER_PAID]
+
+
+@pytest.mark.asyncio
+async def test_processed_commands_purge_drops_old_marks(
+    session_maker: async_sessionmaker[AsyncSession], uow_factory, fake_publisher
+):
+    service = OrderCommandService(uow_factory, fake_publisher)
+    await service.handle_command({"type": commands.CREATE_ORDER, "order_id": "1", "command_id": "c-1"})
+    async with session_maker() as session:
+        await session.execute(update(ProcessedCommand).values(processed_at=datetime.now(UTC) - timedelta(days=2)))
+        await session.commit()
+    await service.handle_command({"type": commands.CANCEL_ORDER, "order_id": "1", "command_id": "c-2"})
+
+    assert await service.purge_processed(ttl=24 * 3600) == 1
+    async with session_maker() as session:
+        remaining = await session.execute(select(ProcessedCommand.command_id))
+        assert remaining.scalars().all() == ["c-2"]